@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark: carga mixta con el trabajo bloqueante en el event loop vs. en los pools
+Arranca un worker de uvicorn (subproceso) por modo, con EXECUTOR_INLINE=1
+(todo en el event loop, como antes) y con los pools de executors, y lanza a
+la vez clientes "pesados" (reconstrucción FTS, sincronización en seco,
+dashboard, /batch-analyze y /query sobre el PDF más grande) y clientes
+"ligeros" (/health, /api/jobs, que no bloquean). Compara throughput y
+latencias de ambos tipos.
+
+Usa la base de datos y la carpeta de PDFs configuradas (las consultas se
+guardan en el historial y en el cache como cualquier otra).
+
+Uso:
+    python benchmark_concurrency.py [--duration 10] [--heavy 2] [--light 8] [--port 8765]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_FOLDER", "../pdfs"))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def client_loop(client: httpx.AsyncClient, requests: List[tuple], deadline: float,
+                      latencies: List[float], errors: List[int]):
+    """Repetir las peticiones en orden hasta el plazo"""
+    i = 0
+    while time.perf_counter() < deadline:
+        method, url, body = requests[i % len(requests)]
+        start = time.perf_counter()
+        response = await client.request(method, url, json=body)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        i += 1
+
+
+async def run_load(base_url: str, duration: float, heavy: int, light: int, filename: str) -> Dict[str, Dict]:
+    heavy_requests = [
+        ("POST", "/api/fts/rebuild", None),
+        ("POST", "/api/sync?dry_run=true", None),
+        ("GET", "/api/dashboard", None),
+        ("POST", f"/batch-analyze/{filename}", None),
+        # Preguntas distintas en cada vuelta no pasan por el cache
+        *[("POST", "/query", {"question": f"configuração sistema {i}", "filename": filename,
+                              "engine": "scan"}) for i in range(5)]
+    ]
+    light_requests = [("GET", "/health", None), ("GET", "/api/jobs", None)]
+
+    results = {"heavy": ([], []), "light": ([], [])}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        tasks = [client_loop(client, heavy_requests, deadline, *results["heavy"]) for _ in range(heavy)]
+        tasks += [client_loop(client, light_requests, deadline, *results["light"]) for _ in range(light)]
+        started = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        kind: {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "throughput": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0
+        }
+        for kind, (latencies, errors) in results.items()
+    }
+
+
+def start_server(port: int, inline: bool) -> subprocess.Popen:
+    """Arrancar un worker de uvicorn y esperar a que responda"""
+    env = {**os.environ, "EXECUTOR_INLINE": "1" if inline else "0", "SYNC_INTERVAL_SECONDS": "0"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", "1",
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia con carga mixta")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos por modo")
+    parser.add_argument("--heavy", type=int, default=2, help="Clientes pesados concurrentes")
+    parser.add_argument("--light", type=int, default=8, help="Clientes ligeros concurrentes")
+    parser.add_argument("--port", type=int, default=8765, help="Puerto del servidor de prueba")
+    args = parser.parse_args()
+
+    pdfs = sorted(UPLOAD_DIR.glob("*.pdf"), key=lambda p: p.stat().st_size, reverse=True)
+    if not pdfs:
+        print(f"❌ No hay PDFs en {UPLOAD_DIR}")
+        return
+    filename = pdfs[0].name
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"📄 PDF de carga pesada: {filename}")
+    print(f"👥 {args.heavy} clientes pesados, {args.light} ligeros, {args.duration:.0f}s por modo\n")
+
+    print(f"{'Modo':<14} {'Tipo':<6} {'Peticiones':>10} {'req/s':>8} {'p50':>9} {'p95':>9} {'máx':>9}")
+    for inline in (True, False):
+        server = start_server(args.port, inline)
+        try:
+            # Calentar (texto, índices, matcher compilado) fuera de la medición
+            asyncio.run(run_load(base_url, 1, 1, 1, filename))
+            stats = asyncio.run(run_load(base_url, args.duration, args.heavy, args.light, filename))
+        finally:
+            server.terminate()
+            server.wait()
+        mode = "event loop" if inline else "pools"
+        for kind in ("heavy", "light"):
+            row = stats[kind]
+            errors = f"  ({row['errors']} errores)" if row["errors"] else ""
+            print(f"{mode:<14} {kind:<6} {row['requests']:>10} {row['throughput']:>8.1f} "
+                  f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['max_ms']:>7.1f}ms{errors}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: búsqueda de palabras clave una a una vs. en una sola pasada
+Compara la implementación anterior de search_in_pages (una regex por
+palabra clave, recorriendo todas las líneas por cada una) con
+text_matcher.KeywordMatcher sobre los manuales de la carpeta de PDFs,
+y verifica que ambos den los mismos resultados.
+
+Uso:
+    python benchmark_matcher.py [--dir ../pdfs] [--repeat 5]
+"""
+import argparse
+import re
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from pdf_extractor import extract_pdf_text_by_pages
+from text_matcher import KeywordMatcher
+
+QUERIES = [
+    ["configuração", "sistema"],
+    ["typsteuerung", "variante", "bauteil", "station", "programa"],
+    ["config", "configuration", "hardware", "projeto", "software"],
+    ["sps", "hmi", "profinet", "safety", "robot"],
+]
+
+
+def legacy_search_in_pages(pages_text: Dict[int, str], keywords: List[str]) -> List[Dict]:
+    """Implementación anterior: una regex y un recorrido por palabra clave"""
+    results = []
+    for page_num, page_text in pages_text.items():
+        lines = page_text.split('\n')
+        for keyword in keywords:
+            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+            for i, line in enumerate(lines):
+                if pattern.search(line):
+                    context = ' '.join(lines[max(0, i - 1):min(len(lines), i + 2)])
+                    results.append({
+                        "keyword": keyword,
+                        "page": page_num,
+                        "line_in_page": i + 1,
+                        "context": context.strip()[:300]
+                    })
+    return results
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del matcher de palabras clave")
+    parser.add_argument("--dir", default="../pdfs", help="Carpeta de PDFs")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones (se toma la mejor)")
+    args = parser.parse_args()
+
+    print("📄 Extrayendo texto de los manuales...")
+    corpus = {}
+    for path in sorted(Path(args.dir).glob("*.pdf")):
+        corpus[path.name] = extract_pdf_text_by_pages(path)
+    total_pages = sum(len(pages) for pages in corpus.values())
+    print(f"   {len(corpus)} PDFs, {total_pages} páginas\n")
+
+    print(f"{'Palabras clave':<55} {'Anterior':>10} {'1 pasada':>10} {'Mejora':>8}")
+    for keywords in QUERIES:
+        matcher = KeywordMatcher(keywords)
+
+        for pages_text in corpus.values():
+            expected = legacy_search_in_pages(pages_text, keywords)
+            got = [{key: r[key] for key in ("keyword", "page", "line_in_page", "context")}
+                   for r in matcher.search_pages(pages_text)]
+            assert got == expected, f"Resultados distintos para {keywords}"
+
+        legacy = timed(lambda: [legacy_search_in_pages(p, keywords) for p in corpus.values()], args.repeat)
+        single = timed(lambda: [matcher.search_pages(p) for p in corpus.values()], args.repeat)
+        label = ", ".join(keywords)
+        print(f"{label[:55]:<55} {legacy * 1000:>8.1f}ms {single * 1000:>8.1f}ms {legacy / single:>7.1f}x")
+
+    print("\n✅ Resultados idénticos en todas las consultas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: resultados en JSON de texto vs. payload_codec
+Toma los resultados guardados en query_cache y query_history (en cualquiera
+de los dos formatos) y compara el formato anterior (json.dumps / json.loads
+en una columna de texto) con payload_codec en cada compresión disponible:
+bytes por resultado, latencia de codificar y decodificar, y tamaño de una
+base SQLite temporal con una fila por resultado.
+
+No modifica la base de datos. Si no hay resultados guardados se generan
+con consultas sobre los PDFs de la carpeta configurada.
+
+Uso:
+    python benchmark_payload_codec.py [--repeat 20] [--copies 10]
+"""
+import argparse
+import json
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import payload_codec
+from database import QueryHistory, SessionLocal
+from payload_codec import decode_payload, encode_payload
+
+
+def stored_results() -> List[Dict]:
+    """Resultados del caché y del historial (JSON anterior o binario)"""
+    import cache_manager
+    db = SessionLocal()
+    try:
+        results = []
+        for row in db.query(cache_manager.QueryCache.payload, cache_manager.QueryCache.cached_result):
+            stored = row.payload if row.payload is not None else row.cached_result
+            if stored:
+                results.append(decode_payload(stored))
+        for row in db.query(QueryHistory.results_payload, QueryHistory.results):
+            value = decode_payload(row.results_payload) if row.results_payload is not None else row.results
+            if value:
+                results.append(value)
+        return results
+    finally:
+        db.close()
+
+
+def generated_results() -> List[Dict]:
+    """Resultados de algunas consultas sobre los PDFs (si la BD no tiene ninguno)"""
+    import main
+    questions = ["qué es la configuración del sistema", "cómo se programa el robot",
+                 "variante de typsteuerung", "hardware profinet safety"]
+    filenames = sorted(path.name for path in main.UPLOAD_DIR.glob("*.pdf"))
+    db = SessionLocal()
+    try:
+        return [main.search_multiple_pdfs(db, question, filenames, "index") for question in questions]
+    finally:
+        db.close()
+
+
+def timed(function: Callable, values: List, repeat: int) -> float:
+    """Microsegundos por valor (mediana de `repeat` pasadas)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in values:
+            function(value)
+        samples.append((time.perf_counter() - start) / len(values) * 1e6)
+    return statistics.median(samples)
+
+
+def database_size(values: List, column_type: str) -> int:
+    """Bytes de un archivo SQLite con una fila por valor (tras VACUUM)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "payloads.db"
+        conn = sqlite3.connect(path)
+        conn.execute(f"CREATE TABLE payloads (id INTEGER PRIMARY KEY, data {column_type})")
+        conn.executemany("INSERT INTO payloads (data) VALUES (?)", [(value,) for value in values])
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        return path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON de texto vs. payload_codec")
+    parser.add_argument("--repeat", type=int, default=20, help="Pasadas por medida (se toma la mediana)")
+    parser.add_argument("--copies", type=int, default=10,
+                        help="Copias de cada resultado en la BD temporal (simula un historial mayor)")
+    args = parser.parse_args()
+
+    results = stored_results() or generated_results()
+    print(f"📦 {len(results)} resultados; orjson: {'sí' if payload_codec.orjson else 'no'}, "
+          f"zstandard: {'sí' if payload_codec.zstd else 'no'}")
+
+    legacy = [json.dumps(result) for result in results]
+    rows = [("json (anterior)", sum(len(text.encode("utf-8")) for text in legacy),
+             timed(json.dumps, results, args.repeat), timed(json.loads, legacy, args.repeat),
+             database_size(legacy * args.copies, "TEXT"))]
+
+    codecs = [codec for codec in payload_codec.CODECS if payload_codec.resolve_codec(codec) == codec]
+    for codec in codecs:
+        encoded = [encode_payload(result, codec) for result in results]
+        assert all(decode_payload(data) == json.loads(text) for data, text in zip(encoded, legacy))
+        rows.append((f"payload {codec}", sum(len(data) for data in encoded),
+                     timed(lambda result: encode_payload(result, codec), results, args.repeat),
+                     timed(decode_payload, encoded, args.repeat),
+                     database_size(encoded * args.copies, "BLOB")))
+
+    print(f"\n{'Formato':<18}{'Bytes':>10}{'Ratio':>8}{'Codificar µs':>15}{'Decodificar µs':>17}{'BD KB':>9}")
+    baseline = rows[0][1]
+    for name, size, encode_us, decode_us, db_bytes in rows:
+        print(f"{name:<18}{size:>10}{baseline / size:>8.2f}{encode_us:>15.1f}{decode_us:>17.1f}"
+              f"{db_bytes / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,61 @@
 """
 Sistema de caché inteligente para consultas frecuentes
+La clave de cada entrada sale de la pregunta según CACHE_KEY_MODE (ver
+query_analysis.py): el texto literal (raw) o su forma canónica. Cada
+entrada guarda además su forma canónica, con la que se agrupan los hits,
+y key_hit_rate_report mide sobre query_history cuánto ganaría cada modo.
+
+Dos niveles: L1 es un LRU en memoria del proceso (acotado por entradas y
+bytes) con el resultado ya deserializado; L2 es la tabla query_cache. Un
+hit en L1 no toca SQLite. Las invalidaciones de este proceso (por PDF,
+limpieza, borrado total) se aplican a los dos niveles; las de otros
+procesos solo llegan a L1 cuando la entrada supera CACHE_L1_MAX_AGE.
+
+Leer del caché no escribe en SQLite: los hits (hit_count, last_accessed)
+se acumulan en memoria y flush_hit_counters los vuelca en un solo UPDATE
+por lotes, periódicamente (CACHE_FLUSH_SECONDS) y al apagar el servidor.
+
+La clave incluye la versión (content_hash) de cada PDF consultado y la
+tabla query_cache_documents enlaza cada entrada con sus documentos:
+invalidar un PDF es una consulta por índice sobre sus propias entradas y
+no afecta a archivos cuyo nombre lo contiene.
+
+Los resultados se guardan en binario (payload, ver payload_codec.py); las
+entradas antiguas con JSON en cached_result se leen igual y se migran al
+arrancar.
+
+Los endpoints responden los hits con get_cached_response / peek_cached_response:
+cada entrada de L1 guarda su resultado ya serializado y la respuesta es una
+cabecera JSON pequeña (pregunta, marcas de caché) unida a esos bytes, sin
+volver a serializar el resultado.
 """
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List, Tuple
+from collections import OrderedDict
 import hashlib
 import json
+import os
+import threading
+import time
 from datetime import datetime, timedelta
-from database import Base, engine
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean
+from database import Base, engine, upgrade_schema, PDFDocument, QueryHistory, SessionLocal
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, LargeBinary, bindparam, func
+from payload_codec import decode_payload, dumps, encode_payload, payload_size
+import query_analysis
+
+# Clave de caché: "raw", "canonical" o "folded" (ver query_analysis.py)
+CACHE_KEY_MODE = os.getenv("CACHE_KEY_MODE", "raw").lower()
+if CACHE_KEY_MODE not in query_analysis.KEY_MODES:
+    CACHE_KEY_MODE = "raw"
+# TTL de las entradas según el tipo de búsqueda (los que usan los endpoints)
+TTL_HOURS = {"single": 24, "multiple": 12, "all": 12}
+# Caché L1 en memoria: máximo de entradas y de MB (tamaño del JSON del resultado)
+CACHE_L1_ENTRIES = int(os.getenv("CACHE_L1_ENTRIES", "256"))
+CACHE_L1_MAX_BYTES = int(float(os.getenv("CACHE_L1_MAX_MB", "32")) * 1024 * 1024)
+# Segundos que una entrada de L1 se sirve sin volver a consultar L2
+CACHE_L1_MAX_AGE = float(os.getenv("CACHE_L1_MAX_AGE", "300"))
+# Cada cuántos segundos se vuelcan los contadores de hits a SQLite (0 = solo al apagar)
+CACHE_FLUSH_SECONDS = float(os.getenv("CACHE_FLUSH_SECONDS", "30"))
 
 # ========== MODELO DE CACHÉ ==========
 
@@ -18,13 +66,15 @@ class QueryCache(Base):
     id = Column(Integer, primary_key=True, index=True)
     query_hash = Column(String(64), unique=True, index=True, nullable=False)
     
-    # Consulta original
+    # Consulta original (solo para mostrar; la clave puede ser la forma canónica)
     question = Column(Text, nullable=False)
+    canonical_key = Column(Text, index=True)  # tipo|palabras clave|búsqueda|PDFs
     pdf_files = Column(Text)  # JSON string de lista de archivos
     search_type = Column(String(50))
     
     # Resultado cacheado
-    cached_result = Column(Text, nullable=False)  # JSON string
+    cached_result = Column(Text, nullable=False, default="")  # JSON (formato anterior; vacío si hay payload)
+    payload = Column(LargeBinary)  # Resultado serializado con payload_codec
     
     # Metadata del caché
     hit_count = Column(Integer, default=0)
@@ -40,65 +90,487 @@ class QueryCache(Base):
         return f"<QueryCache(question='{self.question[:50]}...', hits={self.hit_count})>"
 
 
+class QueryCacheDocument(Base):
+    """Documentos de los que depende cada entrada de query_cache"""
+    __tablename__ = "query_cache_documents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_id = Column(Integer, index=True, nullable=False)  # Foreign key a QueryCache
+    filename = Column(String(255), index=True, nullable=False)
+    content_hash = Column(String(64))  # Versión del PDF con la que se calculó el resultado
+    
+    def __repr__(self):
+        return f"<QueryCacheDocument(cache_id={self.cache_id}, pdf='{self.filename}')>"
+
+
 # Crear tabla si no existe
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
+
+
+# ========== CACHÉ L1 (MEMORIA) ==========
+
+class _L1Entry:
+    """Resultado deserializado de una entrada de query_cache"""
+
+    def __init__(self, result: Any, pdf_files: List[str], size: int, expires_at: Optional[datetime],
+                 created_at: Optional[datetime], l2_hits: int):
+        self.result = result
+        self.pdf_files = pdf_files
+        self.size = size
+        self.expires_at = expires_at
+        self.created_at = created_at
+        self.l2_hits = l2_hits
+        self.hits = 0
+        self.loaded_at = time.monotonic()
+        self._body: Optional[bytes] = None
+
+    @property
+    def body(self) -> bytes:
+        """Resultado serializado sin los campos de RESPONSE_FIELDS, desde la primera clave
+        ('"answer":...}'; solo '}' si no queda ninguna). Se calcula en el primer hit."""
+        if self._body is None:
+            self._body = dumps({key: value for key, value in self.result.items()
+                                if key not in RESPONSE_FIELDS})[1:]
+        return self._body
+
+
+# Campos que la respuesta de un hit toma de la consulta actual y no del resultado guardado
+RESPONSE_FIELDS = {"question", "from_cache", "cache_tier", "cache_hits", "cached_at", "cached", "cache_hit"}
+
+
+_l1: "OrderedDict[str, _L1Entry]" = OrderedDict()
+_l1_bytes = 0
+_l1_lock = threading.Lock()
+_tier_stats = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0,
+               "l1_evictions": 0, "l1_invalidations": 0}
+
+
+def _l1_get(query_hash: str, count_miss: bool = True) -> Optional[_L1Entry]:
+    with _l1_lock:
+        entry = _l1.get(query_hash)
+        if entry is not None:
+            expired = entry.expires_at is not None and entry.expires_at < datetime.utcnow()
+            if expired or time.monotonic() - entry.loaded_at > CACHE_L1_MAX_AGE:
+                _l1_remove(query_hash)
+                entry = None
+        if entry is None:
+            if count_miss:
+                _tier_stats["l1_misses"] += 1
+            return None
+        _l1.move_to_end(query_hash)
+        entry.hits += 1
+        _tier_stats["l1_hits"] += 1
+        return entry
+
+
+def _l1_put(query_hash: str, entry: _L1Entry):
+    global _l1_bytes
+    if entry.size > CACHE_L1_MAX_BYTES or CACHE_L1_ENTRIES <= 0:
+        return
+    with _l1_lock:
+        _l1_remove(query_hash)
+        _l1[query_hash] = entry
+        _l1_bytes += entry.size
+        while len(_l1) > CACHE_L1_ENTRIES or _l1_bytes > CACHE_L1_MAX_BYTES:
+            _l1_remove(next(iter(_l1)))
+            _tier_stats["l1_evictions"] += 1
+
+
+def _l1_remove(query_hash: str):
+    """Quitar una entrada de L1 (con _l1_lock tomado)"""
+    global _l1_bytes
+    entry = _l1.pop(query_hash, None)
+    if entry is not None:
+        _l1_bytes -= entry.size
+
+
+def _l1_discard(predicate: Callable[[str, _L1Entry], bool]) -> int:
+    """Quitar de L1 las entradas que cumplen la condición; retorna cuántas"""
+    with _l1_lock:
+        stale = [query_hash for query_hash, entry in _l1.items() if predicate(query_hash, entry)]
+        for query_hash in stale:
+            _l1_remove(query_hash)
+        _tier_stats["l1_invalidations"] += len(stale)
+        return len(stale)
+
+
+# ========== CONTADORES DE HITS (WRITE-BEHIND) ==========
+
+# query_hash -> [hits pendientes, último acceso]
+_pending_hits: Dict[str, list] = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_stats = {"flushes": 0, "rows_updated": 0, "hits_flushed": 0, "last_flush": None}
+
+
+def _record_hit(query_hash: str) -> int:
+    """Anotar un hit en memoria; retorna los hits pendientes de esa entrada"""
+    now = datetime.utcnow()
+    with _pending_lock:
+        pending = _pending_hits.get(query_hash)
+        if pending is None:
+            pending = _pending_hits[query_hash] = [0, now]
+        pending[0] += 1
+        pending[1] = now
+        return pending[0]
+
+
+def _pending_for(query_hash: str) -> int:
+    with _pending_lock:
+        pending = _pending_hits.get(query_hash)
+        return pending[0] if pending else 0
+
+
+def flush_hit_counters(db: Optional[Session] = None) -> int:
+    """Volcar a query_cache los hits acumulados en memoria (un UPDATE por lotes)
+
+    Retorna cuántas entradas se actualizaron. Sin sesión abre una propia.
+    """
+    with _flush_lock:
+        with _pending_lock:
+            batch = dict(_pending_hits)
+            _pending_hits.clear()
+        if not batch:
+            return 0
+
+        own_session = db is None
+        db = db or SessionLocal()
+        table = QueryCache.__table__
+        try:
+            db.execute(
+                table.update()
+                .where(table.c.query_hash == bindparam("b_hash"))
+                .values(hit_count=func.coalesce(table.c.hit_count, 0) + bindparam("b_hits"),
+                        last_accessed=func.max(func.coalesce(table.c.last_accessed, bindparam("b_last")),
+                                               bindparam("b_last"))),
+                [{"b_hash": query_hash, "b_hits": hits, "b_last": last} for query_hash, (hits, last) in batch.items()]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Devolver los hits al buffer para el siguiente intento
+            with _pending_lock:
+                for query_hash, (hits, last) in batch.items():
+                    pending = _pending_hits.setdefault(query_hash, [0, last])
+                    pending[0] += hits
+                    pending[1] = max(pending[1], last)
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+        _flush_stats["flushes"] += 1
+        _flush_stats["rows_updated"] += len(batch)
+        _flush_stats["hits_flushed"] += sum(hits for hits, _ in batch.values())
+        _flush_stats["last_flush"] = datetime.utcnow().isoformat()
+        return len(batch)
+
+
+def _cached_response(entry: _L1Entry, question: str, tier: str) -> Dict:
+    # Copia del primer nivel: los endpoints agregan campos sin tocar L1
+    result = dict(entry.result) if isinstance(entry.result, dict) else entry.result
+    # Con clave canónica la entrada pudo crearla otra redacción: mostrar la pregunta actual
+    if isinstance(result, dict) and "question" in result:
+        result["question"] = question
+    return {
+        "result": result,
+        "from_cache": True,
+        "cache_tier": tier,
+        "cache_hits": entry.l2_hits + entry.hits,
+        "cached_at": entry.created_at.isoformat() if entry.created_at else None
+    }
+
+
+def l1_statistics() -> Dict:
+    """Ocupación de L1 y aciertos por nivel desde que arrancó el proceso"""
+    with _l1_lock:
+        stats = dict(_tier_stats)
+        entries, size = len(_l1), _l1_bytes
+    lookups = stats["l1_hits"] + stats["l1_misses"]
+    l2_lookups = stats["l2_hits"] + stats["l2_misses"]
+    with _pending_lock:
+        pending_entries = len(_pending_hits)
+        pending_hits = sum(hits for hits, _ in _pending_hits.values())
+    return {
+        "l1": {
+            "entries": entries,
+            "max_entries": CACHE_L1_ENTRIES,
+            "bytes": size,
+            "max_bytes": CACHE_L1_MAX_BYTES,
+            "hits": stats["l1_hits"],
+            "misses": stats["l1_misses"],
+            "hit_ratio": round(stats["l1_hits"] / lookups, 4) if lookups else 0.0,
+            "evictions": stats["l1_evictions"],
+            "invalidations": stats["l1_invalidations"]
+        },
+        "l2": {
+            "hits": stats["l2_hits"],
+            "misses": stats["l2_misses"],
+            # Sobre las consultas que llegaron a L2 (fallos de L1)
+            "hit_ratio": round(stats["l2_hits"] / l2_lookups, 4) if l2_lookups else 0.0
+        },
+        "overall_hit_ratio": round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else 0.0,
+        # Contadores de hits aún no volcados a query_cache
+        "write_behind": {
+            "pending_entries": pending_entries,
+            "pending_hits": pending_hits,
+            "flush_interval_seconds": CACHE_FLUSH_SECONDS,
+            **_flush_stats
+        }
+    }
+
+
+# ========== VERSIONES DE DOCUMENTOS ==========
+
+# filename -> (content_hash, momento de lectura); se recarga como L1 tras CACHE_L1_MAX_AGE
+_versions: Dict[str, tuple] = {}
+_versions_lock = threading.Lock()
+
+
+def _known_versions(pdf_files: Optional[list], now: float) -> Tuple[Dict[str, str], List[str]]:
+    """(versiones en memoria y vigentes, archivos que hay que leer de la BD)"""
+    versions: Dict[str, str] = {}
+    missing = []
+    with _versions_lock:
+        for filename in pdf_files or []:
+            known = _versions.get(filename)
+            if known is not None and now - known[1] < CACHE_L1_MAX_AGE:
+                versions[filename] = known[0]
+            else:
+                missing.append(filename)
+    return versions, missing
+
+
+def document_versions(db: Session, pdf_files: Optional[list]) -> Dict[str, str]:
+    """content_hash de cada PDF ("" si no está en la BD)"""
+    now = time.monotonic()
+    versions, missing = _known_versions(pdf_files, now)
+    if missing:
+        rows = db.query(PDFDocument.filename, PDFDocument.content_hash)\
+            .filter(PDFDocument.filename.in_(missing))\
+            .all()
+        found = {row.filename: row.content_hash or "" for row in rows}
+        with _versions_lock:
+            for filename in missing:
+                versions[filename] = found.get(filename, "")
+                _versions[filename] = (versions[filename], now)
+    return versions
+
+
+def _forget_version(filename: str):
+    with _versions_lock:
+        _versions.pop(filename, None)
+
+
+def _link_documents(db: Session, cache_id: int, versions: Dict[str, str]):
+    """Enlazar una entrada con sus documentos (si aún no lo está)"""
+    if db.query(QueryCacheDocument.id).filter(QueryCacheDocument.cache_id == cache_id).first():
+        return
+    db.add_all([
+        QueryCacheDocument(cache_id=cache_id, filename=filename, content_hash=content_hash or None)
+        for filename, content_hash in versions.items()
+    ])
+
+
+def backfill_cache_documents(db: Session) -> int:
+    """Enlazar con sus documentos las entradas creadas antes de query_cache_documents"""
+    linked = db.query(QueryCacheDocument.cache_id)
+    entries = db.query(QueryCache.id, QueryCache.pdf_files)\
+        .filter(QueryCache.pdf_files.isnot(None))\
+        .filter(QueryCache.id.notin_(linked))\
+        .all()
+    for entry in entries:
+        db.add_all([
+            QueryCacheDocument(cache_id=entry.id, filename=filename)
+            for filename in set(json.loads(entry.pdf_files) or [])
+        ])
+    if entries:
+        db.commit()
+        print(f"🔗 {len(entries)} entradas del caché enlazadas con sus documentos")
+    return len(entries)
+
+
+def migrate_legacy_payloads(db: Session, batch_size: int = 500) -> int:
+    """Pasar los resultados guardados como JSON en cached_result al formato binario"""
+    table = QueryCache.__table__
+    migrated = 0
+    while True:
+        rows = db.query(QueryCache.id, QueryCache.cached_result)\
+            .filter(QueryCache.payload.is_(None))\
+            .filter(QueryCache.cached_result != "")\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            break
+        db.execute(
+            table.update()
+            .where(table.c.id == bindparam("b_id"))
+            .values(payload=bindparam("b_payload"), cached_result=""),
+            [{"b_id": row.id, "b_payload": encode_payload(json.loads(row.cached_result))} for row in rows]
+        )
+        db.commit()
+        migrated += len(rows)
+    if migrated:
+        print(f"🗜️ {migrated} resultados del caché pasados a formato binario")
+    return migrated
 
 
 # ========== FUNCIONES DE CACHÉ ==========
 
-def generate_query_hash(question: str, pdf_files: Optional[list] = None, search_type: str = "single") -> str:
-    """Generar hash único para una consulta"""
-    # Normalizar pregunta
-    question_normalized = question.lower().strip()
+def generate_query_hash(question: str, pdf_files: Optional[list] = None, search_type: str = "single",
+                        variant: str = "", mode: Optional[str] = None,
+                        versions: Optional[Dict[str, str]] = None) -> str:
+    """Generar hash único para una consulta
     
-    # Ordenar PDFs para consistencia
-    pdfs_sorted = sorted(pdf_files) if pdf_files else []
-    
-    # Crear string único
-    cache_key = f"{question_normalized}|{search_type}|{','.join(pdfs_sorted)}"
+    variant distingue resultados que dependen de cómo se buscó (p. ej. el motor FTS).
+    mode: modo de clave (por defecto CACHE_KEY_MODE).
+    versions: content_hash de cada PDF (ver document_versions).
+    """
+    cache_key = query_analysis.cache_key(question, pdf_files, search_type, variant, mode or CACHE_KEY_MODE,
+                                         versions)
     
     # Generar hash SHA-256
     return hashlib.sha256(cache_key.encode()).hexdigest()
 
 
-def get_cached_result(db: Session, question: str, pdf_files: Optional[list] = None, 
-                     search_type: str = "single") -> Optional[Dict]:
-    """Obtener resultado cacheado si existe"""
-    query_hash = generate_query_hash(question, pdf_files, search_type)
+def _lookup(db: Session, query_hash: str) -> Optional[Tuple[_L1Entry, str]]:
+    """(entrada, nivel) de un hit: primero L1, luego SQLite (solo lectura)"""
+    entry = _l1_get(query_hash)
+    if entry is not None:
+        _record_hit(query_hash)
+        return entry, "l1"
     
-    cache_entry = db.query(QueryCache)\
+    # Solo las columnas necesarias, sin materializar el objeto QueryCache
+    cache_entry = db.query(QueryCache.payload, QueryCache.cached_result, QueryCache.pdf_files,
+                           QueryCache.expires_at, QueryCache.created_at, QueryCache.hit_count)\
         .filter(QueryCache.query_hash == query_hash)\
         .filter(QueryCache.is_valid == True)\
         .first()
     
     if not cache_entry:
+        _count("l2_misses")
         return None
     
-    # Verificar si expiró
+    # Verificar si expiró (clear_expired_cache la marcará como inválida)
     if cache_entry.expires_at and cache_entry.expires_at < datetime.utcnow():
-        cache_entry.is_valid = False
+        _count("l2_misses")
+        return None
+    
+    stored = cache_entry.payload if cache_entry.payload is not None else cache_entry.cached_result
+    try:
+        result = decode_payload(stored)
+    except Exception as e:
+        # Payload ilegible (p. ej. zstd sin 'zstandard' o versión desconocida): miss e invalidar
+        print(f"⚠️ Entrada del caché ilegible, se invalida: {e}")
+        _count("l2_misses")
+        db.query(QueryCache).filter(QueryCache.query_hash == query_hash)\
+            .update({QueryCache.is_valid: False}, synchronize_session=False)
         db.commit()
         return None
     
-    # Actualizar estadísticas de acceso
-    cache_entry.hit_count += 1
-    cache_entry.last_accessed = datetime.utcnow()
-    db.commit()
+    # Estadísticas de acceso: en memoria hasta el próximo flush_hit_counters
+    _count("l2_hits")
+    pending = _record_hit(query_hash)
     
-    # Retornar resultado
-    return {
-        "result": json.loads(cache_entry.cached_result),
+    entry = _L1Entry(result, json.loads(cache_entry.pdf_files or "[]"),
+                     payload_size(stored), cache_entry.expires_at, cache_entry.created_at,
+                     (cache_entry.hit_count or 0) + pending)
+    _l1_put(query_hash, entry)
+    return entry, "l2"
+
+
+def get_cached_result(db: Session, question: str, pdf_files: Optional[list] = None, 
+                     search_type: str = "single", variant: str = "") -> Optional[Dict]:
+    """Obtener resultado cacheado si existe (primero en L1, luego en SQLite; solo lectura)"""
+    query_hash = generate_query_hash(question, pdf_files, search_type, variant,
+                                     versions=document_versions(db, pdf_files))
+    hit = _lookup(db, query_hash)
+    return _cached_response(hit[0], question, hit[1]) if hit else None
+
+
+def has_cached_result(db: Session, question: str, pdf_files: Optional[list] = None,
+                      search_type: str = "single", variant: str = "") -> bool:
+    """Si la consulta tiene una entrada vigente (sin contarlo como hit)"""
+    query_hash = generate_query_hash(question, pdf_files, search_type, variant,
+                                     versions=document_versions(db, pdf_files))
+    if _l1_get(query_hash, count_miss=False) is not None:
+        return True
+    return db.query(QueryCache.id)\
+        .filter(QueryCache.query_hash == query_hash)\
+        .filter(QueryCache.is_valid == True)\
+        .filter((QueryCache.expires_at.is_(None)) | (QueryCache.expires_at >= datetime.utcnow()))\
+        .first() is not None
+
+
+def _response_bytes(entry: _L1Entry, question: str, tier: str) -> Tuple[bytes, Dict]:
+    """Cuerpo JSON de la respuesta de un hit: cabecera con los campos de la
+    consulta actual + el resultado ya serializado de la entrada"""
+    if not isinstance(entry.result, dict):
+        return dumps(entry.result), {}
+    header = {
         "from_cache": True,
-        "cache_hits": cache_entry.hit_count,
-        "cached_at": cache_entry.created_at.isoformat()
+        "cached": True,
+        "cache_hit": True,
+        "cache_tier": tier,
+        "cache_hits": entry.l2_hits + entry.hits,
+        "cached_at": entry.created_at.isoformat() if entry.created_at else None
     }
+    # Con clave canónica la entrada pudo crearla otra redacción: mostrar la pregunta actual
+    if "question" in entry.result:
+        header["question"] = question
+    body = entry.body
+    header_bytes = dumps(header)
+    if body == b"}":
+        return header_bytes, entry.result
+    return header_bytes[:-1] + b"," + body, entry.result
+
+
+def get_cached_response(db: Session, question: str, pdf_files: Optional[list] = None,
+                        search_type: str = "single", variant: str = "") -> Optional[Tuple[bytes, Dict]]:
+    """Respuesta ya serializada de un hit: (bytes JSON, resultado guardado)
+    
+    El resultado es el de L1 (compartido): solo para leerlo.
+    """
+    query_hash = generate_query_hash(question, pdf_files, search_type, variant,
+                                     versions=document_versions(db, pdf_files))
+    hit = _lookup(db, query_hash)
+    return _response_bytes(hit[0], question, hit[1]) if hit else None
+
+
+def peek_cached_response(question: str, pdf_files: Optional[list] = None, search_type: str = "single",
+                         variant: str = "") -> Optional[Tuple[bytes, Dict]]:
+    """Como get_cached_response pero solo en memoria (L1 y versiones ya conocidas)
+    
+    No toca la BD, así que puede llamarse desde el event loop. None no
+    significa miss: hay que seguir con get_cached_response.
+    """
+    versions, missing = _known_versions(pdf_files, time.monotonic())
+    if missing:
+        return None
+    query_hash = generate_query_hash(question, pdf_files, search_type, variant, versions=versions)
+    entry = _l1_get(query_hash, count_miss=False)
+    if entry is None:
+        return None
+    _record_hit(query_hash)
+    return _response_bytes(entry, question, "l1")
+
+
+def _count(stat: str):
+    with _l1_lock:
+        _tier_stats[stat] += 1
 
 
 def cache_query_result(db: Session, question: str, pdf_files: Optional[list] = None,
                       search_type: str = "single", result: Optional[Dict] = None,
-                      execution_time: float = 0.0, ttl_hours: int = 24) -> QueryCache:
-    """Cachear resultado de una consulta"""
-    query_hash = generate_query_hash(question, pdf_files, search_type)
+                      execution_time: float = 0.0, ttl_hours: int = 24,
+                      variant: str = "") -> QueryCache:
+    """Cachear resultado de una consulta (en SQLite y en L1)"""
+    versions = document_versions(db, pdf_files)
+    query_hash = generate_query_hash(question, pdf_files, search_type, variant, versions=versions)
+    canonical_key = query_analysis.cache_key(question, pdf_files, search_type, variant, "canonical")
+    payload = encode_payload(result)
+    expires_at = datetime.utcnow() + timedelta(hours=ttl_hours)
     
     # Verificar si ya existe
     existing = db.query(QueryCache)\
@@ -107,43 +579,71 @@ def cache_query_result(db: Session, question: str, pdf_files: Optional[list] = N
     
     if existing:
         # Actualizar existente
-        existing.cached_result = json.dumps(result)
+        existing.cached_result = ""
+        existing.payload = payload
+        existing.canonical_key = canonical_key
         existing.last_accessed = datetime.utcnow()
         existing.execution_time_saved = execution_time
         existing.is_valid = True
-        existing.expires_at = datetime.utcnow() + timedelta(hours=ttl_hours)
+        existing.expires_at = expires_at
+        _link_documents(db, existing.id, versions)
         db.commit()
         db.refresh(existing)
+        _l1_put(query_hash, _L1Entry(decode_payload(payload), pdf_files or [], payload_size(payload),
+                                     expires_at, existing.created_at,
+                                     (existing.hit_count or 0) + _pending_for(query_hash)))
         return existing
     
     # Crear nuevo
     cache_entry = QueryCache(
         query_hash=query_hash,
         question=question,
+        canonical_key=canonical_key,
         pdf_files=json.dumps(pdf_files) if pdf_files else None,
         search_type=search_type,
-        cached_result=json.dumps(result),
+        cached_result="",
+        payload=payload,
         execution_time_saved=execution_time,
-        expires_at=datetime.utcnow() + timedelta(hours=ttl_hours)
+        expires_at=expires_at
     )
     
     db.add(cache_entry)
+    db.flush()
+    _link_documents(db, cache_entry.id, versions)
     db.commit()
     db.refresh(cache_entry)
+    _l1_put(query_hash, _L1Entry(decode_payload(payload), pdf_files or [], payload_size(payload),
+                                 expires_at, cache_entry.created_at, 0))
     return cache_entry
 
 
-def invalidate_cache_for_pdf(db: Session, filename: str):
-    """Invalidar caché de consultas que involucran un PDF específico"""
-    cache_entries = db.query(QueryCache)\
-        .filter(QueryCache.pdf_files.contains(filename))\
-        .all()
+def invalidate_cache_for_pdf(db: Session, filename: str) -> int:
+    """Invalidar caché de consultas que involucran un PDF específico
     
-    for entry in cache_entries:
-        entry.is_valid = False
+    Solo toca las entradas enlazadas con ese archivo (índice de
+    query_cache_documents); retorna cuántas seguían válidas.
+    """
+    _forget_version(filename)
+    cache_ids = db.query(QueryCacheDocument.cache_id)\
+        .filter(QueryCacheDocument.filename == filename)
+    invalidated = db.query(QueryCache)\
+        .filter(QueryCache.id.in_(cache_ids))\
+        .filter(QueryCache.is_valid == True)\
+        .update({QueryCache.is_valid: False}, synchronize_session=False)
     
     db.commit()
-    return len(cache_entries)
+    _l1_discard(lambda _, entry: filename in entry.pdf_files)
+    return invalidated
+
+
+def invalidate_all_cache(db: Session) -> int:
+    """Marcar todo el cache como inválido (ambos niveles); retorna las entradas afectadas"""
+    all_cache = db.query(QueryCache).all()
+    for entry in all_cache:
+        entry.is_valid = False
+    db.commit()
+    _l1_discard(lambda query_hash, entry: True)
+    return len(all_cache)
 
 
 def clear_expired_cache(db: Session) -> int:
@@ -158,20 +658,22 @@ def clear_expired_cache(db: Session) -> int:
         entry.is_valid = False
     
     db.commit()
+    _l1_discard(lambda _, entry: entry.expires_at is not None and entry.expires_at < now)
     return len(expired)
 
 
 def get_cache_statistics(db: Session) -> Dict:
     """Obtener estadísticas del caché"""
+    flush_hit_counters(db)
     total_entries = db.query(QueryCache).count()
     active_entries = db.query(QueryCache).filter(QueryCache.is_valid == True).count()
     
     total_hits = db.query(QueryCache).with_entities(
-        db.func.sum(QueryCache.hit_count)
+        func.sum(QueryCache.hit_count)
     ).scalar() or 0
     
     total_time_saved = db.query(QueryCache).with_entities(
-        db.func.sum(QueryCache.execution_time_saved * QueryCache.hit_count)
+        func.sum(QueryCache.execution_time_saved * QueryCache.hit_count)
     ).scalar() or 0.0
     
     # Top consultas cacheadas
@@ -195,12 +697,82 @@ def get_cache_statistics(db: Session) -> Dict:
                 "time_saved": round(entry.execution_time_saved * entry.hit_count, 2)
             }
             for entry in top_cached
+        ],
+        # Aciertos por nivel (L1 en memoria de este proceso, L2 en SQLite)
+        "tiers": l1_statistics()
+    }
+
+
+def key_hit_rate_report(db: Session, days: int = 0, max_examples: int = 10) -> Dict:
+    """Hit rate que habría tenido el caché con cada modo de clave sobre query_history
+    
+    Reproduce el historial en orden con los TTL de los endpoints. No tiene en
+    cuenta las invalidaciones por cambios en los PDFs ni el motor de
+    búsqueda (el historial no los guarda), así que es una estimación.
+    """
+    query = db.query(QueryHistory.question, QueryHistory.pdf_filename, QueryHistory.multiple_pdfs,
+                     QueryHistory.search_type, QueryHistory.query_date)
+    if days > 0:
+        query = query.filter(QueryHistory.query_date >= datetime.utcnow() - timedelta(days=days))
+    rows = query.order_by(QueryHistory.query_date, QueryHistory.id).all()
+    
+    modes = {}
+    examples = []
+    for mode in query_analysis.KEY_MODES:
+        expires: Dict[str, datetime] = {}
+        first_question: Dict[str, str] = {}
+        hits = 0
+        for row in rows:
+            search_type = row.search_type or "single"
+            pdf_files = row.multiple_pdfs or ([row.pdf_filename] if row.pdf_filename else [])
+            key = query_analysis.cache_key(row.question, pdf_files, search_type, mode=mode)
+            asked_at = row.query_date or datetime.utcnow()
+            if key in expires and asked_at < expires[key]:
+                hits += 1
+                # Aciertos que la clave literal no habría dado
+                served_by = first_question[key]
+                if mode == "canonical" and served_by.lower().strip() != row.question.lower().strip() \
+                        and len(examples) < max_examples:
+                    examples.append({"question": row.question.strip(), "served_by": served_by.strip()})
+            else:
+                expires[key] = asked_at + timedelta(hours=TTL_HOURS.get(search_type, 24))
+                first_question[key] = row.question
+        modes[mode] = {
+            "hits": hits,
+            "hit_rate": round(hits / len(rows), 4) if rows else 0.0,
+            "distinct_keys": len(expires)
+        }
+    
+    # Hits del caché actual agrupados por clave canónica (varias entradas = redacciones distintas)
+    flush_hit_counters(db)
+    by_canonical = db.query(QueryCache.canonical_key, func.count(QueryCache.id), func.sum(QueryCache.hit_count))\
+        .filter(QueryCache.canonical_key.isnot(None))\
+        .group_by(QueryCache.canonical_key)\
+        .order_by(func.sum(QueryCache.hit_count).desc())\
+        .limit(10)\
+        .all()
+    
+    return {
+        "key_mode": CACHE_KEY_MODE,
+        "queries": len(rows),
+        "modes": modes,
+        "gain": {
+            mode: round(modes[mode]["hit_rate"] - modes["raw"]["hit_rate"], 4)
+            for mode in query_analysis.KEY_MODES if mode != "raw"
+        },
+        "examples": examples,
+        "top_canonical_keys": [
+            {"key": key, "entries": entries, "hits": int(hits or 0)}
+            for key, entries, hits in by_canonical
         ]
     }
 
 
 def smart_cache_cleanup(db: Session, max_entries: int = 1000, min_hits: int = 2) -> Dict:
     """Limpieza inteligente del caché"""
+    # Los hits pendientes cuentan para decidir qué entradas se quedan
+    flush_hit_counters(db)
+    
     # Eliminar expirados
     expired_count = clear_expired_cache(db)
     
@@ -217,11 +789,17 @@ def smart_cache_cleanup(db: Session, max_entries: int = 1000, min_hits: int = 2)
             .limit(total_count - max_entries)\
             .all()
         
+        deleted_hashes = {entry.query_hash for entry in low_hit_entries}
+        deleted_ids = [entry.id for entry in low_hit_entries]
         for entry in low_hit_entries:
             db.delete(entry)
+        db.query(QueryCacheDocument)\
+            .filter(QueryCacheDocument.cache_id.in_(deleted_ids))\
+            .delete(synchronize_session=False)
         
         deleted_low_hits = len(low_hit_entries)
         db.commit()
+        _l1_discard(lambda query_hash, _: query_hash in deleted_hashes)
     
     return {
         "expired_deleted": expired_count,
@@ -0,0 +1,273 @@
+"""
+Precalentamiento del caché de consultas
+Tras un reinicio, un /api/cache/clear o la ingesta de un PDF, las
+preguntas frecuentes serían misses que vuelven a leer los PDFs. Un run de
+precalentamiento toma de query_history las CACHE_WARM_QUERIES preguntas
+más frecuentes (y, a igualdad, más recientes) de cada documento y tipo de
+búsqueda (single por PDF, multiple por conjunto de PDFs, all) y las
+calcula en segundo plano con el motor por defecto, sin registrarlas en el
+historial ni en las estadísticas. Las que ya están en el caché se omiten.
+
+Los runs se ejecutan de uno en uno; cada run busca como mucho
+CACHE_WARM_WORKERS preguntas a la vez. Si ya hay un run en cola, los
+nuevos pedidos se unen a él. Estado en /api/cache/warmup.
+
+main.py registra con configure() las funciones que calculan y cachean
+una consulta (las mismas que usan los endpoints).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import uuid
+import os
+
+from database import QueryHistory, SessionLocal
+import cache_manager as cache
+import query_engine
+
+# Preguntas por documento y tipo de búsqueda (0 = desactivado)
+CACHE_WARM_QUERIES = int(os.getenv("CACHE_WARM_QUERIES", "10"))
+# Días de historial que se tienen en cuenta
+CACHE_WARM_DAYS = int(os.getenv("CACHE_WARM_DAYS", "30"))
+# Preguntas que se calculan a la vez dentro de un run
+CACHE_WARM_WORKERS = int(os.getenv("CACHE_WARM_WORKERS", "1"))
+# Runs terminados que se conservan para consulta
+WARM_HISTORY_LIMIT = 20
+
+
+# ========== MODELO DE RUN ==========
+
+class WarmupRun:
+    """Estado de un run de precalentamiento"""
+
+    def __init__(self, reason: str, filenames: Optional[Iterable[str]] = None):
+        self.id = uuid.uuid4().hex
+        self.reasons = [reason]
+        # None = todas las consultas; si no, solo las que involucran estos PDFs
+        self.filenames = set(filenames) if filenames is not None else None
+        self.status = "queued"  # queued, running, completed, failed
+        self.error: Optional[str] = None
+        self.candidates = 0
+        self.warmed = 0
+        self.already_cached = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def count(self, field: str, error: Optional[Dict] = None):
+        """Sumar una consulta a un contador (los workers del run terminan a la vez)"""
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if error is not None and len(self.errors) < 10:
+                self.errors.append(error)
+
+    def merge(self, reason: str, filenames: Optional[Iterable[str]] = None):
+        """Unir otro pedido a este run (aún en cola)"""
+        self.reasons.append(reason)
+        if self.filenames is not None:
+            self.filenames = self.filenames | set(filenames) if filenames is not None else None
+
+    def to_dict(self) -> Dict:
+        duration = None
+        if self.started_at:
+            duration = round(((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds(), 3)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "reasons": self.reasons,
+            "filenames": sorted(self.filenames) if self.filenames is not None else None,
+            "candidates": self.candidates,
+            "warmed": self.warmed,
+            "already_cached": self.already_cached,
+            "failed": self.failed,
+            "errors": self.errors,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration": duration
+        }
+
+
+# ========== SELECCIÓN DE CONSULTAS ==========
+
+def select_queries(db, upload_dir: Path, filenames: Optional[set] = None,
+                   limit: int = CACHE_WARM_QUERIES, days: int = CACHE_WARM_DAYS) -> List[Tuple[str, List[str], str]]:
+    """Consultas a precalentar: [(pregunta, PDFs, tipo de búsqueda)]
+
+    Las top `limit` por documento (o conjunto de PDFs) y tipo de búsqueda,
+    ordenadas por frecuencia y recencia. Se descartan las de PDFs que ya no
+    existen; las de tipo all usan los PDFs actuales de la carpeta.
+    """
+    query = db.query(QueryHistory.question, QueryHistory.search_type, QueryHistory.pdf_filename,
+                     QueryHistory.multiple_pdfs, QueryHistory.query_date)
+    if days > 0:
+        query = query.filter(QueryHistory.query_date >= datetime.utcnow() - timedelta(days=days))
+
+    available = sorted(path.name for path in upload_dir.glob("*.pdf"))
+    existing = set(available)
+
+    # (tipo, PDFs) -> pregunta normalizada -> [veces, última fecha, pregunta más reciente]
+    groups: Dict[Tuple[str, Tuple[str, ...]], Dict[str, list]] = {}
+    for row in query:
+        search_type = row.search_type or "single"
+        if search_type == "all":
+            target: Tuple[str, ...] = ()
+        elif search_type == "multiple":
+            target = tuple(sorted(set(row.multiple_pdfs or [])))
+        else:
+            target = (row.pdf_filename,) if row.pdf_filename else ()
+            if not target:
+                continue
+        if not set(target) <= existing:
+            continue
+        if filenames is not None and search_type != "all" and not filenames & set(target):
+            continue
+
+        asked_at = row.query_date or datetime.min
+        questions = groups.setdefault((search_type, target), {})
+        stats = questions.get(row.question.lower().strip())
+        if stats is None:
+            questions[row.question.lower().strip()] = [1, asked_at, row.question]
+        else:
+            stats[0] += 1
+            if asked_at >= stats[1]:
+                stats[1], stats[2] = asked_at, row.question
+
+    selected = []
+    for (search_type, target), questions in groups.items():
+        if search_type == "all" and not available:
+            continue
+        pdf_files = available if search_type == "all" else list(target)
+        top = sorted(questions.values(), key=lambda stats: (stats[0], stats[1]), reverse=True)[:limit]
+        selected.extend((question, pdf_files, search_type) for _, _, question in top)
+    return selected
+
+
+# ========== EJECUCIÓN ==========
+
+_runs: "OrderedDict[str, WarmupRun]" = OrderedDict()
+_runs_lock = threading.Lock()
+_pending: Optional[WarmupRun] = None
+_coordinator: Optional[ThreadPoolExecutor] = None
+_workers: Optional[ThreadPoolExecutor] = None
+_upload_dir: Optional[Path] = None
+_warm_single: Optional[Callable] = None
+_warm_multiple: Optional[Callable] = None
+
+
+def configure(upload_dir: Path, warm_single: Callable, warm_multiple: Callable):
+    """Registrar la carpeta de PDFs y las funciones que calculan y cachean una consulta
+
+    warm_single(db, pregunta, archivo, motor)
+    warm_multiple(db, pregunta, archivos, tipo de búsqueda, motor)
+    """
+    global _upload_dir, _warm_single, _warm_multiple
+    _upload_dir, _warm_single, _warm_multiple = Path(upload_dir), warm_single, warm_multiple
+
+
+def schedule(reason: str, filenames: Optional[Iterable[str]] = None) -> Optional[WarmupRun]:
+    """Encolar un run (o unirse al que está en cola); None si está desactivado"""
+    global _pending, _coordinator
+    if CACHE_WARM_QUERIES <= 0 or _warm_single is None:
+        return None
+    with _runs_lock:
+        if _pending is not None:
+            _pending.merge(reason, filenames)
+            return _pending
+        run = _pending = WarmupRun(reason, filenames)
+        _runs[run.id] = run
+        while len(_runs) > WARM_HISTORY_LIMIT and next(iter(_runs.values())).status in ("completed", "failed"):
+            _runs.popitem(last=False)
+        if _coordinator is None:
+            _coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-warm")
+        _coordinator.submit(_run, run)
+    return run
+
+
+def _workers_pool() -> ThreadPoolExecutor:
+    global _workers
+    with _runs_lock:
+        if _workers is None:
+            _workers = ThreadPoolExecutor(max_workers=max(1, CACHE_WARM_WORKERS),
+                                          thread_name_prefix="cache-warm-query")
+        return _workers
+
+
+def _warm_query(run: WarmupRun, engine: str, question: str, pdf_files: List[str], search_type: str):
+    """Calcular y cachear una consulta si no está ya en el caché (sesión propia)"""
+    db = SessionLocal()
+    try:
+        if cache.has_cached_result(db, question, pdf_files, search_type,
+                                   variant=query_engine.cache_variant(engine)):
+            run.count("already_cached")
+            return
+        if search_type == "single":
+            _warm_single(db, question, pdf_files[0], engine)
+        else:
+            _warm_multiple(db, question, pdf_files, search_type, engine)
+        run.count("warmed")
+    except Exception as e:
+        db.rollback()
+        run.count("failed", {"question": question, "search_type": search_type, "error": str(e)})
+    finally:
+        db.close()
+
+
+def _run(run: WarmupRun):
+    """Ejecutar un run (en el thread coordinador)"""
+    global _pending
+    with _runs_lock:
+        if _pending is run:
+            _pending = None
+    run.status = "running"
+    run.started_at = datetime.utcnow()
+    try:
+        engine = query_engine.resolve_engine(None)
+        db = SessionLocal()
+        try:
+            queries = select_queries(db, _upload_dir, run.filenames)
+        finally:
+            db.close()
+        run.candidates = len(queries)
+        futures = [_workers_pool().submit(_warm_query, run, engine, *query) for query in queries]
+        for future in futures:
+            future.result()
+        run.status = "completed"
+        if run.warmed:
+            print(f"🔥 Caché precalentado: {run.warmed} consultas ({', '.join(run.reasons)})")
+    except Exception as e:
+        run.status = "failed"
+        run.error = str(e)
+        print(f"⚠️ Error precalentando el caché: {e}")
+    finally:
+        run.finished_at = datetime.utcnow()
+
+
+def status(limit: int = 10) -> Dict:
+    """Configuración y runs más recientes (primero el último)"""
+    with _runs_lock:
+        runs = list(reversed(_runs.values()))[:limit]
+    return {
+        "enabled": CACHE_WARM_QUERIES > 0 and _warm_single is not None,
+        "queries_per_group": CACHE_WARM_QUERIES,
+        "history_days": CACHE_WARM_DAYS,
+        "workers": CACHE_WARM_WORKERS,
+        "runs": [run.to_dict() for run in runs]
+    }
+
+
+def shutdown_warmer():
+    """Detener los pools de precalentamiento (al apagar el servidor)"""
+    global _coordinator, _workers, _pending
+    with _runs_lock:
+        for pool in (_coordinator, _workers):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        _coordinator = _workers = _pending = None
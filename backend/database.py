@@ -1,9 +1,9 @@
 """
 Configuración de base de datos SQLite con SQLAlchemy
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, JSON, Boolean
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Text, DateTime, Float, JSON, Boolean, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred
 from datetime import datetime
 import os
 from pathlib import Path
@@ -36,6 +36,9 @@ class PDFDocument(Base):
     original_filename = Column(String(255))
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer)  # En bytes
+    file_mtime = Column(Float)  # mtime del archivo cuando se extrajo el texto
+    content_hash = Column(String(64), index=True)  # SHA-256 del contenido
+    canonical_id = Column(Integer, index=True)  # Si es un duplicado: id del PDF que guarda el texto
     total_pages = Column(Integer)
     
     # Metadata
@@ -48,9 +51,10 @@ class PDFDocument(Base):
     category = Column(String(100))
     description = Column(Text)
     
-    # Índice de contenido (texto extraído completo)
-    full_text = Column(Text)
-    text_by_pages = Column(JSON)  # Dict {page_num: text}
+    # Columnas antiguas de texto: el texto vive ahora en pdf_pages (page_store.py)
+    # y se vacían al migrar. Diferidas para no cargarlas con el registro.
+    full_text = deferred(Column(Text))
+    text_by_pages = deferred(Column(JSON))  # Dict {page_num: text}
     
     # Estadísticas
     word_count = Column(Integer)
@@ -58,12 +62,30 @@ class PDFDocument(Base):
     
     # Flags
     is_indexed = Column(Boolean, default=False)
+    search_indexed = Column(Boolean, default=False)  # Tiene entradas en search_index
     is_searchable = Column(Boolean, default=True)
     
     def __repr__(self):
         return f"<PDFDocument(id={self.id}, filename='{self.filename}')>"
 
 
+class PDFPage(Base):
+    """Modelo para el texto comprimido de una página de un PDF"""
+    __tablename__ = "pdf_pages"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    pdf_id = Column(Integer, primary_key=True)  # PDFDocument.id (del PDF canónico)
+    page_number = Column(Integer, primary_key=True)
+    codec = Column(String(10), nullable=False)  # "zstd", "zlib" o "raw"
+    char_count = Column(Integer)  # Longitud del texto sin comprimir
+    term_count = Column(Integer)  # Palabras indexadas de la página (longitud para BM25)
+    line_starts = Column(LargeBinary)  # Inicio de cada línea (uint32, ver line_index.py)
+    data = Column(LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f"<PDFPage(pdf_id={self.pdf_id}, page={self.page_number})>"
+
+
 class QueryHistory(Base):
     """Modelo para almacenar historial de consultas"""
     __tablename__ = "query_history"
@@ -84,7 +106,8 @@ class QueryHistory(Base):
     
     # Respuesta
     answer = Column(Text)
-    results = Column(JSON)  # Resultados completos
+    results = Column(JSON)  # Resultados completos (formato anterior)
+    results_payload = deferred(Column(LargeBinary))  # Resultados completos (payload_codec)
     
     # Timestamp
     query_date = Column(DateTime, default=datetime.utcnow)
@@ -108,6 +131,7 @@ class SearchIndex(Base):
     
     # Ubicaciones
     page_numbers = Column(JSON)  # Lista de páginas donde aparece
+    page_counts = Column(JSON)  # Apariciones en cada página (paralela a page_numbers)
     occurrences = Column(Integer)  # Número de veces que aparece
     contexts = Column(JSON)  # Primeros 3 contextos
     
@@ -158,9 +182,30 @@ def get_db():
         db.close()
 
 
+def upgrade_schema():
+    """Agregar columnas e índices nuevos a tablas ya existentes
+    
+    create_all() solo crea tablas que no existen; en SQLite las columnas
+    nuevas de los modelos se agregan con ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def init_db():
     """Inicializar base de datos (crear tablas)"""
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
     print(f"✅ Base de datos inicializada en: {DB_PATH.absolute()}")
 
 
@@ -2,31 +2,38 @@
 Servicios de base de datos - CRUD operations
 """
 from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, null
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
 
-from database import PDFDocument, QueryHistory, SearchIndex, UsageStatistics
+from database import PDFDocument, PDFPage, QueryHistory, SearchIndex, UsageStatistics
+import page_store
+from payload_codec import encode_payload
 
 
 # ========== PDF DOCUMENTS ==========
 
 def create_pdf_document(db: Session, filename: str, file_path: str, file_size: int, 
-                        total_pages: int, full_text: str = "", text_by_pages: Optional[dict] = None) -> PDFDocument:
-    """Crear nuevo registro de PDF"""
+                        total_pages: int, full_text: str = "", text_by_pages: Optional[dict] = None,
+                        file_mtime: Optional[float] = None, content_hash: Optional[str] = None) -> PDFDocument:
+    """Crear nuevo registro de PDF (el texto por páginas va al almacén de páginas)"""
     pdf_doc = PDFDocument(
         filename=filename,
         original_filename=filename,
         file_path=str(file_path),
         file_size=file_size,
+        file_mtime=file_mtime,
+        content_hash=content_hash,
         total_pages=total_pages,
-        full_text=full_text,
-        text_by_pages=text_by_pages or {},
         word_count=len(full_text.split()) if full_text else 0,
         unique_words=len(set(full_text.lower().split())) if full_text else 0
     )
     db.add(pdf_doc)
+    db.flush()
+    if text_by_pages:
+        page_store.save_pages(db, pdf_doc.id, text_by_pages, commit=False)
     db.commit()
     db.refresh(pdf_doc)
     return pdf_doc
@@ -51,18 +58,117 @@ def update_pdf_access(db: Session, filename: str):
         db.commit()
 
 
-def update_pdf_text(db: Session, filename: str, full_text: str, text_by_pages: dict):
+def update_pdf_text(db: Session, filename: str, full_text: str, text_by_pages: dict,
+                    file_size: Optional[int] = None, file_mtime: Optional[float] = None,
+                    content_hash: Optional[str] = None):
     """Actualizar texto extraído del PDF"""
     pdf = get_pdf_by_filename(db, filename)
     if pdf:
-        pdf.full_text = full_text
-        pdf.text_by_pages = text_by_pages
+        page_store.save_pages(db, pdf.id, text_by_pages, commit=False)
+        # El índice de palabras ya no corresponde al texto nuevo
+        db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id).delete(synchronize_session=False)
+        pdf.search_indexed = False
+        pdf.full_text = None
+        pdf.text_by_pages = None
+        pdf.total_pages = len(text_by_pages)
+        if file_size is not None:
+            pdf.file_size = file_size
+        if file_mtime is not None:
+            pdf.file_mtime = file_mtime
+        if content_hash is not None:
+            pdf.content_hash = content_hash
+        # El registro pasa a guardar su propio texto (deja de ser alias)
+        pdf.canonical_id = None
         pdf.word_count = len(full_text.split())
         pdf.unique_words = len(set(full_text.lower().split()))
         pdf.is_indexed = True
         db.commit()
 
 
+def update_file_signature(db: Session, pdf: PDFDocument, file_size: int, file_mtime: float):
+    """Registrar tamaño y mtime actuales del archivo (mismo contenido re-subido)"""
+    pdf.file_size = file_size
+    pdf.file_mtime = file_mtime
+    db.commit()
+
+
+# ========== DEDUPLICACIÓN POR CONTENIDO ==========
+
+def get_pdf_by_content_hash(db: Session, content_hash: str) -> Optional[PDFDocument]:
+    """Obtener el PDF canónico (el que guarda el texto) con ese contenido"""
+    return db.query(PDFDocument)\
+        .filter(PDFDocument.content_hash == content_hash)\
+        .filter(PDFDocument.canonical_id.is_(None))\
+        .first()
+
+
+def get_pdf_aliases(db: Session, pdf_id: int) -> List[PDFDocument]:
+    """Obtener los duplicados (alias) de un PDF canónico"""
+    return db.query(PDFDocument)\
+        .filter(PDFDocument.canonical_id == pdf_id)\
+        .order_by(PDFDocument.id)\
+        .all()
+
+
+def make_pdf_alias(db: Session, canonical: PDFDocument, filename: str, file_path: str,
+                   file_size: int, file_mtime: Optional[float] = None) -> PDFDocument:
+    """Registrar un nombre de archivo como alias de un PDF con el mismo contenido
+    
+    El alias no guarda texto propio: reutiliza el texto, índices y
+    estadísticas del PDF canónico.
+    """
+    pdf = get_pdf_by_filename(db, filename)
+    if not pdf:
+        pdf = PDFDocument(filename=filename, original_filename=filename)
+        db.add(pdf)
+
+    pdf.file_path = str(file_path)
+    pdf.file_size = file_size
+    pdf.file_mtime = file_mtime
+    pdf.content_hash = canonical.content_hash
+    pdf.canonical_id = canonical.id
+    pdf.total_pages = canonical.total_pages
+    pdf.word_count = canonical.word_count
+    pdf.unique_words = canonical.unique_words
+    pdf.is_indexed = canonical.is_indexed
+    pdf.search_indexed = False
+    if pdf.id is not None:
+        page_store.delete_pages(db, pdf.id, commit=False)
+        db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id).delete(synchronize_session=False)
+    db.commit()
+    db.refresh(pdf)
+    return pdf
+
+
+def promote_pdf_alias(db: Session, pdf: PDFDocument) -> Optional[PDFDocument]:
+    """Traspasar el texto de un PDF canónico a su primer alias
+    
+    Se usa antes de eliminar o cambiar el contenido del canónico para que
+    los alias conserven su texto. Retorna el nuevo canónico (o None).
+    """
+    aliases = get_pdf_aliases(db, pdf.id)
+    if not aliases:
+        return None
+
+    if not page_store.has_pages(db, pdf.id):
+        page_store.migrate_document(db, pdf.id)
+
+    new_canonical = aliases[0]
+    new_canonical.canonical_id = None
+    page_store.move_pages(db, pdf.id, new_canonical.id, commit=False)
+    db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id)\
+        .update({SearchIndex.pdf_id: new_canonical.id, SearchIndex.pdf_filename: new_canonical.filename},
+                synchronize_session=False)
+    new_canonical.is_indexed = pdf.is_indexed
+    new_canonical.search_indexed = pdf.search_indexed
+    for alias in aliases[1:]:
+        alias.canonical_id = new_canonical.id
+
+    db.commit()
+    db.refresh(new_canonical)
+    return new_canonical
+
+
 def add_pdf_tags(db: Session, filename: str, tags: List[str]):
     """Agregar tags a un PDF"""
     pdf = get_pdf_by_filename(db, filename)
@@ -84,6 +190,8 @@ def delete_pdf_document(db: Session, filename: str) -> bool:
     """Eliminar registro de PDF"""
     pdf = get_pdf_by_filename(db, filename)
     if pdf:
+        page_store.delete_pages(db, pdf.id, commit=False)
+        db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id).delete(synchronize_session=False)
         db.delete(pdf)
         db.commit()
         return True
@@ -129,7 +237,7 @@ def create_query_history(db: Session, question: str, pdf_filename: Optional[str]
         documents_found=documents_found,
         execution_time=execution_time,
         answer=answer,
-        results=results or {}
+        results_payload=encode_payload(results or {})
     )
     db.add(query_history)
     db.commit()
@@ -137,6 +245,31 @@ def create_query_history(db: Session, question: str, pdf_filename: Optional[str]
     return query_history
 
 
+def migrate_history_results(db: Session, batch_size: int = 500) -> int:
+    """Pasar los resultados del historial guardados como JSON al formato binario"""
+    table = QueryHistory.__table__
+    migrated = 0
+    while True:
+        rows = db.query(QueryHistory.id, QueryHistory.results)\
+            .filter(QueryHistory.results_payload.is_(None))\
+            .filter(QueryHistory.results.isnot(None))\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            break
+        db.execute(
+            table.update()
+            .where(table.c.id == bindparam("b_id"))
+            .values(results_payload=bindparam("b_payload"), results=null()),
+            [{"b_id": row.id, "b_payload": encode_payload(row.results)} for row in rows]
+        )
+        db.commit()
+        migrated += len(rows)
+    if migrated:
+        print(f"🗜️ {migrated} resultados del historial pasados a formato binario")
+    return migrated
+
+
 def get_recent_queries(db: Session, limit: int = 20) -> List[QueryHistory]:
     """Obtener consultas recientes"""
     return db.query(QueryHistory)\
@@ -215,21 +348,53 @@ def search_in_index(db: Session, word: str, pdf_filename: Optional[str] = None)
     return q.all()
 
 
-def rebuild_index_for_pdf(db: Session, pdf: PDFDocument, word_data: Dict):
-    """Reconstruir índice de búsqueda para un PDF"""
+def rebuild_index_for_pdf(db: Session, pdf: PDFDocument, word_data: Dict,
+                          page_lengths: Optional[Dict[int, int]] = None):
+    """Reconstruir índice de búsqueda para un PDF (inserción en bloque, un solo commit)
+    
+    page_lengths: palabras indexadas por página, se guardan en pdf_pages.term_count
+    """
     # Eliminar índices viejos
-    db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id).delete()
+    db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf.id).delete(synchronize_session=False)
     
     # Crear nuevos índices
-    for word, data in word_data.items():
-        create_search_index(
-            db, word, pdf.filename, pdf.id,
-            data["pages"], data["count"], data["contexts"]
+    now = datetime.utcnow()
+    rows = [
+        {
+            "word": word.lower(),
+            "pdf_id": pdf.id,
+            "pdf_filename": pdf.filename,
+            "page_numbers": data["pages"],
+            "page_counts": data.get("page_counts"),
+            "occurrences": data["count"],
+            "contexts": data.get("contexts", [])[:3],
+            "indexed_date": now
+        }
+        for word, data in word_data.items()
+    ]
+    if rows:
+        db.execute(SearchIndex.__table__.insert(), rows)
+    if page_lengths:
+        db.execute(
+            PDFPage.__table__.update()
+            .where(PDFPage.__table__.c.pdf_id == bindparam("b_pdf_id"))
+            .where(PDFPage.__table__.c.page_number == bindparam("b_page"))
+            .values(term_count=bindparam("b_terms")),
+            [{"b_pdf_id": pdf.id, "b_page": page, "b_terms": terms} for page, terms in page_lengths.items()]
         )
-    
+    pdf.search_indexed = True
     db.commit()
 
 
+def clear_index_for_pdf(db: Session, pdf_id: int, commit: bool = True):
+    """Eliminar el índice de búsqueda de un PDF (texto cambiado o eliminado)"""
+    db.query(SearchIndex).filter(SearchIndex.pdf_id == pdf_id).delete(synchronize_session=False)
+    db.query(PDFDocument).filter(PDFDocument.id == pdf_id)\
+        .update({PDFDocument.search_indexed: False}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+
 # ========== USAGE STATISTICS ==========
 
 def get_or_create_today_stats(db: Session) -> UsageStatistics:
@@ -0,0 +1,100 @@
+"""
+Capa de ejecución para el trabajo bloqueante de los endpoints
+Los endpoints son async, pero SQLAlchemy, PyPDF2, las regex y la
+generación de docx/PDF son síncronos: ejecutados directamente bloquean
+el event loop y una petición lenta congela al resto. Con esta capa los
+endpoints hacen `await` y el worker de uvicorn sigue atendiendo.
+
+- io:  pool de threads para BD, archivos y esperas (SEARCH/EXTRACTION pools)
+- cpu: pool de threads acotado a los núcleos para análisis de texto,
+       búsquedas con regex y generación de documentos; la extracción de
+       PDFs grandes sigue repartiéndose en el pool de procesos de pdf_extractor
+
+Con EXECUTOR_INLINE=1 todo se ejecuta en el event loop (comportamiento
+anterior, útil para depurar y para comparar en benchmark_concurrency.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, TypeVar
+import threading
+import asyncio
+import os
+
+# Threads para trabajo de E/S (BD, disco)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+# Threads para trabajo de CPU (0 = núcleos disponibles)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0")) or (os.cpu_count() or 1)
+# Ejecutar en el event loop sin pools
+EXECUTOR_INLINE = os.getenv("EXECUTOR_INLINE", "0").lower() in ("1", "true", "yes")
+
+T = TypeVar("T")
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pool_lock = threading.Lock()
+# Tareas enviadas y todavía sin terminar por pool (en ejecución + en cola)
+_in_flight: Dict[str, int] = {"io": 0, "cpu": 0}
+_counter_lock = threading.Lock()
+
+
+def _get_pool(kind: str) -> ThreadPoolExecutor:
+    with _pool_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            workers = IO_WORKERS if kind == "io" else CPU_WORKERS
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=kind)
+            _pools[kind] = pool
+        return pool
+
+
+def _tracked(kind: str, func: Callable[[], T]) -> T:
+    try:
+        return func()
+    finally:
+        with _counter_lock:
+            _in_flight[kind] -= 1
+
+
+async def _run(kind: str, func: Callable[..., T], *args, **kwargs) -> T:
+    call = partial(func, *args, **kwargs)
+    if EXECUTOR_INLINE:
+        return call()
+    with _counter_lock:
+        _in_flight[kind] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(_get_pool(kind), _tracked, kind, call)
+    except BaseException:
+        # No se encoló (p. ej. pool ya cerrado): _tracked no va a descontarla
+        with _counter_lock:
+            _in_flight[kind] -= 1
+        raise
+    return await future
+
+
+async def run_io(func: Callable[..., T], *args, **kwargs) -> T:
+    """Ejecutar trabajo de E/S bloqueante (BD, archivos) fuera del event loop"""
+    return await _run("io", func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable[..., T], *args, **kwargs) -> T:
+    """Ejecutar trabajo de CPU (regex, análisis, renderizado) en el pool acotado"""
+    return await _run("cpu", func, *args, **kwargs)
+
+
+def pool_stats() -> Dict:
+    """Tamaño y ocupación de los pools"""
+    with _counter_lock:
+        in_flight = dict(_in_flight)
+    return {
+        "inline": EXECUTOR_INLINE,
+        "io": {"workers": IO_WORKERS, "in_flight": in_flight["io"]},
+        "cpu": {"workers": CPU_WORKERS, "in_flight": in_flight["cpu"]}
+    }
+
+
+def shutdown_executors(wait: bool = False):
+    """Cerrar los pools (al apagar el servidor)"""
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
+        _pools.clear()
@@ -67,6 +67,15 @@ def remove_pdf_from_fts(db: Session, pdf_id: int):
     db.commit()
 
 
+def reassign_pdf_in_fts(db: Session, old_pdf_id: int, new_pdf_id: int, new_filename: str):
+    """Pasar las páginas indexadas de un PDF a otro (promoción de un duplicado)"""
+    db.execute(
+        text("UPDATE pdf_fts SET pdf_id = :new_id, filename = :filename WHERE pdf_id = :old_id"),
+        {"new_id": new_pdf_id, "filename": new_filename, "old_id": old_pdf_id}
+    )
+    db.commit()
+
+
 # ========== BÚSQUEDAS FTS ==========
 
 def fts_search(db: Session, query: str, filenames: Optional[List[str]] = None,
@@ -130,6 +139,49 @@ def fts_search_by_pdf(db: Session, query: str, filename: str,
     return fts_search(db, query, filenames=[filename], limit=limit)
 
 
+def is_pdf_indexed(db: Session, pdf_id: int) -> bool:
+    """El PDF tiene páginas en el índice FTS"""
+    row = db.execute(
+        text("SELECT 1 FROM pdf_fts WHERE pdf_id = :pdf_id LIMIT 1"),
+        {"pdf_id": pdf_id}
+    ).first()
+    return row is not None
+
+
+def fts_keyword_matches(db: Session, pdf_id: int, keywords: List[str]) -> List[Dict]:
+    """Páginas de un PDF que contienen cada palabra clave (búsqueda por prefijo)
+    
+    Solo se busca en el contenido (no en el nombre del archivo) y sin límite
+    de filas: el número de páginas es el conteo exacto que se reporta.
+    Retorna una fila por (palabra clave, página) ordenada por página y por
+    el orden de las palabras clave, con el snippet como contexto.
+    """
+    matches = []
+    for order, keyword in enumerate(keywords):
+        fts_query = 'content : "' + keyword.replace('"', '""') + '"*'
+        rows = db.execute(
+            text("""
+                SELECT page_number,
+                       snippet(pdf_fts, 3, '', '', '...', 32) as snippet,
+                       rank
+                FROM pdf_fts
+                WHERE pdf_fts MATCH :query AND pdf_id = :pdf_id
+                ORDER BY rank
+            """),
+            {"query": fts_query, "pdf_id": pdf_id}
+        ).fetchall()
+        for row in rows:
+            matches.append((int(row[0]), order, {
+                "keyword": keyword,
+                "page": int(row[0]),
+                "context": " ".join(row[1].split()),
+                "relevance": abs(float(row[2]))
+            }))
+
+    matches.sort(key=lambda match: match[:2])
+    return [match[2] for match in matches]
+
+
 def fts_search_phrase(db: Session, phrase: str, filenames: Optional[List[str]] = None,
                      limit: int = 50) -> List[Dict]:
     """Búsqueda de frase exacta"""
@@ -236,18 +288,22 @@ def get_fts_statistics(db: Session) -> Dict:
 def rebuild_fts_index(db: Session):
     """Reconstruir índice FTS desde cero"""
     from database import PDFDocument
+    import page_store
     
     # Limpiar índice actual
     db.execute(text("DELETE FROM pdf_fts"))
     db.commit()
     
-    # Re-indexar todos los PDFs
-    pdfs = db.query(PDFDocument).filter(PDFDocument.is_indexed == True).all()
+    # Re-indexar todos los PDFs con texto (los alias comparten el índice del canónico)
+    pdfs = db.query(PDFDocument)\
+        .filter(PDFDocument.canonical_id.is_(None))\
+        .all()
     
     indexed_count = 0
     for pdf in pdfs:
-        if pdf.text_by_pages:
-            index_pdf_for_fts(db, pdf.id, pdf.filename, pdf.text_by_pages)
+        pages_text = page_store.load_pages(db, pdf.id)
+        if pages_text:
+            index_pdf_for_fts(db, pdf.id, pdf.filename, pages_text)
             indexed_count += 1
     
     return {
@@ -0,0 +1,400 @@
+"""
+Pipeline de ingesta de PDFs en segundo plano
+Cada upload crea un job que pasa por las etapas:
+store → dedup → extract → stats → fts_index → search_index → cache_invalidate
+y al terminar se precalientan en el caché sus consultas frecuentes.
+Si el contenido (SHA-256) ya existe, el archivo se registra como alias
+del PDF existente y se omiten extracción, estadísticas e indexado.
+Un nombre ya existente que se vuelve a subir llega en un archivo de
+staging: reemplaza al anterior (y sus alias se separan) solo cuando el
+nuevo contenido se extrajo y guardó; si falla, el PDF anterior queda igual.
+Los jobs se ejecutan en un pool acotado de threads y su progreso
+(estado y tiempos por etapa) se consulta en /api/jobs/{id}.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import threading
+import time
+import uuid
+import os
+
+from database import SessionLocal
+import db_services as db_svc
+import cache_manager as cache
+import cache_warmer
+import fts_search as fts
+import inverted_index
+import page_text
+import term_matrix
+from pdf_extractor import extract_pdf_text_by_pages, file_content_hash
+
+# Jobs de ingesta ejecutándose a la vez
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Jobs terminados que se conservan para consulta
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "200"))
+
+
+# ========== MODELO DE JOB ==========
+
+class IngestionJob:
+    """Estado de un job de ingesta"""
+
+    def __init__(self, filename: str, file_path: Path, file_size: int = 0,
+                 content_hash: Optional[str] = None, delete_file_on_error: bool = True,
+                 staged_path: Optional[Path] = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.file_path = Path(file_path)
+        # Contenido nuevo aún fuera de file_path (re-subida de un nombre existente)
+        self.staged_path = Path(staged_path) if staged_path is not None else None
+        self.file_size = file_size
+        self.content_hash = content_hash
+        self.delete_file_on_error = delete_file_on_error
+
+        self.status = "queued"  # queued, running, completed, failed
+        self.error: Optional[str] = None
+        self.result: Dict = {}
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._done = threading.Event()
+        self.stages: "OrderedDict[str, Dict]" = OrderedDict(
+            (name, {"status": "pending", "duration": None, "error": None})
+            for name in ["store"] + [name for name, _ in PIPELINE]
+        )
+
+    @property
+    def source_path(self) -> Path:
+        """Archivo con el contenido que se está ingestando"""
+        return self.staged_path or self.file_path
+
+    def promote_staged(self):
+        """Reemplazar el archivo anterior por el de staging"""
+        if self.staged_path is not None:
+            os.replace(self.staged_path, self.file_path)
+            self.staged_path = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Esperar a que el job termine (True si terminó)"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "stages": [{"name": name, **info} for name, info in self.stages.items()],
+            "progress": round(
+                sum(1 for info in self.stages.values() if info["status"] in ("completed", "skipped"))
+                / len(self.stages) * 100, 1
+            ),
+            "result": self.result
+        }
+
+
+# ========== ETAPAS ==========
+
+_fts_ready = False
+
+# Etapas que no hacen falta cuando el contenido ya estaba ingestado
+DUPLICATE_SKIPPED_STAGES = {"extract", "stats", "fts_index", "search_index"}
+
+
+def detach_aliases(db, pdf) -> Optional[str]:
+    """Pasar texto e índices de un PDF canónico a su primer alias
+    
+    Llamar antes de eliminar el PDF o de reemplazar su contenido.
+    Retorna el nombre del nuevo canónico (o None si no tenía alias).
+    """
+    new_canonical = db_svc.promote_pdf_alias(db, pdf)
+    if not new_canonical:
+        return None
+    # El índice del PDF pasó a otro pdf_id
+    term_matrix.invalidate()
+    try:
+        fts.reassign_pdf_in_fts(db, pdf.id, new_canonical.id, new_canonical.filename)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Error reasignando FTS de {pdf.filename}: {e}")
+    page_text.forget(new_canonical.filename)
+    return new_canonical.filename
+
+
+def purge_document(db, filename: str) -> Dict:
+    """Quitar un PDF de la caché, del índice FTS y de la base de datos
+    
+    Si tiene duplicados, el primero hereda texto e índice antes de borrar.
+    """
+    page_text.forget(filename)
+
+    # Invalidar cache del PDF antes de eliminarlo
+    invalidated_count = cache.invalidate_cache_for_pdf(db, filename)
+    print(f"🗑️ Cache invalidado para {filename}: {invalidated_count} entradas")
+
+    try:
+        pdf = db_svc.get_pdf_by_filename(db, filename)
+        if pdf and pdf.canonical_id is None:
+            promoted = detach_aliases(db, pdf)
+            if promoted:
+                print(f"♻️ {promoted} pasa a ser el PDF canónico de {filename}")
+            fts.remove_pdf_from_fts(db, pdf.id)
+            print(f"🗑️ Eliminado del índice FTS: {filename}")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Error eliminando de FTS: {e}")
+
+    deleted = db_svc.delete_pdf_document(db, filename)
+    term_matrix.invalidate()
+    return {
+        "deleted": deleted,
+        "cache_invalidated": invalidated_count
+    }
+
+
+def _link_duplicate(source: Path, target: Path):
+    """Reemplazar la copia duplicada por un hard link al archivo canónico"""
+    if not source.exists() or source.resolve() == target.resolve():
+        return
+    tmp = target.with_name(f".{target.name}.link")
+    try:
+        if tmp.exists():
+            tmp.unlink()
+        os.link(source, tmp)
+        os.replace(tmp, target)
+    except OSError:
+        # Sistema de archivos sin hard links: se conserva la copia
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _stage_dedup(db, job: IngestionJob, ctx: Dict):
+    """Detectar contenido ya ingestado y registrar el archivo como alias"""
+    if not job.content_hash:
+        job.content_hash = file_content_hash(job.source_path)
+
+    existing = db_svc.get_pdf_by_filename(db, job.filename)
+    replaces_text = existing and existing.canonical_id is None and existing.content_hash != job.content_hash
+
+    canonical = db_svc.get_pdf_by_content_hash(db, job.content_hash)
+    if canonical is None:
+        # Los alias se separan en _stage_stats, cuando el nuevo contenido ya se extrajo
+        ctx["replaces"] = existing if replaces_text else None
+        return
+
+    if replaces_text:
+        # Cambia el contenido de este nombre: sus alias conservan el texto anterior
+        detach_aliases(db, existing)
+    job.promote_staged()
+    signature = page_text.file_signature(job.file_path)
+    if canonical.filename == job.filename:
+        # Mismo contenido re-subido con el mismo nombre
+        db_svc.update_file_signature(db, canonical, *signature)
+        pdf = canonical
+    else:
+        if existing and existing.canonical_id is None:
+            # El nombre tenía texto propio: ahora lo comparte con el canónico
+            try:
+                fts.remove_pdf_from_fts(db, existing.id)
+            except Exception:
+                db.rollback()
+        _link_duplicate(job.file_path.parent / canonical.filename, job.file_path)
+        signature = page_text.file_signature(job.file_path)
+        pdf = db_svc.make_pdf_alias(db, canonical, job.filename, str(job.file_path), *signature)
+        job.result["duplicate_of"] = canonical.filename
+
+    page_text.forget(job.filename)
+    ctx["pdf_id"] = pdf.id
+    ctx["skip"] = DUPLICATE_SKIPPED_STAGES
+    job.result.update({
+        "pdf_id": pdf.id,
+        "total_pages": pdf.total_pages,
+        "word_count": pdf.word_count
+    })
+
+
+def _stage_extract(db, job: IngestionJob, ctx: Dict):
+    """Extraer el texto por páginas con PyPDF2"""
+    ctx["pages_text"] = extract_pdf_text_by_pages(job.source_path)
+
+
+def _stage_stats(db, job: IngestionJob, ctx: Dict):
+    """Calcular estadísticas (palabras, páginas) y guardar el registro en BD"""
+    if ctx.get("replaces") is not None:
+        # Cambia el contenido de este nombre: sus alias conservan el texto anterior
+        detach_aliases(db, ctx["replaces"])
+    # os.replace conserva tamaño y mtime: la firma del staging es la del archivo final
+    pdf = page_text.store_pages_text(db, job.filename, job.file_path, ctx["pages_text"],
+                                     signature=page_text.file_signature(job.source_path),
+                                     content_hash=job.content_hash)
+    job.promote_staged()
+    db_svc.increment_upload_count(db)
+    ctx["pdf"] = pdf
+    ctx["pdf_id"] = pdf.id
+    job.result.update({
+        "pdf_id": pdf.id,
+        "total_pages": pdf.total_pages,
+        "word_count": pdf.word_count
+    })
+
+
+def _stage_fts_index(db, job: IngestionJob, ctx: Dict):
+    """Indexar las páginas en SQLite FTS5"""
+    global _fts_ready
+    if not _fts_ready:
+        fts.init_fts_tables(db)
+        _fts_ready = True
+    fts.index_pdf_for_fts(db, ctx["pdf_id"], job.filename, ctx["pages_text"])
+
+
+def _stage_search_index(db, job: IngestionJob, ctx: Dict):
+    """Construir el índice invertido de palabras (una transacción)"""
+    job.result["words_indexed"] = inverted_index.index_document(db, ctx["pdf"], ctx["pages_text"])
+
+
+def _stage_cache_invalidate(db, job: IngestionJob, ctx: Dict):
+    """Invalidar consultas cacheadas que usaban la versión anterior del PDF"""
+    job.result["cache_invalidated"] = cache.invalidate_cache_for_pdf(db, job.filename)
+
+
+# Orden de ejecución: (nombre, función(db, job, ctx))
+PIPELINE: List[Tuple[str, Callable]] = [
+    ("dedup", _stage_dedup),
+    ("extract", _stage_extract),
+    ("stats", _stage_stats),
+    ("fts_index", _stage_fts_index),
+    ("search_index", _stage_search_index),
+    ("cache_invalidate", _stage_cache_invalidate),
+]
+
+
+# ========== REGISTRO Y EJECUCIÓN ==========
+
+_jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_filename_locks: Dict[str, threading.Lock] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+        return _executor
+
+
+def _filename_lock(filename: str) -> threading.Lock:
+    """Un mismo archivo no se ingesta dos veces a la vez"""
+    with _jobs_lock:
+        return _filename_locks.setdefault(filename, threading.Lock())
+
+
+def _register(job: IngestionJob):
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Descartar los jobs terminados más antiguos
+        finished = [job_id for job_id, j in _jobs.items() if j.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(_jobs) - JOB_HISTORY_LIMIT)]:
+            del _jobs[job_id]
+
+
+def submit_ingestion(filename: str, file_path: Path, file_size: int = 0,
+                     content_hash: Optional[str] = None, store_duration: Optional[float] = None,
+                     delete_file_on_error: bool = True, staged_path: Optional[Path] = None) -> IngestionJob:
+    """Encolar la ingesta de un archivo ya guardado en disco
+
+    staged_path: archivo con el contenido nuevo cuando file_path ya existe;
+    reemplaza a file_path solo si la ingesta llega a guardar el texto.
+    """
+    job = IngestionJob(filename, file_path, file_size, content_hash, delete_file_on_error, staged_path)
+    job.stages["store"].update({
+        "status": "completed",
+        "duration": round(store_duration, 4) if store_duration is not None else None
+    })
+    _register(job)
+    _get_executor().submit(run_job, job)
+    return job
+
+
+def run_job(job: IngestionJob):
+    """Ejecutar todas las etapas de un job (en un thread del pool)"""
+    with _filename_lock(job.filename):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db = SessionLocal()
+        ctx: Dict = {}
+        try:
+            for name, stage in PIPELINE:
+                info = job.stages[name]
+                if name in ctx.get("skip", ()):
+                    info["status"] = "skipped"
+                    continue
+                info["status"] = "running"
+                start = time.time()
+                try:
+                    stage(db, job, ctx)
+                except Exception as e:
+                    info.update({"status": "failed", "error": str(e),
+                                 "duration": round(time.time() - start, 4)})
+                    raise
+                info.update({"status": "completed", "duration": round(time.time() - start, 4)})
+            job.status = "completed"
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+            for info in job.stages.values():
+                if info["status"] == "pending":
+                    info["status"] = "skipped"
+            if job.staged_path is not None:
+                # El archivo y el registro anteriores quedan como estaban
+                if job.staged_path.exists():
+                    job.staged_path.unlink()
+            elif job.delete_file_on_error and "pdf_id" not in ctx and job.file_path.exists():
+                job.file_path.unlink()
+            print(f"❌ Ingesta fallida para {job.filename}: {e}")
+        finally:
+            db.close()
+            job.finished_at = datetime.utcnow()
+            job._done.set()
+
+    if job.status == "completed":
+        # Precalentar las consultas frecuentes que usan este PDF (un error no afecta al job)
+        try:
+            cache_warmer.schedule(f"ingest {job.filename}", [job.filename])
+        except Exception as e:
+            print(f"⚠️ Error programando el precalentamiento tras ingestar {job.filename}: {e}")
+
+
+def get_job(job_id: str) -> Optional[IngestionJob]:
+    """Obtener un job por su id"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(limit: int = 20) -> List[IngestionJob]:
+    """Jobs más recientes primero"""
+    with _jobs_lock:
+        return list(reversed(_jobs.values()))[:limit]
+
+
+def active_filenames() -> set:
+    """Archivos con un job en cola o en curso"""
+    with _jobs_lock:
+        return {job.filename for job in _jobs.values() if job.status in ("queued", "running")}
+
+
+def shutdown_ingestion():
+    """Detener el pool de ingesta (al apagar el servidor)"""
+    global _executor
+    with _jobs_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
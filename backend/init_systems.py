@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from database import init_db, get_db
 import fts_search as fts
 import db_services as db_svc
+import page_store
 from pathlib import Path
 
 def init_all_systems():
@@ -49,12 +50,16 @@ def init_all_systems():
         pdfs = db_svc.get_all_pdfs(db)
         indexed_count = 0
         
+        page_store.migrate_legacy_text(db)
         for pdf in pdfs:
-            if pdf.text_by_pages and pdf.is_indexed:
+            if pdf.canonical_id is None:
+                pages_text = page_store.load_pages(db, pdf.id)
+                if not pages_text:
+                    continue
                 try:
-                    fts.index_pdf_for_fts(db, pdf.id, pdf.filename, pdf.text_by_pages)
+                    fts.index_pdf_for_fts(db, pdf.id, pdf.filename, pages_text)
                     indexed_count += 1
-                    print(f"   📄 {pdf.filename} ({len(pdf.text_by_pages)} páginas)")
+                    print(f"   📄 {pdf.filename} ({len(pages_text)} páginas)")
                 except Exception as e:
                     print(f"   ⚠️ Error indexando {pdf.filename}: {e}")
         
@@ -0,0 +1,151 @@
+"""
+Índice invertido de palabras (tabla search_index)
+Se construye una vez por documento al ingestarlo: cada página se tokeniza
+una sola vez y todas las entradas (palabra → páginas, ocurrencias) se
+insertan en bloque en una única transacción.
+
+Las consultas lo usan para saber qué páginas pueden contener cada palabra
+clave y solo esas páginas se leen y se pasan al matcher. Las mismas
+entradas alimentan la matriz término × página del corpus (term_matrix.py).
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import re
+
+from database import PDFDocument, SearchIndex
+import db_services as db_svc
+import page_store
+import page_text
+import term_matrix
+
+# Solo se indexan palabras de más de 3 letras (las mismas que usa analyze_question)
+MIN_WORD_LENGTH = 4
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize_text(text: str) -> List[str]:
+    """Palabras del texto en minúsculas (sin filtrar por longitud)"""
+    return _WORD.findall((text or "").lower())
+
+
+def tokenize_pages(pages_text: Dict[int, str]) -> Tuple[Dict[str, Dict], Dict[int, int]]:
+    """Tokenizar todas las páginas en una pasada
+
+    Returns:
+        ({palabra: {"pages": [páginas ordenadas], "page_counts": [apariciones por página],
+                    "count": ocurrencias, "contexts": []}},
+         {página: palabras indexadas})
+    """
+    word_data: Dict[str, Dict] = {}
+    page_lengths: Dict[int, int] = {}
+    for page_num, text in sorted(pages_text.items()):
+        counts = Counter(word for word in tokenize_text(text) if len(word) >= MIN_WORD_LENGTH)
+        page_lengths[page_num] = sum(counts.values())
+        for word, count in counts.items():
+            data = word_data.get(word)
+            if data is None:
+                word_data[word] = {"pages": [page_num], "page_counts": [count], "count": count, "contexts": []}
+            else:
+                data["pages"].append(page_num)
+                data["page_counts"].append(count)
+                data["count"] += count
+    return word_data, page_lengths
+
+
+def index_document(db: Session, pdf: PDFDocument, pages_text: Dict[int, str]) -> int:
+    """(Re)construir el índice de un PDF; retorna el número de palabras indexadas"""
+    word_data, page_lengths = tokenize_pages(pages_text)
+    db_svc.rebuild_index_for_pdf(db, pdf, word_data, page_lengths)
+    term_matrix.put_document(pdf, word_data, page_lengths)
+    return len(word_data)
+
+
+def backfill(db: Session) -> int:
+    """Indexar los PDFs canónicos sin índice o con un índice sin conteos por página"""
+    outdated = db.query(SearchIndex.pdf_id)\
+        .filter(SearchIndex.page_counts.is_(None))\
+        .distinct()
+    pdfs = db.query(PDFDocument)\
+        .filter(PDFDocument.canonical_id.is_(None))\
+        .filter(or_(PDFDocument.search_indexed.isnot(True), PDFDocument.id.in_(outdated)))\
+        .all()
+
+    indexed = 0
+    for pdf in pdfs:
+        pages_text = page_store.load_pages(db, pdf.id) or page_store.migrate_document(db, pdf.id)
+        if pages_text:
+            index_document(db, pdf, pages_text)
+            indexed += 1
+    if indexed:
+        print(f"🔎 Índice invertido construido para {indexed} PDFs")
+    return indexed
+
+
+# ========== CONSULTAS ==========
+
+def candidate_pages(db: Session, pdf_id: int, keywords: List[str]) -> List[int]:
+    """Páginas donde aparece alguna palabra que contiene alguna de las palabras clave
+
+    La búsqueda del texto es por subcadena, así que se buscan las palabras del
+    vocabulario que contienen la clave ("config" → "configuration").
+    """
+    rows = db.query(SearchIndex.page_numbers)\
+        .filter(SearchIndex.pdf_id == pdf_id)\
+        .filter(or_(*[SearchIndex.word.contains(keyword.lower(), autoescape=True)
+                      for keyword in keywords]))
+    pages = set()
+    for row in rows:
+        pages.update(row.page_numbers or [])
+    return sorted(pages)
+
+
+def can_use_index(keywords: List[str]) -> bool:
+    """El índice solo cubre claves formadas por letras/dígitos de 4 o más caracteres"""
+    return bool(keywords) and all(
+        _WORD.fullmatch(keyword) and len(keyword) >= MIN_WORD_LENGTH for keyword in keywords
+    )
+
+
+def indexed_source(db: Session, filename: str, file_path: Path, keywords: List[str]) -> Optional[Tuple[int, int]]:
+    """(pdf_id con el índice, total de páginas) si el índice sirve para estas claves y está al día"""
+    if not can_use_index(keywords):
+        return None
+    meta = db.query(PDFDocument.id, PDFDocument.canonical_id, PDFDocument.file_size,
+                    PDFDocument.file_mtime)\
+        .filter(PDFDocument.filename == filename)\
+        .first()
+    if not meta or page_text.is_stale(meta.file_size, meta.file_mtime, page_text.file_signature(file_path)):
+        return None
+
+    text_id = meta.canonical_id or meta.id
+    source = db.query(PDFDocument.search_indexed, PDFDocument.total_pages)\
+        .filter(PDFDocument.id == text_id)\
+        .first()
+    if not source or not source.search_indexed:
+        return None
+    return text_id, source.total_pages or 0
+
+
+def get_query_pages(db: Session, filename: str, file_path: Path,
+                    keywords: List[str]) -> Tuple[Dict[int, str], int, bool]:
+    """Texto de las páginas que pueden responder a las palabras clave
+
+    Con índice al día solo se leen las páginas candidatas; si no, se
+    devuelven todas las páginas (búsqueda por escaneo).
+
+    Returns:
+        (texto de las páginas leídas, total de páginas del documento, si se usó el índice)
+    """
+    source = indexed_source(db, filename, file_path, keywords)
+    if source:
+        text_id, total_pages = source
+        pages = candidate_pages(db, text_id, keywords)
+        pages_text = page_text.get_pages(db, filename, file_path, pages) if pages else {}
+        return pages_text, total_pages, True
+
+    pages_text = page_text.get_pages_text(db, filename, file_path)
+    return pages_text, len(pages_text), False
@@ -0,0 +1,82 @@
+"""
+Índice de inicios de línea de cada página
+Las posiciones donde empieza cada línea se calculan una sola vez al
+guardar la página (pdf_pages.line_starts) y viajan con el texto: PageText
+es un str normal con el array de inicios como atributo. Con él, la línea
+de una coincidencia es una bisección y el contexto de ±N líneas (y sus
+recortes a 300/200/150 caracteres) es un único slice del texto, sin
+split('\\n') ni join por consulta.
+"""
+from array import array
+from bisect import bisect_right
+from typing import Optional, Tuple
+import re
+import sys
+
+_NEWLINE = re.compile("\n")
+
+
+def line_starts(text: str) -> array:
+    """Posición donde empieza cada línea del texto (la primera siempre es 0)"""
+    starts = array("I", [0])
+    starts.extend(match.end() for match in _NEWLINE.finditer(text))
+    return starts
+
+
+def pack_starts(starts: array) -> bytes:
+    """Serializar los inicios de línea (uint32 little-endian)"""
+    if sys.byteorder == "big":
+        starts = array("I", starts)
+        starts.byteswap()
+    return starts.tobytes()
+
+
+def unpack_starts(data: Optional[bytes]) -> Optional[array]:
+    if not data:
+        return None
+    starts = array("I")
+    starts.frombytes(data)
+    if sys.byteorder == "big":
+        starts.byteswap()
+    return starts
+
+
+class PageText(str):
+    """Texto de una página con los inicios de sus líneas (se usa como cualquier str)"""
+
+    def __new__(cls, text: str, starts: Optional[array] = None):
+        page = super().__new__(cls, text or "")
+        page.line_starts = starts if starts is not None else line_starts(page)
+        return page
+
+    def line_of(self, offset: int) -> int:
+        """Línea (desde 0) que contiene la posición"""
+        return bisect_right(self.line_starts, offset) - 1
+
+    def line_span(self, first: int, last: int) -> Tuple[int, int]:
+        """(inicio, fin) de las líneas first..last, sin el salto de línea final"""
+        first = max(0, first)
+        start = self.line_starts[first] if first < len(self.line_starts) else len(self)
+        end = self.line_starts[last + 1] - 1 if last + 1 < len(self.line_starts) else len(self)
+        return start, max(start, end)
+
+    def context(self, line: int, limit: Optional[int] = None, radius: int = 1) -> str:
+        """Líneas line±radius unidas por espacios, sin espacios en los extremos y
+        recortadas a `limit` caracteres
+
+        Equivale a " ".join(lines[line - radius:line + radius + 1]).strip()[:limit]
+        pero solo copia los caracteres que se devuelven.
+        """
+        start, end = self.line_span(line - radius, line + radius)
+        while start < end and self[start].isspace():
+            start += 1
+        while end > start and self[end - 1].isspace():
+            end -= 1
+        if limit is not None:
+            end = min(end, start + limit)
+        return self[start:end].replace("\n", " ")
+
+
+def as_page(text: str) -> PageText:
+    """El texto como PageText (calcula los inicios de línea si no los tiene)"""
+    return text if isinstance(text, PageText) else PageText(text)
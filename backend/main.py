@@ -1,26 +1,43 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 import os
+import json
 import shutil
 import logging
 import re
 from pathlib import Path
-import PyPDF2
 from typing import List, Dict, Optional, Any
 from collections import Counter
 from dotenv import load_dotenv
 import time
+import asyncio
 from datetime import datetime
 
 # Importar base de datos
-from database import get_db, init_db
+from database import get_db, init_db, SessionLocal, DB_PATH
 import db_services as db_svc
 
+# Extracción y acceso al texto por páginas
+from pdf_extractor import extract_pdf_text_by_pages, parse_page_ranges, shutdown_extraction_pool
+import page_text
+import page_store
+import text_matcher
+import inverted_index
+import query_engine
+import ranking
+import term_matrix
+from query_analysis import analyze_question
+from upload_storage import save_upload_streaming, FileTooLargeError
+import ingestion
+import sync_database
+import executors
+
 # Importar cache, FTS y analytics
 import cache_manager as cache
+import cache_warmer
 import fts_search as fts
 import analytics as analytics_module
 
@@ -46,6 +63,7 @@ CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "50")) * 1024 * 1024  # MB a bytes
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "../pdfs")
 RESULTS_FOLDER = os.getenv("RESULTS_FOLDER", "results")
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", "0"))  # 0 = desactivado
 
 app = FastAPI(
     title="PDF Query API", 
@@ -83,116 +101,17 @@ class MultiQueryRequest(BaseModel):
     question: str
     filenames: List[str]
     search_all: Optional[bool] = False
+    engine: Optional[str] = None  # "scan", "index" o "fts" (por defecto QUERY_ENGINE)
 
 # ========== Funciones de análisis de texto ==========
 
-def extract_pdf_text(file_path: Path) -> str:
-    """Extraer todo el texto de un PDF"""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        raise Exception(f"Error extrayendo texto del PDF: {str(e)}")
-
-def extract_pdf_text_by_pages(file_path: Path) -> Dict[int, str]:
-    """Extraer texto de un PDF separado por páginas"""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            pages_text = {}
-            for page_num, page in enumerate(pdf_reader.pages, start=1):
-                pages_text[page_num] = page.extract_text()
-        return pages_text
-    except Exception as e:
-        raise Exception(f"Error extrayendo texto del PDF: {str(e)}")
-
 def search_in_text(text: str, keywords: List[str]) -> List[Dict[str, str]]:
-    """Buscar palabras clave en el texto y retornar contexto"""
-    results = []
-    lines = text.split('\n')
-    
-    for keyword in keywords:
-        pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-        for i, line in enumerate(lines):
-            if pattern.search(line):
-                # Obtener contexto (línea anterior, actual y siguiente)
-                context_start = max(0, i - 1)
-                context_end = min(len(lines), i + 2)
-                context = ' '.join(lines[context_start:context_end])
-                
-                results.append({
-                    "keyword": keyword,
-                    "line_number": i + 1,
-                    "context": context.strip()
-                })
-    
-    return results
+    """Buscar palabras clave en el texto y retornar contexto (una sola pasada)"""
+    return text_matcher.get_matcher(keywords).search_text(text)
 
 def search_in_pages(pages_text: Dict[int, str], keywords: List[str]) -> List[Dict]:
-    """Buscar palabras clave en páginas específicas del PDF"""
-    results = []
-    
-    for page_num, page_text in pages_text.items():
-        lines = page_text.split('\n')
-        
-        for keyword in keywords:
-            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-            for i, line in enumerate(lines):
-                if pattern.search(line):
-                    # Obtener contexto
-                    context_start = max(0, i - 1)
-                    context_end = min(len(lines), i + 2)
-                    context = ' '.join(lines[context_start:context_end])
-                    
-                    results.append({
-                        "keyword": keyword,
-                        "page": page_num,
-                        "line_in_page": i + 1,
-                        "context": context.strip()[:300]  # Limitar contexto
-                    })
-    
-    return results
-
-def analyze_question(question: str) -> Dict:
-    """Analizar la pregunta para extraer palabras clave y tipo de consulta"""
-    question_lower = question.lower()
-    
-    # Identificar tipo de pregunta
-    question_type = "general"
-    if any(word in question_lower for word in ["qué", "que", "what"]):
-        question_type = "definition"
-    elif any(word in question_lower for word in ["cómo", "como", "how"]):
-        question_type = "process"
-    elif any(word in question_lower for word in ["cuándo", "cuando", "when"]):
-        question_type = "temporal"
-    elif any(word in question_lower for word in ["dónde", "donde", "where"]):
-        question_type = "location"
-    elif any(word in question_lower for word in ["por qué", "porque", "why"]):
-        question_type = "reason"
-    elif any(word in question_lower for word in ["cuánto", "cuanto", "how much", "how many"]):
-        question_type = "quantity"
-    
-    # Extraer palabras clave (remover palabras comunes)
-    stop_words = {
-        'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas',
-        'de', 'del', 'al', 'a', 'en', 'con', 'por', 'para',
-        'qué', 'que', 'cómo', 'como', 'cuándo', 'cuando',
-        'dónde', 'donde', 'por', 'es', 'está', 'son', 'están',
-        'the', 'a', 'an', 'in', 'on', 'at', 'to', 'for',
-        'what', 'how', 'when', 'where', 'why', 'is', 'are'
-    }
-    
-    words = re.findall(r'\w+', question_lower)
-    keywords = [word for word in words if len(word) > 3 and word not in stop_words]
-    
-    return {
-        "type": question_type,
-        "keywords": keywords[:5]  # Limitar a 5 palabras clave principales
-    }
+    """Buscar palabras clave en páginas específicas del PDF (una sola pasada por página)"""
+    return text_matcher.get_matcher(keywords).search_pages(pages_text)
 
 def generate_answer(question: str, pdf_text: str, filename: str) -> str:
     """Generar respuesta basada en el contenido del PDF"""
@@ -235,14 +154,12 @@ def generate_answer(question: str, pdf_text: str, filename: str) -> str:
     
     return "\n".join(answer_parts)
 
-def generate_answer_with_pages(question: str, file_path: Path, filename: str) -> Dict:
+def generate_answer_with_pages(question: str, pages_text: Dict[int, str], filename: str,
+                               keywords: Optional[List[str]] = None) -> Dict:
     """Generar respuesta con ubicaciones de página"""
-    # Extraer texto por páginas
-    pages_text = extract_pdf_text_by_pages(file_path)
-    
     # Analizar la pregunta
-    analysis = analyze_question(question)
-    keywords = analysis["keywords"]
+    if keywords is None:
+        keywords = analyze_question(question)["keywords"]
     
     if not keywords:
         return {
@@ -252,9 +169,18 @@ def generate_answer_with_pages(question: str, file_path: Path, filename: str) ->
             "total_matches": 0
         }
     
-    # Buscar en páginas específicas
+    # Buscar en páginas específicas y ordenarlas por relevancia (BM25 con las propias páginas)
     search_results = search_in_pages(pages_text, keywords)
+    matched_pages = {result["page"] for result in search_results}
+    page_scores = ranking.score_text_pages({page: pages_text[page] for page in matched_pages}, keywords)
+    return build_answer_from_matches(keywords, search_results, filename, page_scores)
+
+def build_answer_from_matches(keywords: List[str], search_results: List[Dict], filename: str,
+                              page_scores: Optional[Dict[int, float]] = None) -> Dict:
+    """Construir la respuesta (texto, ubicaciones, páginas) a partir de las coincidencias
     
+    Con page_scores las páginas van de más a menos relevante; si no, en orden de página.
+    """
     if not search_results:
         return {
             "answer": f"No encontré información relacionada con '{', '.join(keywords)}' en el documento {filename}.",
@@ -274,9 +200,11 @@ def generate_answer_with_pages(question: str, file_path: Path, filename: str) ->
             pages_found[page] = []
         pages_found[page].append(result)
     
-    # Construir respuesta por página
+    # Construir respuesta por página (las más relevantes primero)
+    ranked_pages = ranking.rank_pages(list(pages_found), page_scores)
     locations = []
-    for page, results in sorted(pages_found.items())[:5]:  # Máximo 5 páginas
+    for page in ranked_pages[:5]:  # Máximo 5 páginas
+        results = pages_found[page]
         answer_parts.append(f"\n📍 **Página {page}:**")
         
         # Mostrar contextos únicos
@@ -289,11 +217,14 @@ def generate_answer_with_pages(question: str, file_path: Path, filename: str) ->
                     context = context[:200] + "..."
                 answer_parts.append(f"   • {context}")
                 
-        locations.append({
+        location = {
             "page": page,
             "keywords": [r["keyword"] for r in results],
             "preview": results[0]["context"][:150] + "..."
-        })
+        }
+        if page_scores is not None:
+            location["score"] = round(page_scores.get(page, 0.0), 4)
+        locations.append(location)
     
     # Estadísticas
     total_pages = len(pages_found)
@@ -307,15 +238,12 @@ def generate_answer_with_pages(question: str, file_path: Path, filename: str) ->
         "keywords": keywords,
         "locations": locations,
         "total_matches": total_matches,
-        "pages_found": list(pages_found.keys())
+        "pages_found": ranked_pages
     }
 
-def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
+def search_multiple_pdfs(db: Session, question: str, filenames: List[str],
+                         engine: str = query_engine.QUERY_ENGINE) -> Dict:
     """Buscar en múltiples PDFs y agregar resultados"""
-    all_results = []
-    total_matches = 0
-    documents_found = 0
-    
     # Analizar la pregunta una sola vez
     analysis = analyze_question(question)
     keywords = analysis["keywords"]
@@ -327,56 +255,29 @@ def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
             "results": [],
             "total_matches": 0,
             "documents_found": 0,
-            "comparison": {}
+            "comparison": {},
+            "failed_documents": []
         }
     
-    # Buscar en cada PDF
-    for filename in filenames:
-        file_path = UPLOAD_DIR / filename
-        
-        if not file_path.exists():
-            continue
-            
-        try:
-            # Extraer texto por páginas
-            pages_text = extract_pdf_text_by_pages(file_path)
-            
-            # Buscar en páginas
-            search_results = search_in_pages(pages_text, keywords)
-            
-            if search_results:
-                documents_found += 1
-                doc_matches = len(search_results)
-                total_matches += doc_matches
-                
-                # Agrupar por página
-                pages_found = {}
-                for result in search_results:
-                    page = result["page"]
-                    if page not in pages_found:
-                        pages_found[page] = []
-                    pages_found[page].append(result)
-                
-                # Construir ubicaciones
-                locations = []
-                for page, results in sorted(pages_found.items())[:3]:  # Máximo 3 páginas por documento
-                    locations.append({
-                        "page": page,
-                        "keywords": [r["keyword"] for r in results],
-                        "preview": results[0]["context"][:150] + "..."
-                    })
-                
-                all_results.append({
-                    "filename": filename,
-                    "matches": doc_matches,
-                    "pages_found": list(pages_found.keys()),
-                    "locations": locations,
-                    "total_pages": len(pages_text)
-                })
-        
-        except Exception as e:
-            # Si hay error con un PDF, continuar con los demás
-            continue
+    # Una consulta a la matriz del corpus: documentos y páginas con las claves
+    corpus = query_engine.corpus_hits(UPLOAD_DIR, filenames, keywords)
+    
+    # Buscar en todos los PDFs en paralelo (con plazo por documento)
+    # Ya vienen ordenados por relevancia (BM25), con el conteo exacto de cada documento;
+    # solo los TOP_DOCUMENTS primeros traen ubicaciones y vistas previas
+    all_results, failed_documents = query_engine.search_documents(UPLOAD_DIR, filenames, keywords, engine,
+                                                                  corpus=corpus)
+    return build_multi_answer(keywords, filenames, all_results, failed_documents, corpus)
+
+def build_multi_answer(keywords: List[str], filenames: List[str], all_results: List[Dict],
+                       failed_documents: List[Dict], corpus: Optional[term_matrix.CorpusHits] = None) -> Dict:
+    """Respuesta comparativa a partir de los documentos ya ordenados por relevancia
+    
+    Con la matriz del corpus, la comparación incluye apariciones, páginas y
+    documentos por palabra clave (en los archivos indexados de la búsqueda).
+    """
+    documents_found = len(all_results)
+    total_matches = sum(doc["matches"] for doc in all_results)
     
     # Si no se encontró nada
     if not all_results:
@@ -386,16 +287,14 @@ def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
             "results": [],
             "total_matches": 0,
             "documents_found": 0,
-            "comparison": {}
+            "comparison": {},
+            "failed_documents": failed_documents
         }
     
     # Construir respuesta comparativa
     answer_parts = [f"🔍 **Búsqueda en {len(filenames)} documento(s)**\n"]
     answer_parts.append(f"📊 **Resultados:** Encontré información en **{documents_found}** de {len(filenames)} documentos.\n")
     
-    # Ordenar documentos por número de coincidencias
-    all_results.sort(key=lambda x: x["matches"], reverse=True)
-    
     # Mostrar resultados por documento
     for idx, doc_result in enumerate(all_results[:5], 1):  # Máximo 5 documentos
         answer_parts.append(f"\n📄 **{idx}. {doc_result['filename']}**")
@@ -413,6 +312,9 @@ def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
     answer_parts.append(f"• Total de {total_matches} coincidencia(s) encontradas")
     answer_parts.append(f"• {documents_found} documento(s) contienen información relevante")
     answer_parts.append(f"• Palabras clave buscadas: {', '.join(keywords)}")
+    if failed_documents:
+        answer_parts.append(f"• ⚠️ {len(failed_documents)} documento(s) no se pudieron consultar: "
+                            f"{', '.join(doc['filename'] for doc in failed_documents)}")
     
     # Comparación de documentos
     comparison = {
@@ -421,6 +323,9 @@ def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
         "documents_without_results": len(filenames) - documents_found,
         "average_matches_per_doc": round(total_matches / documents_found, 2) if documents_found > 0 else 0
     }
+    if corpus is not None:
+        comparison["indexed_documents"] = sum(1 for filename in filenames if filename in corpus.sources)
+        comparison["keyword_occurrences"] = corpus.keyword_totals(filenames)
     
     return {
         "answer": "\n".join(answer_parts),
@@ -428,7 +333,8 @@ def search_multiple_pdfs(question: str, filenames: List[str]) -> Dict:
         "results": all_results,
         "total_matches": total_matches,
         "documents_found": documents_found,
-        "comparison": comparison
+        "comparison": comparison,
+        "failed_documents": failed_documents
     }
 
 def generate_summary(text: str, max_sentences: int = 5) -> str:
@@ -523,6 +429,157 @@ def translate_text(text: str, target_lang: str = "en") -> str:
     # Para traducción real, integrar con API de traducción
     return f"⚠️ Traducción completa requiere API externa. Texto original:\n\n{text[:500]}..."
 
+def analyze_text(filename: str, pdf_text: str, analysis_type: str) -> Dict[str, Any]:
+    """Análisis del texto de un PDF según el tipo pedido"""
+    result: Dict[str, Any] = {
+        "filename": filename,
+        "analysis_type": analysis_type
+    }
+    
+    if analysis_type == "summary":
+        result["summary"] = generate_summary(pdf_text)
+        
+    elif analysis_type == "word_frequency":
+        result["word_frequency"] = get_word_frequency(pdf_text, top_n=20)
+        result["total_unique_words"] = len(set(pdf_text.lower().split()))
+        
+    elif analysis_type == "statistics":
+        words = pdf_text.split()
+        lines = pdf_text.split('\n')
+        result["statistics"] = {
+            "total_words": len(words),
+            "total_characters": len(pdf_text),
+            "total_characters_no_spaces": len(pdf_text.replace(" ", "")),
+            "total_lines": len(lines),
+            "total_pages": "N/A",  # PyPDF2 puede obtener esto
+            "average_word_length": sum(len(word) for word in words) / len(words) if words else 0
+        }
+        
+    elif analysis_type == "translate":
+        # Traducción básica (placeholder)
+        result["translated"] = translate_text(pdf_text[:1000])
+        result["note"] = "Traducción completa requiere integración con API de traducción"
+        
+    else:
+        raise HTTPException(status_code=400, detail=f"Tipo de análisis no soportado: {analysis_type}")
+    
+    return result
+
+def batch_analyze_text(filename: str, pdf_text: str) -> Dict[str, Any]:
+    """Resumen, frecuencia de palabras y estadísticas de un texto en una pasada"""
+    words = pdf_text.split()
+    
+    return {
+        "filename": filename,
+        "summary": generate_summary(pdf_text),
+        "word_frequency": get_word_frequency(pdf_text, top_n=15),
+        "statistics": {
+            "total_words": len(words),
+            "total_characters": len(pdf_text),
+            "total_lines": len(pdf_text.split('\n')),
+            "unique_words": len(set(word.lower() for word in words)),
+            "average_word_length": round(sum(len(word) for word in words) / len(words) if words else 0, 2)
+        }
+    }
+
+# ========== Ciclo de vida ==========
+
+_background_tasks: List[asyncio.Task] = []
+
+async def periodic_sync():
+    """Sincronizar periódicamente la carpeta de PDFs con la base de datos"""
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL_SECONDS)
+        try:
+            summary = await executors.run_io(sync_database.sync_corpus, UPLOAD_DIR, False, False)
+            # Los archivos con un job de una vuelta anterior aún en curso no se vuelven a encolar
+            changes = len(summary.get("jobs", [])) + len(summary.get("removed", []))
+            if changes:
+                print(f"🔄 Sincronización: {len(summary['new'])} nuevos, "
+                      f"{len(summary['changed'])} modificados, {len(summary['removed'])} eliminados, "
+                      f"{len(summary['in_progress'])} ya en ingesta")
+        except Exception as e:
+            print(f"⚠️ Error en sincronización periódica: {e}")
+
+async def periodic_cache_flush():
+    """Volcar periódicamente a SQLite los hits del caché acumulados en memoria"""
+    while True:
+        await asyncio.sleep(cache.CACHE_FLUSH_SECONDS)
+        try:
+            await executors.run_io(cache.flush_hit_counters)
+        except Exception as e:
+            print(f"⚠️ Error guardando los hits del caché: {e}")
+
+def migrate_page_store():
+    """Pasar el texto de las columnas antiguas al almacén de páginas, guardar
+    los inicios de línea que falten e indexar los PDFs que aún no tienen
+    índice invertido (una sola vez)"""
+    db = SessionLocal()
+    try:
+        page_store.migrate_legacy_text(db)
+        page_store.backfill_line_starts(db)
+        inverted_index.backfill(db)
+    except Exception as e:
+        print(f"⚠️ Error migrando texto al almacén de páginas: {e}")
+    finally:
+        db.close()
+
+def warm_single_query(db: Session, question: str, filename: str, engine: str):
+    """Calcular y cachear una consulta sobre un PDF (precalentamiento: sin historial ni estadísticas)"""
+    start_time = time.time()
+    result = answer_single_query(db, question, filename, UPLOAD_DIR / filename, engine)
+    cache_single_query(db, question, filename, engine, result, time.time() - start_time)
+
+def warm_multi_query(db: Session, question: str, filenames: List[str], search_type: str, engine: str):
+    """Calcular y cachear una consulta múltiple (precalentamiento: sin historial ni estadísticas)"""
+    start_time = time.time()
+    result = search_multiple_pdfs(db, question, filenames, engine)
+    cache_multi_query(db, question, engine, filenames, search_type, result, time.time() - start_time)
+
+def migrate_query_cache():
+    """Enlazar las entradas antiguas del caché con sus documentos y pasar los
+    resultados guardados como JSON al formato binario (una sola vez)"""
+    db = SessionLocal()
+    try:
+        # Cada migración por separado: si una falla, las demás se ejecutan igual
+        for migrate, description in ((cache.backfill_cache_documents, "enlazando el caché con sus documentos"),
+                                     (cache.migrate_legacy_payloads, "migrando los resultados del caché"),
+                                     (db_svc.migrate_history_results, "migrando los resultados del historial")):
+            try:
+                migrate(db)
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Error {description}: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def on_startup():
+    """Tareas en segundo plano al arrancar"""
+    await executors.run_io(migrate_page_store)
+    await executors.run_io(migrate_query_cache)
+    cache_warmer.configure(UPLOAD_DIR, warm_single_query, warm_multi_query)
+    cache_warmer.schedule("startup")
+    if SYNC_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(periodic_sync()))
+    if cache.CACHE_FLUSH_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(periodic_cache_flush()))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Liberar recursos al apagar el servidor"""
+    for task in _background_tasks:
+        task.cancel()
+    try:
+        cache.flush_hit_counters()
+    except Exception as e:
+        print(f"⚠️ Error guardando los hits del caché: {e}")
+    ingestion.shutdown_ingestion()
+    cache_warmer.shutdown_warmer()
+    query_engine.shutdown_search_pool()
+    shutdown_extraction_pool()
+    executors.shutdown_executors()
+
 # ========== Endpoints de la API ==========
 
 @app.get("/")
@@ -542,11 +599,13 @@ async def health_check():
         "status": "healthy",
         "timestamp": str(Path.cwd()),
         "upload_dir_exists": UPLOAD_DIR.exists(),
-        "results_dir_exists": RESULTS_DIR.exists()
+        "results_dir_exists": RESULTS_DIR.exists(),
+        "executors": executors.pool_stats(),
+        "term_matrix": term_matrix.matrix_stats()
     }
 
 @app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_pdf(file: UploadFile = File(...)):
     """Subir un archivo PDF"""
     # Validar que se proporcionó un archivo
     if not file.filename:
@@ -556,56 +615,40 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Solo se permiten archivos PDF")
     
-    # Validar tamaño del archivo
-    contents = await file.read()
-    file_size = len(contents)
-    if file_size > MAX_FILE_SIZE:
+    # Guardar archivo por bloques validando el tamaño y calculando el hash
+    store_start = time.time()
+    try:
+        # Si el nombre ya existe, el archivo anterior se reemplaza cuando la ingesta termina bien
+        stored_path, file_size, content_hash = await save_upload_streaming(
+            file, UPLOAD_DIR, file.filename, MAX_FILE_SIZE, keep_existing=True
+        )
+    except FileTooLargeError:
         raise HTTPException(
             status_code=413, 
             detail=f"El archivo es demasiado grande. Tamaño máximo: {MAX_FILE_SIZE // (1024*1024)}MB"
         )
     
-    # Guardar archivo
+    # Extracción, estadísticas, índice FTS e invalidación de cache en segundo plano
     file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as buffer:
-        buffer.write(contents)
-    
-    try:
-        # Extraer texto y metadata del PDF
-        pages_text = extract_pdf_text_by_pages(file_path)
-        full_text = "\n".join(pages_text.values())
-        total_pages = len(pages_text)
-        
-        # Guardar en base de datos
-        pdf_doc = db_svc.create_pdf_document(
-            db=db,
-            filename=file.filename,
-            file_path=str(file_path),
-            file_size=file_size,
-            total_pages=total_pages,
-            full_text=full_text,
-            text_by_pages=pages_text
-        )
-        
-        # Incrementar estadísticas
-        db_svc.increment_upload_count(db)
-        
-        return {
-            "message": f"Archivo {file.filename} subido correctamente",
-            "file_path": str(file_path),
-            "pdf_id": pdf_doc.id,
-            "total_pages": total_pages,
-            "word_count": pdf_doc.word_count
-        }
+    job = ingestion.submit_ingestion(
+        filename=file.filename,
+        file_path=file_path,
+        file_size=file_size,
+        content_hash=content_hash,
+        store_duration=time.time() - store_start,
+        staged_path=stored_path if stored_path != file_path else None
+    )
     
-    except Exception as e:
-        # Si falla, eliminar archivo y registro de BD
-        if file_path.exists():
-            file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Error procesando PDF: {str(e)}")
+    return JSONResponse(status_code=202, content={
+        "message": f"Archivo {file.filename} recibido, procesando en segundo plano",
+        "file_path": str(file_path),
+        "file_size": file_size,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}"
+    })
 
 @app.post("/extract-text/{filename}")
-async def extract_text(filename: str):
+async def extract_text(filename: str, db: Session = Depends(get_db)):
     """Extraer texto de un PDF"""
     file_path = UPLOAD_DIR / filename
     
@@ -613,24 +656,51 @@ async def extract_text(filename: str):
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
+        text = await executors.run_io(page_text.get_full_text, db, filename, file_path)
         
         # Guardar texto extraído
         text_file = RESULTS_DIR / f"{filename}_extracted.txt"
-        with open(text_file, 'w', encoding='utf-8') as f:
-            f.write(text)
+        await executors.run_io(text_file.write_text, text, encoding='utf-8')
         
         return {"message": "Texto extraído correctamente", "text": text[:500] + "..."}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al procesar PDF: {str(e)}")
 
+async def cached_query_response(db: Session, question: str, filenames: List[str], search_type: str,
+                                engine: str, background_tasks: BackgroundTasks) -> Optional[Response]:
+    """Respuesta de un hit del caché con el resultado ya serializado (None si no hay hit)
+
+    Los hits de L1 se resuelven en el event loop; si hace falta la BD se
+    consulta en el pool de I/O.
+    """
+    variant = query_engine.cache_variant(engine)
+    hit = cache.peek_cached_response(question, filenames, search_type, variant)
+    if hit is None:
+        hit = await executors.run_io(cache.get_cached_response, db, question, filenames, search_type, variant)
+    if hit is None:
+        return None
+    body, result = hit
+    # Actualizar estadísticas después de enviar la respuesta (no contar tiempo de ejecución)
+    background_tasks.add_task(record_cached_hit, result.get("total_matches", 0), search_type)
+    return Response(content=body, media_type="application/json")
+
+def record_cached_hit(matches: int, search_type: str):
+    """Contar un hit del caché en las estadísticas del día (tarea en segundo plano)
+
+    Sesión propia: la de la petición puede estar cerrada cuando la tarea se ejecuta.
+    """
+    db = SessionLocal()
+    try:
+        db_svc.increment_query_count(db, 0.001, matches, search_type)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Error registrando estadísticas del hit: {e}")
+    finally:
+        db.close()
+
 @app.post("/query")
-async def query_pdf(query: dict, db: Session = Depends(get_db)):
+async def query_pdf(query: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Realizar consulta sobre el contenido del PDF"""
     question = query.get("question", "")
     filename = query.get("filename", "")
@@ -638,6 +708,11 @@ async def query_pdf(query: dict, db: Session = Depends(get_db)):
     if not question or not filename:
         raise HTTPException(status_code=400, detail="Se requiere pregunta y nombre de archivo")
     
+    try:
+        engine = query_engine.resolve_engine(query.get("engine"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # Verificar que el archivo existe
     file_path = UPLOAD_DIR / filename
     if not file_path.exists():
@@ -645,80 +720,99 @@ async def query_pdf(query: dict, db: Session = Depends(get_db)):
     
     try:
         # 🚀 INTENTAR RECUPERAR DEL CACHE
-        cached_result = cache.get_cached_result(db, question, [filename], "single")
-        if cached_result:
+        cached_response = await cached_query_response(db, question, [filename], "single", engine,
+                                                      background_tasks)
+        if cached_response:
             print(f"✅ Cache HIT para query: {question[:50]}...")
-            # Actualizar estadísticas (no contar tiempo de ejecución)
-            db_svc.increment_query_count(db, 0.001, cached_result.get("total_matches", 0), "single")
-            return {
-                **cached_result,
-                "cached": True,
-                "cache_hit": True
-            }
+            return cached_response
         
         print(f"❌ Cache MISS para query: {question[:50]}...")
         start_time = time.time()
         
-        # Generar respuesta con ubicaciones de página
-        result = generate_answer_with_pages(question, file_path, filename)
+        # Generar respuesta con ubicaciones de página usando el motor elegido
+        result = await executors.run_cpu(answer_single_query, db, question, filename, file_path, engine)
         
         execution_time = time.time() - start_time
-        
-        # Agregar información adicional
-        result["question"] = question
-        result["filename"] = filename
-        result["cached"] = False
-        
-        # 💾 GUARDAR EN CACHE (TTL 24 horas por defecto)
-        cache.cache_query_result(
-            db=db,
-            question=question,
-            pdf_files=[filename],
-            search_type="single",
-            result=result,
-            execution_time=execution_time,
-            ttl_hours=24
-        )
-        
-        # Guardar en historial
-        db_svc.create_query_history(
-            db=db,
-            question=question,
-            pdf_filename=filename,
-            search_type="single",
-            keywords_found=result.get("keywords", []),
-            total_matches=result.get("total_matches", 0),
-            documents_found=1,
-            execution_time=execution_time,
-            answer=result.get("answer", ""),
-            results=result
-        )
-        
-        # Actualizar acceso del PDF
-        db_svc.update_pdf_access(db, filename)
-        
-        # Actualizar estadísticas
-        db_svc.increment_query_count(db, execution_time, result.get("total_matches", 0), "single")
-        if result.get("keywords"):
-            db_svc.update_top_keywords(db, result["keywords"])
+        await executors.run_io(record_single_query, db, question, filename, engine, result, execution_time)
         
         return result
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando consulta: {str(e)}")
 
-@app.post("/query-multiple")
-async def query_multiple_pdfs_endpoint(request: MultiQueryRequest, db: Session = Depends(get_db)):
-    """Realizar consulta en múltiples PDFs"""
-    question = request.question
-    filenames = request.filenames
-    search_all = request.search_all
+def answer_single_query(db: Session, question: str, filename: str, file_path: Path, engine: str) -> Dict:
+    """Buscar las palabras clave de la pregunta en un PDF y construir la respuesta"""
+    keywords = analyze_question(question)["keywords"]
+    if keywords:
+        search_results, _, engine_used, page_scores = query_engine.find_matches(db, filename, file_path,
+                                                                                keywords, engine)
+        result = build_answer_from_matches(keywords, search_results, filename, page_scores)
+    else:
+        result = generate_answer_with_pages(question, {}, filename, keywords)
+        engine_used = engine
+    result["engine"] = engine_used
+    return result
+
+def cache_single_query(db: Session, question: str, filename: str, engine: str, result: Dict,
+                       execution_time: float):
+    """Completar y cachear el resultado de una consulta sobre un PDF"""
+    # Agregar información adicional
+    result["question"] = question
+    result["filename"] = filename
+    result["cached"] = False
+    
+    # 💾 GUARDAR EN CACHE (TTL 24 horas por defecto)
+    cache.cache_query_result(
+        db=db,
+        question=question,
+        pdf_files=[filename],
+        search_type="single",
+        result=result,
+        execution_time=execution_time,
+        ttl_hours=cache.TTL_HOURS["single"],
+        variant=query_engine.cache_variant(engine)
+    )
+
+def record_single_query(db: Session, question: str, filename: str, engine: str, result: Dict,
+                        execution_time: float):
+    """Completar, cachear y registrar el resultado de una consulta sobre un PDF"""
+    cache_single_query(db, question, filename, engine, result, execution_time)
+    
+    # Guardar en historial
+    db_svc.create_query_history(
+        db=db,
+        question=question,
+        pdf_filename=filename,
+        search_type="single",
+        keywords_found=result.get("keywords", []),
+        total_matches=result.get("total_matches", 0),
+        documents_found=1,
+        execution_time=execution_time,
+        answer=result.get("answer", ""),
+        results=result
+    )
     
-    if not question:
+    # Actualizar acceso del PDF
+    db_svc.update_pdf_access(db, filename)
+    
+    # Actualizar estadísticas
+    db_svc.increment_query_count(db, execution_time, result.get("total_matches", 0), "single")
+    if result.get("keywords"):
+        db_svc.update_top_keywords(db, result["keywords"])
+
+def resolve_multi_request(request: MultiQueryRequest) -> tuple:
+    """Validar una consulta múltiple; retorna (motor, archivos, tipo de búsqueda)"""
+    if not request.question:
         raise HTTPException(status_code=400, detail="Se requiere una pregunta")
     
+    try:
+        engine = query_engine.resolve_engine(request.engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filenames = request.filenames
     # Si search_all es True, buscar en todos los PDFs disponibles
-    if search_all:
+    if request.search_all:
         filenames = [f.name for f in UPLOAD_DIR.glob("*.pdf")]
         
         if not filenames:
@@ -727,79 +821,183 @@ async def query_multiple_pdfs_endpoint(request: MultiQueryRequest, db: Session =
     if not filenames:
         raise HTTPException(status_code=400, detail="Se requiere al menos un archivo")
     
+    return engine, filenames, "all" if request.search_all else "multiple"
+
+def cache_multi_query(db: Session, question: str, engine: str, filenames: List[str], search_type: str,
+                      result: Dict, execution_time: float):
+    """Completar y cachear el resultado de una consulta múltiple"""
+    # Agregar información adicional
+    result["engine"] = engine
+    result["question"] = question
+    result["searched_files"] = filenames
+    result["search_all"] = search_type == "all"
+    result["cached"] = False
+    
+    # 💾 GUARDAR EN CACHE (TTL 12 horas para multi-búsquedas)
+    cache.cache_query_result(
+        db=db,
+        question=question,
+        pdf_files=filenames,
+        search_type=search_type,
+        result=result,
+        execution_time=execution_time,
+        ttl_hours=cache.TTL_HOURS[search_type],  # Menor TTL para búsquedas múltiples
+        variant=query_engine.cache_variant(engine)
+    )
+
+def record_multi_query(db: Session, request: MultiQueryRequest, engine: str, filenames: List[str],
+                       search_type: str, result: Dict, execution_time: float):
+    """Completar, cachear y registrar el resultado de una consulta múltiple"""
+    cache_multi_query(db, request.question, engine, filenames, search_type, result, execution_time)
+    
+    # Guardar en historial
+    db_svc.create_query_history(
+        db=db,
+        question=request.question,
+        multiple_pdfs=filenames,
+        search_type=search_type,
+        keywords_found=result.get("keywords", []),
+        total_matches=result.get("total_matches", 0),
+        documents_found=result.get("documents_found", 0),
+        execution_time=execution_time,
+        answer=result.get("answer", ""),
+        results=result
+    )
+    
+    # Actualizar acceso de cada PDF encontrado
+    if result.get("results"):
+        for doc_result in result["results"]:
+            db_svc.update_pdf_access(db, doc_result["filename"])
+    
+    # Actualizar estadísticas
+    db_svc.increment_query_count(db, execution_time, result.get("total_matches", 0), search_type)
+    if result.get("keywords"):
+        db_svc.update_top_keywords(db, result["keywords"])
+
+@app.post("/query-multiple")
+async def query_multiple_pdfs_endpoint(request: MultiQueryRequest, background_tasks: BackgroundTasks,
+                                       db: Session = Depends(get_db)):
+    """Realizar consulta en múltiples PDFs"""
+    engine, filenames, search_type = resolve_multi_request(request)
+    question = request.question
+    
     try:
-        search_type = "all" if search_all else "multiple"
-        
         # 🚀 INTENTAR RECUPERAR DEL CACHE
-        cached_result = cache.get_cached_result(db, question, filenames, search_type)
-        if cached_result:
+        cached_response = await cached_query_response(db, question, filenames, search_type, engine,
+                                                      background_tasks)
+        if cached_response:
             print(f"✅ Cache HIT para query múltiple: {question[:50]}...")
-            # Actualizar estadísticas (no contar tiempo de ejecución)
-            db_svc.increment_query_count(db, 0.001, cached_result.get("total_matches", 0), search_type)
-            return {
-                **cached_result,
-                "cached": True,
-                "cache_hit": True
-            }
+            return cached_response
         
         print(f"❌ Cache MISS para query múltiple: {question[:50]}...")
         start_time = time.time()
         
-        # Realizar búsqueda en múltiples PDFs
-        result = search_multiple_pdfs(question, filenames)
+        # Realizar búsqueda en múltiples PDFs (el thread espera al pool de búsqueda)
+        result = await executors.run_io(search_multiple_pdfs, db, question, filenames, engine)
         
         execution_time = time.time() - start_time
+        await executors.run_io(record_multi_query, db, request, engine, filenames, search_type,
+                               result, execution_time)
         
-        # Agregar información adicional
-        result["question"] = question
-        result["searched_files"] = filenames
-        result["search_all"] = search_all
-        result["cached"] = False
-        
-        # 💾 GUARDAR EN CACHE (TTL 12 horas para multi-búsquedas)
-        cache.cache_query_result(
-            db=db,
-            question=question,
-            pdf_files=filenames,
-            search_type=search_type,
-            result=result,
-            execution_time=execution_time,
-            ttl_hours=12  # Menor TTL para búsquedas múltiples
-        )
+        return result
         
-        # Guardar en historial
-        db_svc.create_query_history(
-            db=db,
-            question=question,
-            multiple_pdfs=filenames,
-            search_type=search_type,
-            keywords_found=result.get("keywords", []),
-            total_matches=result.get("total_matches", 0),
-            documents_found=result.get("documents_found", 0),
-            execution_time=execution_time,
-            answer=result.get("answer", ""),
-            results=result
-        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error procesando consulta múltiple: {str(e)}")
+
+def format_stream_event(event: str, data: Dict, stream_format: str) -> str:
+    """Serializar un evento como línea NDJSON o como evento SSE"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, **data}, ensure_ascii=False, default=str) + "\n"
+
+def stream_multi_query(request: MultiQueryRequest, engine: str, filenames: List[str], search_type: str,
+                       stream_format: str):
+    """Eventos de una consulta múltiple: start, un document/failed por PDF y summary
+
+    Cada documento se emite en cuanto termina su búsqueda; summary lleva la
+    respuesta agregada y la comparación (lo mismo que /query-multiple, salvo
+    "results", que se reemplaza por el orden final en "ranking").
+    """
+    question = request.question
+    variant = query_engine.cache_variant(engine)
+    # Sesión propia: el generador sigue vivo después de que el endpoint retorna
+    db = SessionLocal()
+    try:
+        keywords = analyze_question(question)["keywords"]
+        yield format_stream_event("start", {
+            "question": question, "keywords": keywords, "engine": engine,
+            "documents": len(filenames)
+        }, stream_format)
         
-        # Actualizar acceso de cada PDF encontrado
-        if result.get("results"):
-            for doc_result in result["results"]:
-                db_svc.update_pdf_access(db, doc_result["filename"])
+        cache_entry = cache.get_cached_result(db, question, filenames, search_type, variant=variant)
+        if cache_entry:
+            print(f"✅ Cache HIT para query múltiple (stream): {question[:50]}...")
+            cached_result = cache_entry["result"]
+            db_svc.increment_query_count(db, 0.001, cached_result.get("total_matches", 0), search_type)
+            for doc_result in cached_result.get("results", []):
+                yield format_stream_event("document", doc_result, stream_format)
+            for failed in cached_result.get("failed_documents", []):
+                yield format_stream_event("failed", failed, stream_format)
+            summary = {key: value for key, value in cached_result.items() if key != "results"}
+            summary["ranking"] = [doc["filename"] for doc in cached_result.get("results", [])]
+            yield format_stream_event("summary", {**summary, "cached": True, "cache_hit": True}, stream_format)
+            return
         
-        # Actualizar estadísticas
-        db_svc.increment_query_count(db, execution_time, result.get("total_matches", 0), search_type)
-        if result.get("keywords"):
-            db_svc.update_top_keywords(db, result["keywords"])
+        start_time = time.time()
+        if keywords:
+            corpus = query_engine.corpus_hits(UPLOAD_DIR, filenames, keywords)
+            top = query_engine.TopKDocuments(query_engine.TOP_DOCUMENTS)
+            finished: Dict[int, Dict] = {}
+            failed_documents = []
+            for kind, index, payload in query_engine.iter_documents(UPLOAD_DIR, filenames, keywords,
+                                                                    engine, top, corpus=corpus):
+                if kind == "failed":
+                    failed_documents.append(payload)
+                else:
+                    query_engine.add_finished(finished, top, index, payload)
+                yield format_stream_event(kind, payload, stream_format)
+            result = build_multi_answer(keywords, filenames, query_engine.rank_documents(finished),
+                                        failed_documents, corpus)
+        else:
+            result = search_multiple_pdfs(db, question, filenames, engine)
         
-        return result
+        execution_time = time.time() - start_time
+        record_multi_query(db, request, engine, filenames, search_type, result, execution_time)
         
+        summary = {key: value for key, value in result.items() if key != "results"}
+        summary["ranking"] = [doc["filename"] for doc in result["results"]]
+        summary["execution_time"] = round(execution_time, 3)
+        yield format_stream_event("summary", summary, stream_format)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error procesando consulta múltiple: {str(e)}")
+        print(f"❌ Error en consulta múltiple (stream): {e}")
+        yield format_stream_event("error", {"detail": f"Error procesando consulta múltiple: {str(e)}"},
+                                  stream_format)
+    finally:
+        db.close()
+
+@app.post("/query-multiple/stream")
+async def query_multiple_stream_endpoint(request: MultiQueryRequest, format: str = "ndjson"):
+    """Consulta en múltiples PDFs emitiendo cada documento en cuanto está listo
+
+    format=ndjson (una línea JSON por evento, con campo "event") o
+    format=sse (text/event-stream).
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Formato no soportado (opciones: ndjson, sse)")
+    engine, filenames, search_type = resolve_multi_request(request)
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_multi_query(request, engine, filenames, search_type, format),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/list-pdfs")
 async def list_pdfs(db: Session = Depends(get_db)):
     """Listar todos los PDFs subidos con metadata"""
-    pdfs_db = db_svc.get_all_pdfs(db)
+    pdfs_db = await executors.run_io(db_svc.get_all_pdfs, db)
     
     return {
         "pdfs": [pdf.filename for pdf in pdfs_db],
@@ -811,7 +1009,8 @@ async def list_pdfs(db: Session = Depends(get_db)):
                 "total_pages": pdf.total_pages,
                 "access_count": pdf.access_count,
                 "tags": pdf.tags or [],
-                "category": pdf.category
+                "category": pdf.category,
+                "is_duplicate": pdf.canonical_id is not None
             }
             for pdf in pdfs_db
         ]
@@ -838,7 +1037,7 @@ async def view_pdf(filename: str, page: int = 1):
     )
 
 @app.post("/analyze/{filename}")
-async def analyze_pdf(filename: str, analysis_type: str = "summary"):
+async def analyze_pdf(filename: str, analysis_type: str = "summary", db: Session = Depends(get_db)):
     """Realizar análisis avanzado del PDF"""
     file_path = UPLOAD_DIR / filename
     
@@ -846,8 +1045,8 @@ async def analyze_pdf(filename: str, analysis_type: str = "summary"):
         raise HTTPException(status_code=404, detail=f"Archivo {filename} no encontrado")
     
     try:
-        # Extraer texto del PDF
-        pdf_text = extract_pdf_text(file_path)
+        # Texto del PDF (guardado en BD, se re-extrae solo si falta)
+        pdf_text = await executors.run_io(page_text.get_full_text, db, filename, file_path)
         
         if not pdf_text.strip():
             return {
@@ -855,45 +1054,13 @@ async def analyze_pdf(filename: str, analysis_type: str = "summary"):
                 "analysis_type": analysis_type
             }
         
-        result: Dict[str, Any] = {
-            "filename": filename,
-            "analysis_type": analysis_type
-        }
-        
-        if analysis_type == "summary":
-            result["summary"] = generate_summary(pdf_text)
-            
-        elif analysis_type == "word_frequency":
-            result["word_frequency"] = get_word_frequency(pdf_text, top_n=20)
-            result["total_unique_words"] = len(set(pdf_text.lower().split()))
-            
-        elif analysis_type == "statistics":
-            words = pdf_text.split()
-            lines = pdf_text.split('\n')
-            result["statistics"] = {
-                "total_words": len(words),
-                "total_characters": len(pdf_text),
-                "total_characters_no_spaces": len(pdf_text.replace(" ", "")),
-                "total_lines": len(lines),
-                "total_pages": "N/A",  # PyPDF2 puede obtener esto
-                "average_word_length": sum(len(word) for word in words) / len(words) if words else 0
-            }
-            
-        elif analysis_type == "translate":
-            # Traducción básica (placeholder)
-            result["translated"] = translate_text(pdf_text[:1000])
-            result["note"] = "Traducción completa requiere integración con API de traducción"
-            
-        else:
-            raise HTTPException(status_code=400, detail=f"Tipo de análisis no soportado: {analysis_type}")
-        
-        return result
+        return await executors.run_cpu(analyze_text, filename, pdf_text, analysis_type)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analizando PDF: {str(e)}")
 
 @app.post("/batch-analyze/{filename}")
-async def batch_analyze_pdf(filename: str):
+async def batch_analyze_pdf(filename: str, db: Session = Depends(get_db)):
     """Realizar todos los análisis de una vez"""
     file_path = UPLOAD_DIR / filename
     
@@ -901,25 +1068,12 @@ async def batch_analyze_pdf(filename: str):
         raise HTTPException(status_code=404, detail=f"Archivo {filename} no encontrado")
     
     try:
-        pdf_text = extract_pdf_text(file_path)
+        pdf_text = await executors.run_io(page_text.get_full_text, db, filename, file_path)
         
         if not pdf_text.strip():
             return {"error": f"El archivo {filename} no contiene texto extraíble."}
         
-        words = pdf_text.split()
-        
-        return {
-            "filename": filename,
-            "summary": generate_summary(pdf_text),
-            "word_frequency": get_word_frequency(pdf_text, top_n=15),
-            "statistics": {
-                "total_words": len(words),
-                "total_characters": len(pdf_text),
-                "total_lines": len(pdf_text.split('\n')),
-                "unique_words": len(set(word.lower() for word in words)),
-                "average_word_length": round(sum(len(word) for word in words) / len(words) if words else 0, 2)
-            }
-        }
+        return await executors.run_cpu(batch_analyze_text, filename, pdf_text)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en análisis batch: {str(e)}")
@@ -929,7 +1083,7 @@ async def batch_analyze_pdf(filename: str):
 @app.get("/api/history")
 async def get_query_history(limit: int = 20, db: Session = Depends(get_db)):
     """Obtener historial de consultas recientes"""
-    queries = db_svc.get_recent_queries(db, limit=limit)
+    queries = await executors.run_io(db_svc.get_recent_queries, db, limit=limit)
     
     return {
         "total": len(queries),
@@ -951,35 +1105,56 @@ async def get_query_history(limit: int = 20, db: Session = Depends(get_db)):
 @app.get("/api/statistics")
 async def get_statistics(days: int = 7, db: Session = Depends(get_db)):
     """Obtener estadísticas de uso"""
-    stats = db_svc.get_statistics_summary(db, days=days)
+    stats = await executors.run_io(db_svc.get_statistics_summary, db, days=days)
     return stats
 
 @app.get("/api/dashboard")
 async def get_dashboard(db: Session = Depends(get_db)):
     """Obtener datos para dashboard"""
-    dashboard_data = db_svc.get_dashboard_data(db)
+    dashboard_data = await executors.run_io(db_svc.get_dashboard_data, db)
     return dashboard_data
 
 @app.get("/api/pdf/{filename}/stats")
 async def get_pdf_stats(filename: str, db: Session = Depends(get_db)):
     """Obtener estadísticas de un PDF específico"""
-    stats = db_svc.get_pdf_statistics(db, filename)
+    stats = await executors.run_io(db_svc.get_pdf_statistics, db, filename)
     
     if not stats:
         raise HTTPException(status_code=404, detail=f"PDF {filename} no encontrado en base de datos")
     
     return stats
 
+@app.get("/api/pdf/{filename}/pages")
+async def get_pdf_pages(filename: str, pages: str = "1", db: Session = Depends(get_db)):
+    """Vista previa del texto de páginas concretas (ej: pages=1-3,7)"""
+    file_path = UPLOAD_DIR / filename
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail=f"Archivo {filename} no encontrado")
+    
+    try:
+        page_numbers = parse_page_ranges(pages)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Rango de páginas inválido: {pages}")
+    
+    try:
+        pages_text = await executors.run_io(page_text.get_pages, db, filename, file_path, page_numbers)
+        return {
+            "filename": filename,
+            "pages": [{"page": page, "text": text} for page, text in pages_text.items()]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error extrayendo páginas: {str(e)}")
+
 @app.post("/api/pdf/{filename}/tags")
 async def add_pdf_tags(filename: str, tags: List[str], db: Session = Depends(get_db)):
     """Agregar tags a un PDF"""
-    db_svc.add_pdf_tags(db, filename, tags)
+    await executors.run_io(db_svc.add_pdf_tags, db, filename, tags)
     return {"message": f"Tags agregados a {filename}", "tags": tags}
 
 @app.post("/api/pdf/{filename}/category")
 async def set_pdf_category(filename: str, category: str, db: Session = Depends(get_db)):
     """Establecer categoría de un PDF"""
-    db_svc.set_pdf_category(db, filename, category)
+    await executors.run_io(db_svc.set_pdf_category, db, filename, category)
     return {"message": f"Categoría '{category}' establecida para {filename}"}
 
 @app.delete("/api/pdf/{filename}")
@@ -988,23 +1163,12 @@ async def delete_pdf(filename: str, db: Session = Depends(get_db)):
     # Eliminar archivo físico
     file_path = UPLOAD_DIR / filename
     if file_path.exists():
-        file_path.unlink()
-    
-    # Invalidar cache del PDF antes de eliminarlo
-    invalidated_count = cache.invalidate_cache_for_pdf(db, filename)
-    print(f"🗑️ Cache invalidado para {filename}: {invalidated_count} entradas")
-    
-    # Eliminar del índice FTS
-    try:
-        pdf = db_svc.get_pdf_by_filename(db, filename)
-        if pdf:
-            fts.remove_pdf_from_fts(db, pdf.id)
-            print(f"🗑️ Eliminado del índice FTS: {filename}")
-    except Exception as e:
-        print(f"⚠️ Error eliminando de FTS: {e}")
+        await executors.run_io(file_path.unlink)
     
-    # Eliminar de base de datos
-    deleted = db_svc.delete_pdf_document(db, filename)
+    # Invalidar cache, quitar de FTS y eliminar de base de datos
+    purge = await executors.run_io(ingestion.purge_document, db, filename)
+    deleted = purge["deleted"]
+    invalidated_count = purge["cache_invalidated"]
     
     if deleted:
         return {
@@ -1015,13 +1179,45 @@ async def delete_pdf(filename: str, db: Session = Depends(get_db)):
     else:
         raise HTTPException(status_code=404, detail=f"PDF {filename} no encontrado")
 
+@app.post("/api/sync")
+async def sync_pdfs(dry_run: bool = False):
+    """Sincronizar la carpeta de PDFs con la base de datos (solo cambios)"""
+    try:
+        return await executors.run_io(sync_database.sync_corpus, UPLOAD_DIR, dry_run, False)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error sincronizando: {str(e)}")
+
+@app.get("/api/jobs")
+async def list_ingestion_jobs(limit: int = 20):
+    """Listar los jobs de ingesta más recientes"""
+    return {"jobs": [job.to_dict() for job in ingestion.list_jobs(limit)]}
+
+@app.get("/api/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Estado y tiempos por etapa de un job de ingesta"""
+    job = ingestion.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} no encontrado")
+    return job.to_dict()
+
 @app.get("/api/popular-queries")
 async def get_popular_queries(limit: int = 10, db: Session = Depends(get_db)):
     """Obtener consultas más populares"""
-    popular = db_svc.get_popular_queries(db, limit=limit)
+    popular = await executors.run_io(db_svc.get_popular_queries, db, limit=limit)
     return {"popular_queries": popular}
 
 
+@app.get("/api/storage/stats")
+async def get_storage_stats(db: Session = Depends(get_db)):
+    """Tamaño del almacén de páginas comprimido y de la base de datos"""
+    try:
+        stats = await executors.run_io(page_store.storage_stats, db)
+        stats["database_bytes"] = DB_PATH.stat().st_size if DB_PATH.exists() else 0
+        return stats
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas de almacenamiento: {str(e)}")
+
+
 # ============================================================
 # ENDPOINTS DE CACHE
 # ============================================================
@@ -1030,36 +1226,49 @@ async def get_popular_queries(limit: int = 10, db: Session = Depends(get_db)):
 async def get_cache_stats(db: Session = Depends(get_db)):
     """Obtener estadísticas del cache"""
     try:
-        stats = cache.get_cache_statistics(db)
+        stats = await executors.run_io(cache.get_cache_statistics, db)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas de cache: {str(e)}")
 
 
+@app.get("/api/cache/key-report")
+async def get_cache_key_report(days: int = 0, db: Session = Depends(get_db)):
+    """Hit rate del historial con clave literal vs. canónica (days=0: todo el historial)"""
+    try:
+        return await executors.run_io(cache.key_hit_rate_report, db, days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generando el informe de claves de cache: {str(e)}")
+
+
 @app.post("/api/cache/clear")
 async def clear_cache(expired_only: bool = True, db: Session = Depends(get_db)):
     """Limpiar cache (solo expirados o todo)"""
     try:
         if expired_only:
-            removed = cache.clear_expired_cache(db)
+            removed = await executors.run_io(cache.clear_expired_cache, db)
             return {"message": f"Cache expirado limpiado", "removed_entries": removed}
         else:
             # Limpiar todo (marcar como inválido)
-            from cache_manager import QueryCache
-            all_cache = db.query(QueryCache).all()
-            for entry in all_cache:
-                entry.is_valid = False
-            db.commit()
-            return {"message": "Todo el cache ha sido invalidado", "removed_entries": len(all_cache)}
+            removed = await executors.run_io(cache.invalidate_all_cache, db)
+            warmup = cache_warmer.schedule("cache clear")
+            return {"message": "Todo el cache ha sido invalidado", "removed_entries": removed,
+                    "warmup_id": warmup.id if warmup else None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error limpiando cache: {str(e)}")
 
 
+@app.get("/api/cache/warmup")
+async def cache_warmup_status(limit: int = 10):
+    """Estado del precalentamiento del cache (configuración y últimos runs)"""
+    return cache_warmer.status(limit)
+
+
 @app.post("/api/cache/cleanup")
 async def smart_cache_cleanup(max_entries: int = 1000, min_hits: int = 2, db: Session = Depends(get_db)):
     """Limpieza inteligente del cache"""
     try:
-        result = cache.smart_cache_cleanup(db, max_entries=max_entries, min_hits=min_hits)
+        result = await executors.run_io(cache.smart_cache_cleanup, db, max_entries=max_entries, min_hits=min_hits)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en limpieza inteligente: {str(e)}")
@@ -1073,7 +1282,7 @@ async def smart_cache_cleanup(max_entries: int = 1000, min_hits: int = 2, db: Se
 async def initialize_fts(db: Session = Depends(get_db)):
     """Inicializar tablas FTS5"""
     try:
-        fts.init_fts_tables(db)
+        await executors.run_io(fts.init_fts_tables, db)
         return {"message": "Tablas FTS5 inicializadas correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error inicializando FTS: {str(e)}")
@@ -1084,16 +1293,18 @@ async def index_pdf_fts(filename: str, db: Session = Depends(get_db)):
     """Indexar un PDF específico en FTS"""
     try:
         # Obtener PDF de base de datos
-        pdf = db_svc.get_pdf_by_filename(db, filename)
+        pdf = await executors.run_io(db_svc.get_pdf_by_filename, db, filename)
         if not pdf:
             raise HTTPException(status_code=404, detail=f"PDF {filename} no encontrado")
         
-        if not pdf.text_by_pages:
+        pages_text = await executors.run_io(page_store.load_pages, db, pdf.canonical_id or pdf.id)
+        if not pages_text:
             raise HTTPException(status_code=400, detail=f"PDF {filename} no tiene texto extraído")
         
-        # Indexar
-        fts.index_pdf_for_fts(db, pdf.id, pdf.filename, pdf.text_by_pages)
-        return {"message": f"PDF {filename} indexado en FTS", "pages_indexed": len(pdf.text_by_pages)}
+        # Indexar (los alias comparten el índice del PDF canónico)
+        if pdf.canonical_id is None:
+            await executors.run_io(fts.index_pdf_for_fts, db, pdf.id, pdf.filename, pages_text)
+        return {"message": f"PDF {filename} indexado en FTS", "pages_indexed": len(pages_text)}
     except HTTPException:
         raise
     except Exception as e:
@@ -1104,7 +1315,7 @@ async def index_pdf_fts(filename: str, db: Session = Depends(get_db)):
 async def rebuild_fts(db: Session = Depends(get_db)):
     """Reconstruir índice FTS completo"""
     try:
-        result = fts.rebuild_fts_index(db)
+        result = await executors.run_io(fts.rebuild_fts_index, db)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reconstruyendo FTS: {str(e)}")
@@ -1115,7 +1326,7 @@ async def search_fts(query: str, filenames: Optional[str] = None, limit: int = 5
     """Búsqueda full-text ultrarrápida"""
     try:
         filename_list = filenames.split(",") if filenames else None
-        results = fts.fts_search(db, query, filename_list, limit)
+        results = await executors.run_io(fts.fts_search, db, query, filename_list, limit)
         return {
             "query": query,
             "total_results": len(results),
@@ -1129,7 +1340,7 @@ async def search_fts(query: str, filenames: Optional[str] = None, limit: int = 5
 async def get_fts_stats(db: Session = Depends(get_db)):
     """Estadísticas del índice FTS"""
     try:
-        stats = fts.get_fts_statistics(db)
+        stats = await executors.run_io(fts.get_fts_statistics, db)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas FTS: {str(e)}")
@@ -1143,7 +1354,7 @@ async def get_fts_stats(db: Session = Depends(get_db)):
 async def get_trending(days: int = 7, limit: int = 20, db: Session = Depends(get_db)):
     """Keywords en tendencia"""
     try:
-        trending = analytics_module.get_trending_keywords(db, days=days, limit=limit)
+        trending = await executors.run_io(analytics_module.get_trending_keywords, db, days=days, limit=limit)
         return {
             "period_days": days,
             "trending_keywords": trending
@@ -1156,7 +1367,8 @@ async def get_trending(days: int = 7, limit: int = 20, db: Session = Depends(get
 async def get_correlations(days: int = 30, min_support: int = 2, db: Session = Depends(get_db)):
     """Correlaciones entre queries"""
     try:
-        correlations = analytics_module.find_query_correlations(db, days=days, min_support=min_support)
+        correlations = await executors.run_io(analytics_module.find_query_correlations, db,
+                                              days=days, min_support=min_support)
         return {
             "period_days": days,
             "correlations": correlations
@@ -1169,7 +1381,7 @@ async def get_correlations(days: int = 30, min_support: int = 2, db: Session = D
 async def get_similar_docs(filename: str, limit: int = 5, db: Session = Depends(get_db)):
     """Documentos similares a un PDF"""
     try:
-        similar = analytics_module.find_similar_documents(db, filename, limit=limit)
+        similar = await executors.run_io(analytics_module.find_similar_documents, db, filename, limit=limit)
         return {
             "target_document": filename,
             "similar_documents": similar
@@ -1182,7 +1394,7 @@ async def get_similar_docs(filename: str, limit: int = 5, db: Session = Depends(
 async def get_usage_patterns(days: int = 30, db: Session = Depends(get_db)):
     """Patrones de uso por hora y día"""
     try:
-        patterns = analytics_module.get_usage_patterns_by_time(db, days=days)
+        patterns = await executors.run_io(analytics_module.get_usage_patterns_by_time, db, days=days)
         return patterns
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo patrones de uso: {str(e)}")
@@ -1192,7 +1404,7 @@ async def get_usage_patterns(days: int = 30, db: Session = Depends(get_db)):
 async def get_pdf_trends(days: int = 30, db: Session = Depends(get_db)):
     """Tendencias de uso de PDFs"""
     try:
-        trends = analytics_module.get_pdf_usage_trends(db, days=days)
+        trends = await executors.run_io(analytics_module.get_pdf_usage_trends, db, days=days)
         return {
             "period_days": days,
             "pdf_trends": trends
@@ -1205,7 +1417,7 @@ async def get_pdf_trends(days: int = 30, db: Session = Depends(get_db)):
 async def get_performance_stats(days: int = 30, db: Session = Depends(get_db)):
     """Estadísticas de rendimiento"""
     try:
-        stats = analytics_module.get_query_performance_stats(db, days=days)
+        stats = await executors.run_io(analytics_module.get_query_performance_stats, db, days=days)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas de rendimiento: {str(e)}")
@@ -1215,7 +1427,7 @@ async def get_performance_stats(days: int = 30, db: Session = Depends(get_db)):
 async def get_user_patterns(days: int = 30, db: Session = Depends(get_db)):
     """Patrones de comportamiento del usuario"""
     try:
-        patterns = analytics_module.detect_user_patterns(db, days=days)
+        patterns = await executors.run_io(analytics_module.detect_user_patterns, db, days=days)
         return patterns
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error detectando patrones de usuario: {str(e)}")
@@ -1225,7 +1437,7 @@ async def get_user_patterns(days: int = 30, db: Session = Depends(get_db)):
 async def get_analytics_dashboard(days: int = 30, db: Session = Depends(get_db)):
     """Dashboard completo de analytics"""
     try:
-        dashboard = analytics_module.get_complete_analytics_dashboard(db, days=days)
+        dashboard = await executors.run_io(analytics_module.get_complete_analytics_dashboard, db, days=days)
         return dashboard
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando dashboard de analytics: {str(e)}")
@@ -1265,7 +1477,8 @@ async def translate_text_endpoint(request: TranslateRequest):
     ```
     """
     try:
-        result = translator.translate_query(
+        result = await executors.run_cpu(
+            translator.translate_query,
             request.text, 
             source_lang=request.source_lang,
             target_lang=request.target_lang
@@ -1328,7 +1541,7 @@ async def add_custom_translation(german: str, english: str):
     Ejemplo: /api/translate/custom?german=beispiel&english=example
     """
     try:
-        translator.add_custom_translation(german, english)
+        await executors.run_io(translator.add_custom_translation, german, english)
         return {
             "message": f"Traducción agregada: {german} → {english}",
             "german": german,
@@ -1366,13 +1579,13 @@ async def query_pdf_translated(
     """
     try:
         # 1. Traducir pregunta
-        translation_result = translator.translate_query(question, source_lang, target_lang)
+        translation_result = await executors.run_cpu(translator.translate_query, question, source_lang, target_lang)
         question_translated = translation_result["translated"]
         
         # 2. Determinar qué PDFs buscar
         if search_all:
             # Buscar en todos
-            all_results = db_svc.search_all_pdfs(db, question_translated)
+            all_results = await executors.run_io(db_svc.search_all_pdfs, db, question_translated)
             
             response = {
                 "original_question": question,
@@ -1392,7 +1605,7 @@ async def query_pdf_translated(
             
         elif len(filenames) > 1:
             # Búsqueda múltiple
-            multi_results = db_svc.search_multiple_pdfs(db, question_translated, filenames)
+            multi_results = await executors.run_io(db_svc.search_multiple_pdfs, db, question_translated, filenames)
             
             response = {
                 "original_question": question,
@@ -1421,19 +1634,21 @@ async def query_pdf_translated(
                 raise HTTPException(status_code=404, detail=f"Archivo {filename} no encontrado")
             
             # Intenta cache primero
-            cached_result = cache.get_cached_result(db, question_translated, [filename], "single")
+            cached_result = await executors.run_io(cache.get_cached_result, db, question_translated, [filename], "single")
             if cached_result:
                 query_result = cached_result
                 query_result["cached"] = True
             else:
                 # Procesa query
                 start_time = time.time()
-                query_result = generate_answer_with_pages(question_translated, file_path, filename)
+                pages_text = await executors.run_io(page_text.get_pages_text, db, filename, file_path)
+                query_result = await executors.run_cpu(generate_answer_with_pages, question_translated,
+                                                       pages_text, filename)
                 execution_time = time.time() - start_time
                 
                 # Guarda en cache
-                cache.cache_query_result(db, question_translated, [filename], "single", 
-                                        query_result, execution_time, ttl_hours=24)
+                await executors.run_io(cache.cache_query_result, db, question_translated, [filename], "single", 
+                                       query_result, execution_time, ttl_hours=24)
                 query_result["cached"] = False
             
             response = {
@@ -1454,7 +1669,8 @@ async def query_pdf_translated(
         
         # 3. Opcionalmente traducir resultado de vuelta
         if translate_result and response.get("answer"):
-            answer_translated_back = translator.translate_text(
+            answer_translated_back = await executors.run_cpu(
+                translator.translate_text,
                 response["answer"], 
                 source_lang=target_lang, 
                 target_lang=source_lang
@@ -1469,8 +1685,116 @@ async def query_pdf_translated(
         raise HTTPException(status_code=500, detail=f"Error en query traducida: {str(e)}")
 
 
+def write_translated_file(request: TranslatePdfRequest, translated_pages: Dict[int, str],
+                          translation_stats: Dict) -> str:
+    """Guardar la traducción como docx, PDF o TXT; retorna el nombre del archivo generado"""
+    # Crear nombre de archivo traducido
+    base_name = request.filename.rsplit('.', 1)[0]
+    if request.output_format == "docx":
+        file_extension = "docx"
+    elif request.output_format == "pdf":
+        file_extension = "pdf"
+    else:
+        file_extension = "txt"
+                
+    translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.{file_extension}"
+    translated_path = RESULTS_DIR / translated_filename
+            
+    if request.output_format == "docx":
+        # Crear documento Word
+        try:
+            from docx import Document
+            from docx.shared import Inches
+            from docx.enum.text import WD_ALIGN_PARAGRAPH
+                    
+            doc = Document()
+                    
+            # Agregar título principal
+            title = doc.add_heading(f"PDF Traducido: {request.filename}", 0)
+            title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    
+            # Agregar metadata
+            doc.add_paragraph(f"Idioma: {request.source_lang.upper()} → {request.target_lang.upper()}")
+            doc.add_paragraph(f"Páginas: {len(translated_pages)}")
+            doc.add_paragraph(f"Cobertura promedio: {translation_stats['average_coverage']}%")
+            doc.add_paragraph(f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            doc.add_paragraph()
+                    
+            # Agregar contenido por páginas
+            for page_num in sorted(translated_pages.keys()):
+                # Título de página
+                page_title = doc.add_heading(f"Página {page_num}", level=1)
+                        
+                # Contenido de la página
+                paragraphs = translated_pages[page_num].split('\n\n')
+                for paragraph_text in paragraphs:
+                    if paragraph_text.strip():
+                        doc.add_paragraph(paragraph_text.strip())
+                        
+                # Espacio entre páginas
+                doc.add_page_break()
+                    
+            doc.save(str(translated_path))
+                    
+        except ImportError:
+            # Si python-docx no está instalado, usar formato TXT
+            translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.txt"
+            translated_path = RESULTS_DIR / translated_filename
+            request.output_format = "txt"
+                    
+    elif request.output_format == "pdf":
+        # Crear PDF traducido manteniendo estructura
+        try:
+            from reportlab.lib.pagesizes import A4
+            from reportlab.pdfgen import canvas
+            from reportlab.lib.styles import getSampleStyleSheet
+            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+            from reportlab.lib.units import inch
+                    
+            doc = SimpleDocTemplate(str(translated_path), pagesize=A4)
+            styles = getSampleStyleSheet()
+            story = []
+                    
+            for page_num in sorted(translated_pages.keys()):
+                # Agregar título de página
+                title = Paragraph(f"<b>Página {page_num}</b>", styles['Heading2'])
+                story.append(title)
+                story.append(Spacer(1, 0.2*inch))
+                        
+                # Agregar contenido traducido
+                text = translated_pages[page_num].replace('\n', '<br/>')
+                content = Paragraph(text, styles['Normal'])
+                story.append(content)
+                story.append(Spacer(1, 0.3*inch))
+                    
+            doc.build(story)
+        except ImportError:
+            # Si reportlab no está instalado, usar formato TXT
+            translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.txt"
+            translated_path = RESULTS_DIR / translated_filename
+            request.output_format = "txt"
+            
+    if request.output_format == "txt":
+        # Guardar como TXT mejorado
+        with open(translated_path, 'w', encoding='utf-8') as f:
+            f.write(f"# PDF TRADUCIDO: {request.filename}\n")
+            f.write(f"# Idioma: {request.source_lang.upper()} → {request.target_lang.upper()}\n")
+            f.write(f"# Páginas: {len(translated_pages)}\n")
+            f.write(f"# Cobertura promedio: {translation_stats['average_coverage']}%\n")
+            f.write(f"# Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"\n{'='*80}\n\n")
+                    
+            for page_num in sorted(translated_pages.keys()):
+                f.write(f"{'='*60}\n")
+                f.write(f"PÁGINA {page_num}\n")
+                f.write(f"{'='*60}\n\n")
+                f.write(translated_pages[page_num])
+                f.write(f"\n\n{'='*60}\n\n")
+    
+    return translated_filename
+
 @app.post("/api/translate-pdf")
-async def translate_pdf_content(request: TranslatePdfRequest):
+async def translate_pdf_content(request: TranslatePdfRequest, db: Session = Depends(get_db)):
     """
     Traducir el contenido completo de un PDF (o páginas específicas)
     
@@ -1496,8 +1820,12 @@ async def translate_pdf_content(request: TranslatePdfRequest):
         if not file_path.exists():
             raise HTTPException(status_code=404, detail=f"Archivo {request.filename} no encontrado")
         
-        # Extraer texto del PDF por páginas
-        pdf_text_by_pages = extract_pdf_text_by_pages(file_path)
+        # Texto del PDF por páginas (guardado en BD; si falta, solo se extraen las páginas pedidas)
+        if request.pages:
+            pdf_text_by_pages = await executors.run_io(page_text.get_pages, db, request.filename,
+                                                       file_path, request.pages)
+        else:
+            pdf_text_by_pages = await executors.run_io(page_text.get_pages_text, db, request.filename, file_path)
         
         if not pdf_text_by_pages:
             raise HTTPException(status_code=400, detail="No se pudo extraer texto del PDF")
@@ -1547,9 +1875,11 @@ async def translate_pdf_content(request: TranslatePdfRequest):
                         translation_result = await ai_translator.translate_with_ai(paragraph.strip(), request.source_lang, request.target_lang)
                     except Exception as e:
                         # Fallback al diccionario local si falla la IA
-                        translation_result = translator.translate_query(paragraph.strip(), request.source_lang, request.target_lang)
+                        translation_result = await executors.run_cpu(translator.translate_query, paragraph.strip(),
+                                                                     request.source_lang, request.target_lang)
                 else:
-                    translation_result = translator.translate_query(paragraph.strip(), request.source_lang, request.target_lang)
+                    translation_result = await executors.run_cpu(translator.translate_query, paragraph.strip(),
+                                                                 request.source_lang, request.target_lang)
                     
                 translated_paragraph = translation_result["translated"]
                 translated_paragraphs.append(translated_paragraph)
@@ -1588,108 +1918,8 @@ async def translate_pdf_content(request: TranslatePdfRequest):
         # Guardar archivo traducido si se solicita
         translated_filename = None
         if request.save_translated:
-            # Crear nombre de archivo traducido
-            base_name = request.filename.rsplit('.', 1)[0]
-            if request.output_format == "docx":
-                file_extension = "docx"
-            elif request.output_format == "pdf":
-                file_extension = "pdf"
-            else:
-                file_extension = "txt"
-                
-            translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.{file_extension}"
-            translated_path = RESULTS_DIR / translated_filename
-            
-            if request.output_format == "docx":
-                # Crear documento Word
-                try:
-                    from docx import Document
-                    from docx.shared import Inches
-                    from docx.enum.text import WD_ALIGN_PARAGRAPH
-                    
-                    doc = Document()
-                    
-                    # Agregar título principal
-                    title = doc.add_heading(f"PDF Traducido: {request.filename}", 0)
-                    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    
-                    # Agregar metadata
-                    doc.add_paragraph(f"Idioma: {request.source_lang.upper()} → {request.target_lang.upper()}")
-                    doc.add_paragraph(f"Páginas: {len(translated_pages)}")
-                    doc.add_paragraph(f"Cobertura promedio: {translation_stats['average_coverage']}%")
-                    doc.add_paragraph(f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                    doc.add_paragraph()
-                    
-                    # Agregar contenido por páginas
-                    for page_num in sorted(translated_pages.keys()):
-                        # Título de página
-                        page_title = doc.add_heading(f"Página {page_num}", level=1)
-                        
-                        # Contenido de la página
-                        paragraphs = translated_pages[page_num].split('\n\n')
-                        for paragraph_text in paragraphs:
-                            if paragraph_text.strip():
-                                doc.add_paragraph(paragraph_text.strip())
-                        
-                        # Espacio entre páginas
-                        doc.add_page_break()
-                    
-                    doc.save(str(translated_path))
-                    
-                except ImportError:
-                    # Si python-docx no está instalado, usar formato TXT
-                    translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.txt"
-                    translated_path = RESULTS_DIR / translated_filename
-                    request.output_format = "txt"
-                    
-            elif request.output_format == "pdf":
-                # Crear PDF traducido manteniendo estructura
-                try:
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.pdfgen import canvas
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-                    from reportlab.lib.units import inch
-                    
-                    doc = SimpleDocTemplate(str(translated_path), pagesize=A4)
-                    styles = getSampleStyleSheet()
-                    story = []
-                    
-                    for page_num in sorted(translated_pages.keys()):
-                        # Agregar título de página
-                        title = Paragraph(f"<b>Página {page_num}</b>", styles['Heading2'])
-                        story.append(title)
-                        story.append(Spacer(1, 0.2*inch))
-                        
-                        # Agregar contenido traducido
-                        text = translated_pages[page_num].replace('\n', '<br/>')
-                        content = Paragraph(text, styles['Normal'])
-                        story.append(content)
-                        story.append(Spacer(1, 0.3*inch))
-                    
-                    doc.build(story)
-                except ImportError:
-                    # Si reportlab no está instalado, usar formato TXT
-                    translated_filename = f"{base_name}_{request.source_lang}_to_{request.target_lang}.txt"
-                    translated_path = RESULTS_DIR / translated_filename
-                    request.output_format = "txt"
-            
-            if request.output_format == "txt":
-                # Guardar como TXT mejorado
-                with open(translated_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# PDF TRADUCIDO: {request.filename}\n")
-                    f.write(f"# Idioma: {request.source_lang.upper()} → {request.target_lang.upper()}\n")
-                    f.write(f"# Páginas: {len(translated_pages)}\n")
-                    f.write(f"# Cobertura promedio: {translation_stats['average_coverage']}%\n")
-                    f.write(f"# Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"\n{'='*80}\n\n")
-                    
-                    for page_num in sorted(translated_pages.keys()):
-                        f.write(f"{'='*60}\n")
-                        f.write(f"PÁGINA {page_num}\n")
-                        f.write(f"{'='*60}\n\n")
-                        f.write(translated_pages[page_num])
-                        f.write(f"\n\n{'='*60}\n\n")
+            translated_filename = await executors.run_cpu(write_translated_file, request,
+                                                          translated_pages, translation_stats)
         
         return {
             "filename": request.filename,
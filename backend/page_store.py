@@ -0,0 +1,251 @@
+"""
+Almacén comprimido del texto por páginas
+Cada página es una fila de pdf_pages con clave (pdf_id, page_number) y el
+texto comprimido con zstd (si está instalado) o zlib. Así se puede leer una
+sola página sin cargar el documento entero y la BD ocupa menos. Junto al
+texto se guardan los inicios de línea de la página, y las páginas se leen
+como line_index.PageText.
+
+Migración desde las columnas antiguas full_text / text_by_pages:
+    python page_store.py --migrate [--vacuum]
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, func, null, text
+from typing import Dict, Iterable, Optional, Tuple
+import argparse
+import zlib
+import os
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+from database import PDFPage, PDFDocument, engine
+from line_index import PageText, as_page, pack_starts, unpack_starts
+
+# Codec para páginas nuevas: "zstd", "zlib" o "raw" (zstd cae a zlib si no está instalado)
+PAGE_CODEC = os.getenv("PAGE_CODEC", "zstd")
+ZSTD_LEVEL = int(os.getenv("PAGE_ZSTD_LEVEL", "3"))
+ZLIB_LEVEL = int(os.getenv("PAGE_ZLIB_LEVEL", "6"))
+
+
+# ========== COMPRESIÓN ==========
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """Codec efectivo según configuración y librerías disponibles"""
+    codec = (codec or PAGE_CODEC).lower()
+    if codec == "zstd" and zstd is None:
+        return "zlib"
+    if codec not in ("zstd", "zlib", "raw"):
+        return "zlib"
+    return codec
+
+
+def compress_text(page_text: str, codec: Optional[str] = None) -> Tuple[str, bytes]:
+    """Comprimir el texto de una página; retorna (codec, bytes)"""
+    codec = resolve_codec(codec)
+    raw = (page_text or "").encode("utf-8")
+    if codec == "zstd":
+        return codec, zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == "zlib":
+        return codec, zlib.compress(raw, ZLIB_LEVEL)
+    return codec, raw
+
+
+def decompress_text(codec: str, data: bytes) -> str:
+    """Descomprimir el texto de una página guardada con cualquier codec"""
+    if codec == "zstd":
+        if zstd is None:
+            raise RuntimeError("Página comprimida con zstd pero 'zstandard' no está instalado")
+        raw = zstd.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return raw.decode("utf-8")
+
+
+# ========== LECTURA Y ESCRITURA ==========
+
+def save_pages(db: Session, pdf_id: int, pages_text: Dict[int, str], commit: bool = True):
+    """Reemplazar todas las páginas guardadas de un PDF"""
+    db.query(PDFPage).filter(PDFPage.pdf_id == pdf_id).delete(synchronize_session=False)
+    rows = []
+    for page_number, page_text in pages_text.items():
+        page = as_page(page_text)
+        codec, data = compress_text(page)
+        rows.append({
+            "pdf_id": pdf_id,
+            "page_number": int(page_number),
+            "codec": codec,
+            "char_count": len(page),
+            "line_starts": pack_starts(page.line_starts),
+            "data": data
+        })
+    if rows:
+        db.execute(PDFPage.__table__.insert(), rows)
+    if commit:
+        db.commit()
+
+
+def _page(row) -> PageText:
+    # Páginas guardadas antes de line_starts: los inicios se calculan al leerlas
+    return PageText(decompress_text(row.codec, row.data), unpack_starts(row.line_starts))
+
+
+def load_pages(db: Session, pdf_id: int, pages: Optional[Iterable[int]] = None) -> Dict[int, PageText]:
+    """Leer el texto de un PDF (o solo de algunas páginas) ordenado por página"""
+    query = db.query(PDFPage.page_number, PDFPage.codec, PDFPage.data, PDFPage.line_starts)\
+        .filter(PDFPage.pdf_id == pdf_id)
+    if pages is not None:
+        query = query.filter(PDFPage.page_number.in_(sorted(set(pages))))
+    return {row.page_number: _page(row) for row in query.order_by(PDFPage.page_number)}
+
+
+def load_page(db: Session, pdf_id: int, page_number: int) -> Optional[PageText]:
+    """Leer una sola página (None si no existe)"""
+    row = db.query(PDFPage.codec, PDFPage.data, PDFPage.line_starts)\
+        .filter(PDFPage.pdf_id == pdf_id, PDFPage.page_number == page_number)\
+        .first()
+    return _page(row) if row else None
+
+
+def has_pages(db: Session, pdf_id: int) -> bool:
+    """El PDF tiene texto en el almacén de páginas"""
+    return db.query(PDFPage.pdf_id).filter(PDFPage.pdf_id == pdf_id).first() is not None
+
+
+def delete_pages(db: Session, pdf_id: int, commit: bool = True):
+    """Eliminar las páginas guardadas de un PDF"""
+    db.query(PDFPage).filter(PDFPage.pdf_id == pdf_id).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+
+
+def move_pages(db: Session, old_pdf_id: int, new_pdf_id: int, commit: bool = True):
+    """Pasar las páginas de un PDF a otro (promoción de un alias a canónico)"""
+    delete_pages(db, new_pdf_id, commit=False)
+    db.query(PDFPage).filter(PDFPage.pdf_id == old_pdf_id)\
+        .update({PDFPage.pdf_id: new_pdf_id}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+
+def storage_stats(db: Session) -> Dict:
+    """Tamaño del almacén: caracteres originales vs bytes comprimidos"""
+    pages, chars, stored = db.query(
+        func.count(PDFPage.pdf_id),
+        func.coalesce(func.sum(PDFPage.char_count), 0),
+        func.coalesce(func.sum(func.length(PDFPage.data)), 0)
+    ).one()
+    return {
+        "documents": db.query(func.count(func.distinct(PDFPage.pdf_id))).scalar(),
+        "pages": pages,
+        "text_chars": chars,
+        "stored_bytes": stored,
+        "compression_ratio": round(chars / stored, 2) if stored else None,
+        "codec": resolve_codec()
+    }
+
+
+# ========== MIGRACIÓN DESDE text_by_pages ==========
+
+# Registros que aún tienen texto en las columnas antiguas ('null' = JSON nulo)
+LEGACY_TEXT_FILTER = text("pdf_documents.text_by_pages IS NOT NULL AND pdf_documents.text_by_pages != 'null'")
+
+
+def migrate_document(db: Session, pdf_id: int) -> Dict[int, str]:
+    """Pasar el texto antiguo de un PDF al almacén de páginas y vaciar las columnas
+
+    Retorna el texto migrado ({} si el registro no tenía texto antiguo).
+    """
+    legacy = db.query(PDFDocument.text_by_pages).filter(PDFDocument.id == pdf_id).scalar()
+    pages_text = {int(page): page_text or "" for page, page_text in (legacy or {}).items()}
+    pages_text = dict(sorted(pages_text.items()))
+
+    if pages_text and not has_pages(db, pdf_id):
+        save_pages(db, pdf_id, pages_text, commit=False)
+    db.query(PDFDocument).filter(PDFDocument.id == pdf_id)\
+        .update({PDFDocument.full_text: None, PDFDocument.text_by_pages: null()},
+                synchronize_session=False)
+    db.commit()
+    return pages_text
+
+
+def migrate_legacy_text(db: Session) -> int:
+    """Migrar todos los PDFs con texto en full_text / text_by_pages
+
+    Cada documento se migra en su propia transacción; retorna cuántos se migraron.
+    """
+    pdf_ids = [row.id for row in db.query(PDFDocument.id).filter(LEGACY_TEXT_FILTER)]
+    # Los alias solo tenían un 'null' en la columna, pero también se limpian
+    db.query(PDFDocument).filter(PDFDocument.full_text.isnot(None) | PDFDocument.text_by_pages.isnot(None))\
+        .filter(~PDFDocument.id.in_(pdf_ids))\
+        .update({PDFDocument.full_text: None, PDFDocument.text_by_pages: null()},
+                synchronize_session=False)
+    db.commit()
+
+    for pdf_id in pdf_ids:
+        migrate_document(db, pdf_id)
+    if pdf_ids:
+        print(f"📦 Texto de {len(pdf_ids)} PDFs migrado al almacén de páginas")
+    return len(pdf_ids)
+
+
+def backfill_line_starts(db: Session) -> int:
+    """Guardar los inicios de línea de las páginas almacenadas sin ellos (una sola vez)"""
+    pdf_ids = [row.pdf_id for row in db.query(PDFPage.pdf_id).filter(PDFPage.line_starts.is_(None)).distinct()]
+    table = PDFPage.__table__
+    for pdf_id in pdf_ids:
+        rows = db.query(PDFPage.page_number, PDFPage.codec, PDFPage.data)\
+            .filter(PDFPage.pdf_id == pdf_id, PDFPage.line_starts.is_(None))
+        updates = [
+            {"b_pdf_id": pdf_id, "b_page": row.page_number,
+             "b_starts": pack_starts(as_page(decompress_text(row.codec, row.data)).line_starts)}
+            for row in rows
+        ]
+        db.execute(
+            table.update()
+            .where(table.c.pdf_id == bindparam("b_pdf_id"))
+            .where(table.c.page_number == bindparam("b_page"))
+            .values(line_starts=bindparam("b_starts")),
+            updates
+        )
+        db.commit()
+    if pdf_ids:
+        print(f"📏 Inicios de línea guardados para las páginas de {len(pdf_ids)} PDFs")
+    return len(pdf_ids)
+
+
+def vacuum():
+    """Compactar el archivo SQLite para liberar el espacio de las columnas vaciadas"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, DB_PATH
+
+    parser = argparse.ArgumentParser(description="Almacén comprimido de texto por páginas")
+    parser.add_argument("--migrate", action="store_true", help="Migrar full_text / text_by_pages")
+    parser.add_argument("--vacuum", action="store_true", help="Compactar la base de datos")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        size_before = DB_PATH.stat().st_size
+        if args.migrate:
+            migrated = migrate_legacy_text(db)
+            print(f"✅ PDFs migrados: {migrated}")
+        if args.vacuum:
+            db.close()
+            vacuum()
+            print(f"🧹 Base de datos: {size_before / 1024:.0f} KB → {DB_PATH.stat().st_size / 1024:.0f} KB")
+
+        stats = storage_stats(db)
+        print(f"📄 Páginas: {stats['pages']} de {stats['documents']} PDFs ({stats['codec']})")
+        print(f"🗜️ {stats['text_chars']} caracteres en {stats['stored_bytes']} bytes "
+              f"(ratio {stats['compression_ratio']})")
+    finally:
+        db.close()
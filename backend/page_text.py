@@ -0,0 +1,177 @@
+"""
+Capa de acceso al texto por páginas de los PDFs
+Todas las consultas, análisis y traducciones leen el texto desde aquí:
+primero de memoria, luego del almacén de páginas comprimido (page_store) y
+solo como último recurso se vuelve a extraer con PyPDF2 (texto ausente o
+desactualizado).
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import os
+
+from database import PDFDocument
+from line_index import as_page
+import db_services as db_svc
+import page_store
+from pdf_extractor import extract_pdf_text_by_pages, extract_pdf_pages
+
+# Número de documentos cuyo texto se mantiene en memoria
+PAGE_TEXT_CACHE_DOCS = int(os.getenv("PAGE_TEXT_CACHE_DOCS", "16"))
+
+# filename -> ((file_size, file_mtime), {page_num: text})
+_memory_cache: "OrderedDict[str, Tuple[Tuple, Dict[int, str]]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+# ========== CACHÉ EN MEMORIA ==========
+
+def _memory_get(filename: str, version: Tuple) -> Optional[Dict[int, str]]:
+    with _memory_lock:
+        entry = _memory_cache.get(filename)
+        if entry is None or entry[0] != version:
+            return None
+        _memory_cache.move_to_end(filename)
+        return entry[1]
+
+
+def _memory_put(filename: str, version: Tuple, pages_text: Dict[int, str]):
+    with _memory_lock:
+        _memory_cache[filename] = (version, pages_text)
+        _memory_cache.move_to_end(filename)
+        while len(_memory_cache) > PAGE_TEXT_CACHE_DOCS:
+            _memory_cache.popitem(last=False)
+
+
+def forget(filename: str):
+    """Olvidar el texto en memoria de un PDF (eliminado o re-subido)"""
+    with _memory_lock:
+        _memory_cache.pop(filename, None)
+
+
+# ========== ACCESO AL TEXTO ==========
+
+def file_signature(file_path: Path) -> Optional[Tuple[int, float]]:
+    """Tamaño y mtime del archivo en disco (None si no existe)"""
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def is_stale(file_size: Optional[int], file_mtime: Optional[float],
+             signature: Optional[Tuple[int, float]]) -> bool:
+    """El texto guardado no corresponde al archivo actual en disco"""
+    if signature is None:
+        # Sin archivo solo queda el texto guardado
+        return False
+    size, mtime = signature
+    if file_size is not None and file_size != size:
+        return True
+    if file_mtime is not None and abs(file_mtime - mtime) > 1e-6:
+        return True
+    return False
+
+
+def get_pages_text(db: Session, filename: str, file_path: Path) -> Dict[int, str]:
+    """Obtener el texto por páginas de un PDF sin re-parsearlo si ya está guardado"""
+    signature = file_signature(file_path)
+
+    # Solo metadata: no cargar los blobs de texto todavía
+    meta = db.query(PDFDocument.id, PDFDocument.file_size, PDFDocument.file_mtime,
+                    PDFDocument.canonical_id)\
+        .filter(PDFDocument.filename == filename)\
+        .first()
+
+    if meta and not is_stale(meta.file_size, meta.file_mtime, signature):
+        # Los duplicados leen el texto del PDF canónico
+        text_id = meta.canonical_id or meta.id
+        version = (text_id, meta.file_size, meta.file_mtime)
+        pages_text = _memory_get(filename, version)
+        if pages_text is not None:
+            return pages_text
+
+        # Registros anteriores al almacén de páginas se migran al leerlos
+        pages_text = page_store.load_pages(db, text_id) or page_store.migrate_document(db, text_id)
+        if pages_text:
+            _memory_put(filename, version, pages_text)
+            return pages_text
+
+    if signature is None:
+        raise FileNotFoundError(f"Archivo {filename} no encontrado")
+
+    # Texto ausente o desactualizado: extraer y guardar
+    pages_text = extract_pdf_text_by_pages(file_path)
+    store_pages_text(db, filename, file_path, pages_text, signature)
+    return pages_text
+
+
+def get_pages(db: Session, filename: str, file_path: Path, pages: Iterable[int]) -> Dict[int, str]:
+    """Obtener solo algunas páginas de un PDF
+    
+    Si el texto guardado está al día se leen solo esas filas del almacén
+    de páginas; si no, se extraen únicamente las páginas pedidas (con
+    caché por página) sin tocar la BD.
+    """
+    wanted = sorted(set(pages))
+    signature = file_signature(file_path)
+
+    meta = db.query(PDFDocument.id, PDFDocument.file_size, PDFDocument.file_mtime,
+                    PDFDocument.canonical_id)\
+        .filter(PDFDocument.filename == filename)\
+        .first()
+    if meta and not is_stale(meta.file_size, meta.file_mtime, signature):
+        text_id = meta.canonical_id or meta.id
+        pages_text = _memory_get(filename, (text_id, meta.file_size, meta.file_mtime))
+        if pages_text is None:
+            pages_text = page_store.load_pages(db, text_id, wanted)
+            if not pages_text and not page_store.has_pages(db, text_id):
+                pages_text = get_pages_text(db, filename, file_path)
+        return {page: pages_text[page] for page in wanted if page in pages_text}
+
+    if signature is None:
+        raise FileNotFoundError(f"Archivo {filename} no encontrado")
+    return extract_pdf_pages(file_path, wanted)
+
+
+def get_full_text(db: Session, filename: str, file_path: Path) -> str:
+    """Obtener el texto completo de un PDF (páginas unidas por salto de línea)"""
+    pages_text = get_pages_text(db, filename, file_path)
+    return "\n".join(pages_text.values())
+
+
+def store_pages_text(db: Session, filename: str, file_path: Path, pages_text: Dict[int, str],
+                     signature: Optional[Tuple[int, float]] = None,
+                     content_hash: Optional[str] = None) -> PDFDocument:
+    """Guardar (o actualizar) el texto extraído de un PDF en la base de datos"""
+    signature = signature or file_signature(file_path)
+    file_size, file_mtime = signature if signature else (None, None)
+    # Los inicios de línea se calculan aquí una vez: se guardan con cada
+    # página y el dict (el del llamador, que queda en memoria) lleva PageText
+    for page_num, text in pages_text.items():
+        pages_text[page_num] = as_page(text)
+    full_text = "\n".join(pages_text.values())
+
+    pdf = db_svc.get_pdf_by_filename(db, filename)
+    if pdf:
+        db_svc.update_pdf_text(db, filename, full_text, pages_text,
+                               file_size=file_size, file_mtime=file_mtime,
+                               content_hash=content_hash)
+    else:
+        pdf = db_svc.create_pdf_document(
+            db=db,
+            filename=filename,
+            file_path=str(file_path),
+            file_size=file_size or 0,
+            total_pages=len(pages_text),
+            full_text=full_text,
+            text_by_pages=pages_text,
+            file_mtime=file_mtime,
+            content_hash=content_hash
+        )
+
+    _memory_put(filename, (pdf.id, file_size, file_mtime), pages_text)
+    return pdf
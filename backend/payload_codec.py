@@ -0,0 +1,161 @@
+"""
+Codec de los resultados guardados en la BD (query_cache y query_history)
+Los resultados se guardaban como JSON en texto plano, con la respuesta
+completa y las vistas previas de cada ubicación. Ahora se guardan como
+bytes: una cabecera de 8 bytes seguida del JSON (orjson si está instalado)
+comprimido con zstd o zlib.
+
+Cabecera: b"PC" | versión (1 byte) | compresión (1 byte) | tamaño del JSON
+sin comprimir (uint32 little-endian). El tamaño permite medir un resultado
+(p. ej. para el presupuesto de L1) sin descomprimirlo y detectar, al
+decodificar, cuerpos truncados. Un payload ilegible lanza ValueError.
+
+decode_payload también acepta el formato anterior (str o bytes de JSON sin
+cabecera), así que las filas antiguas se leen igual antes de migrarlas:
+    python payload_codec.py --migrate [--vacuum]
+"""
+from typing import Any, Optional
+import argparse
+import json
+import os
+import struct
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# Compresión de los resultados nuevos: "zstd", "zlib" o "raw" (zstd cae a zlib si no está instalado)
+PAYLOAD_CODEC = os.getenv("PAYLOAD_CODEC", "zstd")
+# Resultados más pequeños se guardan sin comprimir (no compensa)
+PAYLOAD_MIN_BYTES = int(os.getenv("PAYLOAD_MIN_BYTES", "256"))
+PAYLOAD_ZSTD_LEVEL = int(os.getenv("PAYLOAD_ZSTD_LEVEL", "3"))
+PAYLOAD_ZLIB_LEVEL = int(os.getenv("PAYLOAD_ZLIB_LEVEL", "6"))
+
+MAGIC = b"PC"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+CODECS = {"raw": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {code: name for name, code in CODECS.items()}
+DECOMPRESS_ERRORS = (zlib.error,) + ((zstd.ZstdError,) if zstd is not None else ())
+
+
+# ========== SERIALIZACIÓN ==========
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """Compresión efectiva según configuración y librerías disponibles"""
+    codec = (codec or PAYLOAD_CODEC).lower()
+    if codec == "zstd" and zstd is None:
+        return "zlib"
+    if codec not in CODECS:
+        return "zlib"
+    return codec
+
+
+def dumps(value: Any) -> bytes:
+    """JSON en UTF-8 (orjson si está instalado; json para lo que orjson no acepta)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def encode_payload(value: Any, codec: Optional[str] = None) -> bytes:
+    """Serializar y comprimir un resultado con su cabecera"""
+    raw = dumps(value)
+    codec = resolve_codec(codec) if len(raw) >= PAYLOAD_MIN_BYTES else "raw"
+    if codec == "zstd":
+        body = zstd.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL).compress(raw)
+    elif codec == "zlib":
+        body = zlib.compress(raw, PAYLOAD_ZLIB_LEVEL)
+    else:
+        body = raw
+    return HEADER.pack(MAGIC, VERSION, CODECS[codec], len(raw)) + body
+
+
+def is_encoded(data) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:2]) == MAGIC
+
+
+def payload_size(data) -> int:
+    """Tamaño del JSON sin comprimir (también para el formato anterior)"""
+    if data is None:
+        return 0
+    if is_encoded(data):
+        return HEADER.unpack_from(data)[3]
+    return len(data)
+
+
+def decode_payload(data) -> Any:
+    """Resultado guardado con encode_payload o como JSON (formato anterior)
+
+    Raises:
+        ValueError: payload truncado o corrupto, o versión o compresión desconocidas
+        RuntimeError: payload zstd sin 'zstandard' instalado
+    """
+    if data is None:
+        return None
+    if not is_encoded(data):
+        return loads(data)
+    if len(data) < HEADER.size:
+        raise ValueError(f"Payload truncado: {len(data)} bytes, la cabecera tiene {HEADER.size}")
+    _, version, code, size = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Versión de payload desconocida: {version}")
+    body = memoryview(data)[HEADER.size:]
+    codec = CODEC_NAMES.get(code)
+    try:
+        if codec == "zstd":
+            if zstd is None:
+                raise RuntimeError("Resultado comprimido con zstd pero 'zstandard' no está instalado")
+            raw = zstd.ZstdDecompressor().decompress(body, max_output_size=size)
+        elif codec == "zlib":
+            raw = zlib.decompress(body)
+        elif codec == "raw":
+            raw = bytes(body)
+        else:
+            raise ValueError(f"Compresión de payload desconocida: {code}")
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError(f"Payload corrupto: {e}") from e
+    # La cabecera guarda el tamaño del JSON: detecta cuerpos truncados (también sin comprimir)
+    if len(raw) != size:
+        raise ValueError(f"Payload truncado o corrupto: {len(raw)} bytes de {size}")
+    return loads(raw)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, DB_PATH
+    from page_store import vacuum
+    import cache_manager
+    import db_services
+
+    parser = argparse.ArgumentParser(description="Resultados de query_cache y query_history en binario")
+    parser.add_argument("--migrate", action="store_true", help="Pasar los resultados en JSON al formato binario")
+    parser.add_argument("--vacuum", action="store_true", help="Compactar la base de datos")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        size_before = DB_PATH.stat().st_size
+        if args.migrate:
+            print(f"✅ Entradas del caché migradas: {cache_manager.migrate_legacy_payloads(db)}")
+            print(f"✅ Consultas del historial migradas: {db_services.migrate_history_results(db)}")
+        if args.vacuum:
+            db.close()
+            vacuum()
+            print(f"🧹 Base de datos: {size_before / 1024:.0f} KB → {DB_PATH.stat().st_size / 1024:.0f} KB")
+        print(f"🗜️ Codec: {resolve_codec()} ({'orjson' if orjson is not None else 'json'})")
+    finally:
+        db.close()
@@ -0,0 +1,212 @@
+"""
+Extracción de texto de PDFs con PyPDF2
+Los PDFs grandes se reparten por rangos de páginas en un pool de procesos.
+Las páginas sueltas se extraen bajo demanda con caché por (hash, página).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import hashlib
+import os
+import PyPDF2
+
+# Procesos para extracción paralela (0 = número de CPUs, 1 = siempre serial)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0")) or (os.cpu_count() or 1)
+# Por debajo de este número de páginas la extracción es serial
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "64"))
+
+# Páginas extraídas bajo demanda que se mantienen en memoria
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "2048"))
+# Archivos cuyo SHA-256 se recuerda (LRU; una entrada por ruta)
+HASH_MEMO_SIZE = int(os.getenv("HASH_MEMO_SIZE", "1024"))
+# Máximo de páginas en un rango "inicio-fin"
+MAX_PAGE_RANGE = 10000
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# (content_hash, page_num) -> texto
+_page_cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+# ruta -> (tamaño, mtime_ns, content_hash)
+_hash_memo: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def extract_pdf_text(file_path: Path) -> str:
+    """Extraer todo el texto de un PDF"""
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            text = ""
+            for page in pdf_reader.pages:
+                text += page.extract_text() + "\n"
+        return text
+    except Exception as e:
+        raise Exception(f"Error extrayendo texto del PDF: {str(e)}")
+
+
+def extract_pdf_text_by_pages(file_path: Path, workers: Optional[int] = None) -> Dict[int, str]:
+    """Extraer texto de un PDF separado por páginas
+
+    Si el PDF tiene al menos PARALLEL_MIN_PAGES páginas y hay más de un
+    worker, las páginas se reparten en rangos entre procesos.
+    """
+    workers = workers or EXTRACTION_WORKERS
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            total_pages = len(pdf_reader.pages)
+
+            if workers <= 1 or total_pages < PARALLEL_MIN_PAGES:
+                pages_text = {}
+                for page_num, page in enumerate(pdf_reader.pages, start=1):
+                    pages_text[page_num] = page.extract_text()
+                return pages_text
+
+        return _extract_parallel(file_path, total_pages, workers)
+    except Exception as e:
+        raise Exception(f"Error extrayendo texto del PDF: {str(e)}")
+
+
+# ========== EXTRACCIÓN POR RANGO DE PÁGINAS ==========
+
+def file_content_hash(file_path: Path) -> str:
+    """SHA-256 del archivo, memorizado mientras no cambien tamaño ni mtime"""
+    stat = os.stat(file_path)
+    key = str(file_path)
+    with _cache_lock:
+        cached = _hash_memo.get(key)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            _hash_memo.move_to_end(key)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    with _cache_lock:
+        # Reemplaza la entrada de una versión anterior del mismo archivo
+        _hash_memo[key] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        _hash_memo.move_to_end(key)
+        while len(_hash_memo) > HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return content_hash
+
+
+def extract_pdf_pages(file_path: Path, pages: Iterable[int],
+                      content_hash: Optional[str] = None) -> Dict[int, str]:
+    """Extraer solo las páginas pedidas (numeradas desde 1)
+
+    Cada página se guarda en una caché LRU con clave (hash del documento,
+    página); las páginas fuera de rango se ignoran.
+    """
+    content_hash = content_hash or file_content_hash(file_path)
+    wanted = sorted(set(pages))
+
+    pages_text: Dict[int, str] = {}
+    missing = []
+    with _cache_lock:
+        for page_num in wanted:
+            key = (content_hash, page_num)
+            if key in _page_cache:
+                _page_cache.move_to_end(key)
+                pages_text[page_num] = _page_cache[key]
+            else:
+                missing.append(page_num)
+
+    if missing:
+        try:
+            with open(file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                total_pages = len(pdf_reader.pages)
+                for page_num in missing:
+                    if 1 <= page_num <= total_pages:
+                        pages_text[page_num] = pdf_reader.pages[page_num - 1].extract_text()
+        except Exception as e:
+            raise Exception(f"Error extrayendo texto del PDF: {str(e)}")
+
+        with _cache_lock:
+            for page_num in missing:
+                if page_num in pages_text:
+                    _page_cache[(content_hash, page_num)] = pages_text[page_num]
+            while len(_page_cache) > PAGE_CACHE_SIZE:
+                _page_cache.popitem(last=False)
+
+    return dict(sorted(pages_text.items()))
+
+
+def parse_page_ranges(spec: str) -> List[int]:
+    """Convertir "1-3,7" en [1, 2, 3, 7]"""
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = int(part.split("-", 1)[0]), int(part.split("-", 1)[1])
+            if end - start >= MAX_PAGE_RANGE:
+                raise ValueError(f"Rango de páginas demasiado grande: {part}")
+            pages.update(range(start, end + 1))
+        else:
+            pages.add(int(part))
+    return sorted(pages)
+
+
+# ========== EXTRACCIÓN PARALELA ==========
+
+def split_page_ranges(total_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """Dividir [1, total_pages] en rangos contiguos (inicio, fin) de tamaño similar"""
+    parts = max(1, min(parts, total_pages))
+    size, extra = divmod(total_pages, parts)
+    ranges = []
+    start = 1
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extraer las páginas start..end (inclusive); se ejecuta en un proceso worker"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(page_num, pdf_reader.pages[page_num - 1].extract_text())
+                for page_num in range(start, end + 1)]
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+        return _process_pool
+
+
+def _extract_parallel(file_path: Path, total_pages: int, workers: int) -> Dict[int, str]:
+    """Repartir los rangos de páginas entre procesos y unir en orden de página"""
+    pool = _get_process_pool()
+    futures = [
+        pool.submit(_extract_page_range, str(file_path), start, end)
+        for start, end in split_page_ranges(total_pages, workers)
+    ]
+
+    pages_text = {}
+    # Los futures están en orden de rango, así que el dict queda ordenado por página
+    for future in futures:
+        for page_num, text in future.result():
+            pages_text[page_num] = text
+    return pages_text
+
+
+def shutdown_extraction_pool():
+    """Cerrar el pool de procesos (al apagar el servidor)"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
@@ -0,0 +1,104 @@
+"""
+Análisis de preguntas y forma canónica de una consulta
+analyze_question extrae el tipo de pregunta y las palabras clave, que son
+lo único que usa la búsqueda. Dos preguntas con el mismo tipo, las mismas
+palabras clave y los mismos documentos dan el mismo resultado, así que
+la clave de caché puede construirse con esa forma canónica en lugar del
+texto literal ("Qué es AutoVR?" y "que es autovr" → definition|autovr).
+El texto original solo se conserva para mostrarlo.
+
+Modos de clave (CACHE_KEY_MODE en cache_manager):
+- raw:       texto de la pregunta en minúsculas (comportamiento anterior)
+- canonical: tipo + palabras clave (en el orden de la pregunta) + documentos
+- folded:    canonical con las palabras clave sin acentos. La búsqueda sí
+             distingue acentos ("configuracao" no encuentra "configuração"),
+             así que este modo puede devolver el resultado de la variante
+             que se preguntó primero
+"""
+from typing import Dict, List, Optional
+import unicodedata
+import re
+
+KEY_MODES = ("raw", "canonical", "folded")
+
+# Palabras comunes que no se buscan
+STOP_WORDS = {
+    'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas',
+    'de', 'del', 'al', 'a', 'en', 'con', 'por', 'para',
+    'qué', 'que', 'cómo', 'como', 'cuándo', 'cuando',
+    'dónde', 'donde', 'por', 'es', 'está', 'son', 'están',
+    'the', 'a', 'an', 'in', 'on', 'at', 'to', 'for',
+    'what', 'how', 'when', 'where', 'why', 'is', 'are'
+}
+
+
+def analyze_question(question: str) -> Dict:
+    """Analizar la pregunta para extraer palabras clave y tipo de consulta"""
+    question_lower = question.lower()
+
+    # Identificar tipo de pregunta
+    question_type = "general"
+    if any(word in question_lower for word in ["qué", "que", "what"]):
+        question_type = "definition"
+    elif any(word in question_lower for word in ["cómo", "como", "how"]):
+        question_type = "process"
+    elif any(word in question_lower for word in ["cuándo", "cuando", "when"]):
+        question_type = "temporal"
+    elif any(word in question_lower for word in ["dónde", "donde", "where"]):
+        question_type = "location"
+    elif any(word in question_lower for word in ["por qué", "porque", "why"]):
+        question_type = "reason"
+    elif any(word in question_lower for word in ["cuánto", "cuanto", "how much", "how many"]):
+        question_type = "quantity"
+
+    # Extraer palabras clave (remover palabras comunes)
+    words = re.findall(r'\w+', question_lower)
+    # Sin repetir (una clave repetida contaría dos veces sus coincidencias)
+    keywords = list(dict.fromkeys(word for word in words if len(word) > 3 and word not in STOP_WORDS))
+
+    return {
+        "type": question_type,
+        "keywords": keywords[:5]  # Limitar a 5 palabras clave principales
+    }
+
+
+def fold_accents(text: str) -> str:
+    """Quitar tildes y diacríticos ("configuração" → "configuracao")"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def canonical_query(question: str, fold: bool = False) -> Optional[str]:
+    """Forma canónica de una pregunta: "tipo|clave1 clave2..." (None si no tiene palabras clave)"""
+    analysis = analyze_question(question)
+    keywords = analysis["keywords"]
+    if not keywords:
+        return None
+    if fold:
+        keywords = [fold_accents(keyword) for keyword in keywords]
+    # El orden de las claves se mantiene: es el orden de los resultados por palabra clave
+    return f"{analysis['type']}|{' '.join(keywords)}"
+
+
+def cache_key(question: str, pdf_files: Optional[List[str]] = None, search_type: str = "single",
+              variant: str = "", mode: str = "raw", versions: Optional[Dict[str, str]] = None) -> str:
+    """Texto que identifica una consulta en el caché según el modo de clave
+
+    Las preguntas sin palabras clave usan siempre el texto literal.
+    versions ({archivo: content_hash}) agrega la versión de cada documento:
+    al cambiar el contenido de un PDF sus consultas cambian de clave.
+    """
+    query = None
+    if mode in ("canonical", "folded"):
+        query = canonical_query(question, fold=mode == "folded")
+    if query is None:
+        query = question.lower().strip()
+
+    # Ordenar PDFs para consistencia
+    pdfs_sorted = sorted(pdf_files) if pdf_files else []
+    key = f"{query}|{search_type}|{','.join(pdfs_sorted)}"
+    if variant:
+        key += f"|{variant}"
+    if versions and pdfs_sorted:
+        key += "|v:" + ",".join(versions.get(name) or "" for name in pdfs_sorted)
+    return key
@@ -0,0 +1,411 @@
+"""
+Motores de búsqueda para /query y /query-multiple
+- scan: recorre todas las páginas del documento con el matcher
+- index: el índice invertido (search_index) elige las páginas candidatas
+  y solo esas pasan por el matcher (mismos resultados que scan)
+- fts: SQLite FTS5 por prefijo de palabra; el contexto es el snippet de FTS
+
+El motor se elige por petición ("engine") o globalmente con QUERY_ENGINE.
+Con cualquier motor las páginas y los documentos se ordenan por BM25
+(ranking.py).
+Los documentos que no están en el índice del motor elegido se buscan con
+el siguiente motor disponible (fts → index → scan).
+
+Las búsquedas en varios documentos se reparten en un pool acotado de
+threads, cada documento con su propia sesión y un plazo máximo; los
+resultados se pueden consumir a medida que cada documento termina. Antes
+de repartirlos, la matriz término × página del corpus (term_matrix.py)
+dice en una sola búsqueda qué documentos indexados contienen las claves,
+en qué páginas y con qué puntaje: los que no tienen coincidencias ni se
+abren, y los demás solo leen sus páginas candidatas.
+"""
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from sqlalchemy.orm import Session
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import threading
+import heapq
+import math
+import time
+import os
+
+from database import PDFDocument, SessionLocal
+import fts_search as fts
+import inverted_index
+import page_text
+import ranking
+import term_matrix
+import text_matcher
+
+ENGINES = ("scan", "index", "fts")
+
+# Motor por defecto si la petición no indica ninguno
+QUERY_ENGINE = os.getenv("QUERY_ENGINE", "index")
+# Documentos que se buscan a la vez en /query-multiple
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+# Segundos máximos de búsqueda por documento
+DOCUMENT_TIMEOUT = float(os.getenv("DOCUMENT_TIMEOUT", "10"))
+# Documentos más relevantes con detalle (ubicaciones y vistas previas) en /query-multiple
+TOP_DOCUMENTS = int(os.getenv("TOP_DOCUMENTS", "10"))
+# Páginas con detalle por documento
+TOP_PAGES_PER_DOCUMENT = 3
+
+
+def resolve_engine(engine: Optional[str] = None) -> str:
+    """Motor a usar para una petición
+
+    Raises:
+        ValueError: si el motor no existe
+    """
+    engine = (engine or QUERY_ENGINE).lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de búsqueda desconocido: {engine} (opciones: {', '.join(ENGINES)})")
+    return engine
+
+
+def cache_variant(engine: str) -> str:
+    """Variante de la clave de caché: una por motor
+
+    scan e index encuentran lo mismo, pero la respuesta incluye el motor
+    usado; si compartieran entrada, un hit devolvería el del otro motor.
+    """
+    return "" if engine == "index" else engine
+
+
+def _fts_source(db: Session, filename: str, file_path: Path) -> Optional[Tuple[int, int]]:
+    """(pdf_id con las páginas en FTS, total de páginas) si el PDF está indexado y al día"""
+    meta = db.query(PDFDocument.id, PDFDocument.canonical_id, PDFDocument.file_size,
+                    PDFDocument.file_mtime, PDFDocument.total_pages)\
+        .filter(PDFDocument.filename == filename)\
+        .first()
+    if not meta or page_text.is_stale(meta.file_size, meta.file_mtime, page_text.file_signature(file_path)):
+        return None
+
+    text_id = meta.canonical_id or meta.id
+    try:
+        if not fts.is_pdf_indexed(db, text_id):
+            return None
+    except Exception:
+        # Tabla FTS sin crear
+        db.rollback()
+        return None
+    return text_id, meta.total_pages or 0
+
+
+def _load_pages(db: Session, filename: str, file_path: Path, keywords: List[str],
+                engine: str, document: Optional[Dict] = None) -> Tuple[Dict[int, str], int, str]:
+    """Páginas a pasar por el matcher según el motor (index o scan)
+
+    document: páginas con coincidencias según la matriz del corpus (no hace
+    falta consultar el índice del PDF)
+    """
+    if engine == "index" and document is not None:
+        pages = document["pages"]
+        pages_text = page_text.get_pages(db, filename, file_path, pages) if pages else {}
+        return pages_text, document["total_pages"], "index"
+    if engine == "index":
+        pages_text, total_pages, used_index = inverted_index.get_query_pages(db, filename, file_path, keywords)
+        # Sin índice utilizable (claves cortas, PDF sin indexar o desactualizado) se escaneó todo
+        return pages_text, total_pages, "index" if used_index else "scan"
+    pages_text = page_text.get_pages_text(db, filename, file_path)
+    return pages_text, len(pages_text), "scan"
+
+
+def find_matches(db: Session, filename: str, file_path: Path, keywords: List[str],
+                 engine: str) -> Tuple[List[Dict], int, str, Optional[Dict[int, float]]]:
+    """Buscar las palabras clave en un PDF con el motor indicado
+
+    Returns:
+        (resultados por palabra clave y página, total de páginas, motor usado,
+         puntaje BM25 por página o None)
+    """
+    if engine == "fts":
+        source = _fts_source(db, filename, file_path)
+        if source:
+            text_id, total_pages = source
+            page_scores = ranking.score_pages(db, filename, file_path, keywords)
+            return fts.fts_keyword_matches(db, text_id, keywords), total_pages, "fts", page_scores
+        engine = "index"
+
+    pages_text, total_pages, engine = _load_pages(db, filename, file_path, keywords, engine)
+    page_scores = ranking.score_pages(db, filename, file_path, keywords, pages_text)
+    return text_matcher.get_matcher(keywords).search_pages(pages_text), total_pages, engine, page_scores
+
+
+def summarize_matches(db: Session, filename: str, file_path: Path, keywords: List[str], engine: str,
+                      detail_pages: int = 3,
+                      wants_detail: Optional[Callable[[Tuple[float, int]], bool]] = None,
+                      stats: Optional[Dict] = None, document: Optional[Dict] = None) -> Dict:
+    """Resumen de coincidencias de un PDF: conteo exacto y detalle de las mejores páginas
+
+    wants_detail recibe la clave de relevancia del documento (puntaje, coincidencias).
+    document: páginas y puntajes del PDF según la matriz del corpus (CorpusHits.document).
+
+    Returns:
+        {"matches", "score", "pages_found", "locations", "total_pages", "engine"}
+    """
+    if engine == "fts":
+        source = _fts_source(db, filename, file_path)
+        if source:
+            text_id, total_pages = source
+            page_scores = document["page_scores"] if document else \
+                ranking.score_pages(db, filename, file_path, keywords, stats=stats)
+            score = ranking.document_score(page_scores)
+            results = fts.fts_keyword_matches(db, text_id, keywords)
+            summary = text_matcher.summarize_results(results, detail_pages,
+                                                     _detail_callback(wants_detail, score), page_scores)
+            return {**summary, "score": round(score, 4), "total_pages": total_pages, "engine": "fts"}
+        engine = "index"
+
+    pages_text, total_pages, engine = _load_pages(db, filename, file_path, keywords, engine, document)
+    page_scores = document["page_scores"] if document else \
+        ranking.score_pages(db, filename, file_path, keywords, pages_text, stats)
+    score = ranking.document_score(page_scores)
+    summary = text_matcher.get_matcher(keywords).summarize_pages(
+        pages_text, detail_pages, _detail_callback(wants_detail, score), page_scores
+    )
+    return {**summary, "score": round(score, 4), "total_pages": total_pages, "engine": engine}
+
+
+def _detail_callback(wants_detail: Optional[Callable[[Tuple[float, int]], bool]],
+                     score: float) -> Optional[Callable[[int], bool]]:
+    if wants_detail is None:
+        return None
+    return lambda matches: wants_detail((score, matches))
+
+
+def relevance_key(document: Dict) -> Tuple[float, int]:
+    """Clave de relevancia de un documento: puntaje BM25 y, en empate, coincidencias"""
+    return document.get("score", 0.0), document["matches"]
+
+
+class TopKDocuments:
+    """Los k documentos más relevantes (heap de mínimos, seguro entre threads)
+
+    Permite saber si un documento todavía puede entrar en el top-k antes de
+    construir sus contextos. En empate gana el que va antes en la petición.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[Tuple[float, int], int]] = []  # (relevancia, -índice)
+        self._lock = threading.Lock()
+
+    def could_enter(self, key: Tuple[float, int], index: int) -> bool:
+        with self._lock:
+            return len(self._heap) < self.k or (key, -index) > self._heap[0]
+
+    def add(self, key: Tuple[float, int], index: int) -> Optional[int]:
+        """Registrar un documento; retorna el índice del documento desplazado (o None)"""
+        with self._lock:
+            entry = (key, -index)
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, entry)
+                return None
+            if entry > self._heap[0]:
+                return -heapq.heapreplace(self._heap, entry)[1]
+            return index
+
+
+# ========== BÚSQUEDA EN VARIOS DOCUMENTOS ==========
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    with _pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+        return _search_pool
+
+
+def _search_document(filename: str, file_path: Path, keywords: List[str], engine: str,
+                     state: Dict, index: int, top: TopKDocuments, stats: Optional[Dict],
+                     document: Optional[Dict]) -> Dict:
+    """Buscar en un documento con una sesión propia (se ejecuta en el pool)"""
+    state["started"] = time.monotonic()
+    db = SessionLocal()
+    try:
+        return summarize_matches(db, filename, file_path, keywords, engine,
+                                 detail_pages=TOP_PAGES_PER_DOCUMENT,
+                                 wants_detail=lambda key: top.could_enter(key, index),
+                                 stats=stats, document=document)
+    finally:
+        db.close()
+
+
+def iter_documents(upload_dir: Path, filenames: List[str], keywords: List[str], engine: str,
+                   top: TopKDocuments, timeout: Optional[float] = None,
+                   corpus: Optional[term_matrix.CorpusHits] = None) -> Iterator[Tuple[str, int, Dict]]:
+    """Buscar en varios documentos en paralelo y emitir cada resultado al terminar
+
+    Cada documento tiene `timeout` segundos desde que empieza a buscarse. El
+    pool es compartido con las demás peticiones: los documentos que siguen
+    en cola cuando vence el plazo total se cancelan y se reportan como
+    "queued" (no llegaron a buscarse). El consumidor registra en `top` los documentos recibidos (top.add); los
+    workers lo consultan para decidir si construyen el detalle.
+    Con los motores scan e index, los documentos que según `corpus`
+    (corpus_hits) no contienen ninguna clave no se buscan.
+
+    Yields:
+        ("document", índice en filenames, {"filename", "matches", "score", "pages_found",
+                                           "locations", "total_pages", "engine"})
+        ("failed", índice en filenames, {"filename", "reason": "not_found" | "timeout" | "queued" | "error",
+                                         "error"})
+    """
+    timeout = DOCUMENT_TIMEOUT if timeout is None else timeout
+    pool = _get_search_pool()
+    if corpus is None:
+        corpus = corpus_hits(upload_dir, filenames, keywords)
+    stats = corpus.stats if corpus else _corpus_statistics(keywords)
+
+    tasks: Dict[Future, Tuple[int, str, Dict]] = {}
+    missing: List[Tuple[int, str]] = []
+    for index, filename in enumerate(filenames):
+        file_path = upload_dir / filename
+        if not file_path.exists():
+            missing.append((index, filename))
+            continue
+        # FTS compara raíces (porter), no subcadenas: la matriz no sirve para descartar ni puntuar
+        document = corpus.document(filename) if corpus and engine in ("scan", "index") else None
+        if document is not None and not document["pages"]:
+            continue
+        state: Dict = {"started": None}
+        future = pool.submit(_search_document, filename, file_path, keywords, engine, state, index, top,
+                             stats, document)
+        tasks[future] = (index, filename, state)
+
+    for index, filename in missing:
+        yield "failed", index, {"filename": filename, "reason": "not_found", "error": "Archivo no encontrado"}
+
+    # Los documentos en cola también tienen un límite (si el pool está ocupado por esta u otras peticiones)
+    overall_deadline = time.monotonic() + timeout * (math.ceil(len(tasks) / SEARCH_WORKERS) + 1)
+    pending = set(tasks)
+
+    try:
+        while pending:
+            now = time.monotonic()
+            started = [tasks[f][2]["started"] for f in pending]
+            deadlines = [start + timeout for start in started if start is not None]
+            if None in started and now < overall_deadline:
+                deadlines.append(overall_deadline)
+            # Un documento pudo empezar sin haber anotado su inicio todavía: volver a mirar en breve
+            next_deadline = min(deadlines) if deadlines else now + 0.05
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index, filename, _ = tasks[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"⚠️ Error buscando en {filename}: {e}")
+                    yield "failed", index, {"filename": filename, "reason": "error", "error": str(e)}
+                    continue
+                if summary["matches"]:
+                    yield "document", index, {"filename": filename, **summary}
+
+            now = time.monotonic()
+            for future in list(pending):
+                index, filename, state = tasks[future]
+                started = state["started"]
+                if started is not None and now - started >= timeout:
+                    # El thread no se puede interrumpir: se abandona su resultado
+                    pending.discard(future)
+                    print(f"⏱️ Búsqueda en {filename} superó {timeout}s")
+                    yield "failed", index, {
+                        "filename": filename, "reason": "timeout",
+                        "error": f"Tiempo máximo de búsqueda superado ({timeout}s)"
+                    }
+                elif started is None and now >= overall_deadline and future.cancel():
+                    # Seguía en cola detrás de otras búsquedas: se libera su lugar en el pool
+                    pending.discard(future)
+                    print(f"⏱️ Búsqueda en {filename} no empezó a tiempo (pool ocupado)")
+                    yield "failed", index, {
+                        "filename": filename, "reason": "queued",
+                        "error": "El documento no llegó a buscarse: el servidor está ocupado"
+                    }
+    finally:
+        # Cliente desconectado a mitad del streaming: no seguir con los que no empezaron
+        for future in pending:
+            future.cancel()
+
+
+def search_documents(upload_dir: Path, filenames: List[str], keywords: List[str], engine: str,
+                     timeout: Optional[float] = None,
+                     top_documents: Optional[int] = None,
+                     corpus: Optional[term_matrix.CorpusHits] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Buscar en varios documentos en paralelo y esperar a todos
+
+    Los que no terminan a tiempo, fallan o no existen se reportan aparte.
+    Todos los documentos llevan su conteo exacto, pero solo los
+    `top_documents` más relevantes conservan ubicaciones y vistas previas.
+
+    Returns:
+        (documentos con coincidencias, de más a menos relevante; documentos fallidos)
+    """
+    top = TopKDocuments(TOP_DOCUMENTS if top_documents is None else top_documents)
+    finished: Dict[int, Dict] = {}
+    failed: List[Dict] = []
+
+    for kind, index, payload in iter_documents(upload_dir, filenames, keywords, engine, top, timeout, corpus):
+        if kind == "failed":
+            failed.append(payload)
+            continue
+        add_finished(finished, top, index, payload)
+
+    return rank_documents(finished), failed
+
+
+def add_finished(finished: Dict[int, Dict], top: TopKDocuments, index: int, payload: Dict):
+    """Registrar un documento terminado; el que queda fuera del top-k pierde su detalle"""
+    finished[index] = payload
+    evicted = top.add(relevance_key(payload), index)
+    if evicted is not None and evicted in finished:
+        finished[evicted]["locations"] = []
+
+
+def rank_documents(finished: Dict[int, Dict]) -> List[Dict]:
+    """Documentos de más a menos relevante (en empate, el orden de la petición)"""
+    ranked = sorted(finished.items(), key=lambda item: (relevance_key(item[1]), -item[0]), reverse=True)
+    return [document for _, document in ranked]
+
+
+def corpus_hits(upload_dir: Path, filenames: List[str],
+                keywords: List[str]) -> Optional[term_matrix.CorpusHits]:
+    """Páginas y documentos del corpus con las claves, puntuados (una consulta a la matriz)
+
+    Retorna None si el índice no cubre estas claves (o si falla la consulta).
+    """
+    if not inverted_index.can_use_index(keywords):
+        return None
+    db = SessionLocal()
+    try:
+        return ranking.score_corpus(db, keywords, upload_dir, filenames)
+    except Exception as e:
+        print(f"⚠️ Error consultando la matriz del corpus: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def _corpus_statistics(keywords: List[str]) -> Optional[Dict]:
+    """Estadísticas BM25 del corpus, calculadas una vez por consulta múltiple"""
+    db = SessionLocal()
+    try:
+        return ranking.corpus_statistics(db, keywords)
+    except Exception as e:
+        print(f"⚠️ Error calculando estadísticas de ranking: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def shutdown_search_pool():
+    """Cerrar el pool de búsqueda (al apagar el servidor)"""
+    global _search_pool
+    with _pool_lock:
+        if _search_pool is not None:
+            _search_pool.shutdown(wait=False, cancel_futures=True)
+            _search_pool = None
@@ -0,0 +1,259 @@
+"""
+Ranking BM25 de páginas
+Las frecuencias por página (search_index.page_counts) y la longitud de
+cada página (pdf_pages.term_count) se calculan una vez al indexar; en cada
+consulta solo se leen las filas de las palabras clave y el puntaje de todas
+las páginas candidatas se calcula de una vez con NumPy.
+
+Como la búsqueda de texto es por subcadena, la frecuencia de una palabra
+clave en una página es la suma de las palabras del vocabulario que la
+contienen ("config" → "configuration", "configurações"). La IDF y la
+longitud media salen de todo el corpus indexado; se recuerdan por clave
+mientras no cambie la versión del corpus (term_matrix.corpus_version), así
+que una consulta sin caché no recorre el índice de todo el corpus.
+
+Los PDFs sin índice al día se puntúan tokenizando solo sus páginas con
+coincidencias, con las mismas estadísticas de corpus.
+
+En búsquedas sobre varios documentos las frecuencias y las estadísticas
+salen de la matriz término × página del corpus (term_matrix.py) y todas
+las páginas se puntúan de una vez (score_corpus).
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, select
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import threading
+import numpy as np
+import os
+
+from database import PDFDocument, PDFPage, SearchIndex
+import inverted_index
+import term_matrix
+
+# Parámetros de BM25
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Páginas que cuentan para el puntaje de un documento
+DOCUMENT_SCORE_PAGES = 3
+# Claves con su frecuencia de documento recordada (LRU, por versión del corpus)
+STATS_CACHE_SIZE = 1024
+
+
+# ========== ESTADÍSTICAS ==========
+
+def _keyword_filter(keywords: List[str]):
+    return or_(*[SearchIndex.word.contains(keyword.lower(), autoescape=True) for keyword in keywords])
+
+
+def _canonical_ids():
+    return select(PDFDocument.id).where(PDFDocument.canonical_id.is_(None))
+
+
+_stats_lock = threading.Lock()
+# Versión del corpus de lo recordado, (páginas, longitud media) y clave → páginas que la contienen
+_stats_version: Optional[int] = None
+_corpus_size: Optional[Tuple[int, float]] = None
+_key_df: "OrderedDict[str, float]" = OrderedDict()
+
+
+def _count_corpus_size(db: Session) -> Tuple[int, float]:
+    pages, avgdl = db.query(func.count(PDFPage.pdf_id), func.avg(PDFPage.term_count))\
+        .filter(PDFPage.term_count.isnot(None))\
+        .filter(PDFPage.pdf_id.in_(_canonical_ids()))\
+        .one()
+    return pages or 0, float(avgdl or 0.0)
+
+
+def _count_pages_containing(db: Session, keys: List[str]) -> Dict[str, float]:
+    """Páginas (pdf, página) distintas que contienen cada clave"""
+    containing: Dict[str, set] = {key: set() for key in keys}
+    rows = db.query(SearchIndex.pdf_id, SearchIndex.word, SearchIndex.page_numbers)\
+        .filter(_keyword_filter(keys))\
+        .filter(SearchIndex.pdf_id.in_(_canonical_ids()))
+    for row in rows:
+        for key in keys:
+            if key in row.word:
+                containing[key].update((row.pdf_id, page) for page in row.page_numbers or [])
+    return {key: float(len(pages_with_key)) for key, pages_with_key in containing.items()}
+
+
+def corpus_statistics(db: Session, keywords: List[str]) -> Dict:
+    """Páginas del corpus, longitud media y páginas que contienen cada palabra clave
+
+    Solo se consultan en la BD las claves que no se recuerdan para la
+    versión actual del corpus.
+
+    Returns:
+        {"pages": N, "avgdl": longitud media, "df": array (una entrada por clave)}
+    """
+    global _stats_version, _corpus_size
+    keys = [keyword.lower() for keyword in keywords]
+    version = term_matrix.corpus_version(db)
+    with _stats_lock:
+        if _stats_version != version:
+            _stats_version, _corpus_size = version, None
+            _key_df.clear()
+        size = _corpus_size
+        df = {}
+        for key in keys:
+            if key in _key_df:
+                _key_df.move_to_end(key)
+                df[key] = _key_df[key]
+
+    if size is None:
+        size = _count_corpus_size(db)
+    missing = [key for key in dict.fromkeys(keys) if key not in df]
+    if missing:
+        df.update(_count_pages_containing(db, missing))
+
+    with _stats_lock:
+        # Si el corpus cambió mientras tanto, no se guarda lo calculado con la versión anterior
+        if _stats_version == version:
+            _corpus_size = size
+            for key in missing:
+                _key_df[key] = df[key]
+            while len(_key_df) > STATS_CACHE_SIZE:
+                _key_df.popitem(last=False)
+
+    return {
+        "pages": size[0],
+        "avgdl": size[1],
+        "df": np.array([df[key] for key in keys], dtype=np.float64)
+    }
+
+
+def index_term_frequencies(db: Session, pdf_id: int,
+                           keywords: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Frecuencias de las claves en las páginas de un PDF según el índice
+
+    Returns:
+        (páginas, matriz tf páginas × claves, longitud de cada página),
+        o None si el índice no tiene conteos por página
+    """
+    keys = [keyword.lower() for keyword in keywords]
+    rows = db.query(SearchIndex.word, SearchIndex.page_numbers, SearchIndex.page_counts)\
+        .filter(SearchIndex.pdf_id == pdf_id)\
+        .filter(_keyword_filter(keys))\
+        .all()
+
+    tf_by_page: Dict[int, np.ndarray] = {}
+    for row in rows:
+        if row.page_counts is None:
+            return None
+        hit = np.array([key in row.word for key in keys], dtype=np.float64)
+        for page, count in zip(row.page_numbers, row.page_counts):
+            page_tf = tf_by_page.get(page)
+            if page_tf is None:
+                tf_by_page[page] = hit * count
+            else:
+                page_tf += hit * count
+
+    pages = np.array(sorted(tf_by_page), dtype=np.int64)
+    if not len(pages):
+        return pages, np.zeros((0, len(keys))), np.zeros(0)
+
+    lengths_by_page = dict(
+        db.query(PDFPage.page_number, PDFPage.term_count)
+        .filter(PDFPage.pdf_id == pdf_id, PDFPage.page_number.in_(pages.tolist()))
+    )
+    tf = np.vstack([tf_by_page[page] for page in pages.tolist()])
+    lengths = np.array([lengths_by_page.get(page) or tf_by_page[page].sum() for page in pages.tolist()],
+                       dtype=np.float64)
+    return pages, tf, lengths
+
+
+def text_term_frequencies(pages_text: Dict[int, str],
+                          keywords: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Frecuencias de las claves tokenizando el texto (PDFs sin índice al día)"""
+    keys = [keyword.lower() for keyword in keywords]
+    pages, rows, lengths = [], [], []
+    for page_num, text in sorted(pages_text.items()):
+        counts = Counter(word for word in inverted_index.tokenize_text(text)
+                         if len(word) >= inverted_index.MIN_WORD_LENGTH)
+        tf = np.array([sum(count for word, count in counts.items() if key in word) for key in keys],
+                      dtype=np.float64)
+        if tf.any():
+            pages.append(page_num)
+            rows.append(tf)
+            lengths.append(sum(counts.values()))
+    if not pages:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(keys))), np.zeros(0)
+    return np.array(pages, dtype=np.int64), np.vstack(rows), np.array(lengths, dtype=np.float64)
+
+
+# ========== PUNTAJE ==========
+
+def bm25(tf: np.ndarray, lengths: np.ndarray, df: np.ndarray, total_pages: int, avgdl: float) -> np.ndarray:
+    """Puntaje BM25 de cada fila de tf (páginas × claves)"""
+    if not len(tf):
+        return np.zeros(0)
+    total_pages = max(total_pages, 1)
+    # IDF no negativa (variante de Lucene); una clave sin df en el corpus cuenta como rara
+    idf = np.log1p((total_pages - df + 0.5) / (df + 0.5))
+    avgdl = avgdl if avgdl > 0 else max(float(lengths.mean()), 1.0)
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / avgdl)
+    return (tf * (BM25_K1 + 1.0) / (tf + norm[:, None])) @ idf
+
+
+def score_pages(db: Session, filename: str, file_path: Path, keywords: List[str],
+                pages_text: Optional[Dict[int, str]] = None,
+                stats: Optional[Dict] = None) -> Optional[Dict[int, float]]:
+    """Puntaje BM25 de las páginas de un PDF con alguna palabra clave
+
+    Usa el índice si está al día; si no, tokeniza pages_text. Retorna None
+    si no hay de dónde sacar las frecuencias.
+    """
+    if not keywords:
+        return None
+    frequencies = None
+    source = inverted_index.indexed_source(db, filename, file_path, keywords)
+    if source:
+        frequencies = index_term_frequencies(db, source[0], keywords)
+    if frequencies is None and pages_text is not None:
+        frequencies = text_term_frequencies(pages_text, keywords)
+    if frequencies is None:
+        return None
+
+    pages, tf, lengths = frequencies
+    stats = stats or corpus_statistics(db, keywords)
+    if not stats["pages"]:
+        # Corpus sin índice: estadísticas de las propias páginas
+        stats = {"pages": len(pages), "avgdl": 0.0, "df": (tf > 0).sum(axis=0).astype(np.float64)}
+    scores = bm25(tf, lengths, stats["df"], stats["pages"], stats["avgdl"])
+    return dict(zip(pages.tolist(), scores.tolist()))
+
+
+def score_text_pages(pages_text: Dict[int, str], keywords: List[str]) -> Optional[Dict[int, float]]:
+    """Puntaje BM25 de unas páginas con estadísticas de las propias páginas (sin BD)"""
+    if not keywords:
+        return None
+    pages, tf, lengths = text_term_frequencies(pages_text, keywords)
+    df = (tf > 0).sum(axis=0).astype(np.float64)
+    scores = bm25(tf, lengths, df, len(pages_text), 0.0)
+    return dict(zip(pages.tolist(), scores.tolist()))
+
+
+def score_corpus(db: Session, keywords: List[str], upload_dir: Optional[Path] = None,
+                 filenames: List[str] = ()) -> term_matrix.CorpusHits:
+    """Páginas del corpus con las palabras clave, puntuadas con BM25 en una sola operación"""
+    hits = term_matrix.lookup(db, keywords, upload_dir, filenames)
+    stats = hits.stats
+    hits.scores = bm25(hits.tf, hits.lengths, stats["df"], stats["pages"], stats["avgdl"])
+    return hits
+
+
+def document_score(page_scores: Optional[Dict[int, float]]) -> float:
+    """Puntaje de un documento: suma de sus DOCUMENT_SCORE_PAGES mejores páginas"""
+    if not page_scores:
+        return 0.0
+    best = sorted(page_scores.values(), reverse=True)[:DOCUMENT_SCORE_PAGES]
+    return float(sum(best))
+
+
+def rank_pages(pages: List[int], page_scores: Optional[Dict[int, float]]) -> List[int]:
+    """Páginas de más a menos relevante (en empate o sin puntaje, por número de página)"""
+    if not page_scores:
+        return sorted(pages)
+    return sorted(pages, key=lambda page: (-page_scores.get(page, 0.0), page))
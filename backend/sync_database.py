@@ -1,88 +1,189 @@
 #!/usr/bin/env python3
 """
-Script para sincronizar la base de datos con los archivos físicos
+Sincronizador incremental entre la carpeta de PDFs y la base de datos
+- Compara tamaño, mtime y hash de contenido de cada archivo con PDFDocument
+- Re-extrae y re-indexa (en paralelo, vía el pipeline de ingesta) solo
+  los archivos nuevos o modificados
+- Purga de la BD, del índice FTS y de la caché los archivos eliminados
+
+Uso:
+    python sync_database.py [--dir ../pdfs] [--dry-run]
 """
 import sys
+import os
+import argparse
+import threading
 from pathlib import Path
+from typing import Dict, List, Optional
 
 # Agregar el directorio actual al path
 sys.path.append(str(Path(__file__).parent))
 
-from database import get_db, init_db
-import database_service as db_svc
-from sqlalchemy.orm import Session
+from database import SessionLocal, PDFDocument, PDFPage
+import db_services as db_svc
+import ingestion
+import page_store
+from pdf_extractor import file_content_hash
+
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "../pdfs")
+
+# Evitar dos sincronizaciones simultáneas (CLI + tarea periódica)
+_sync_lock = threading.Lock()
+
+
+def scan_upload_dir(upload_dir: Path) -> Dict[str, Path]:
+    """Archivos PDF presentes en la carpeta (nombre -> ruta)"""
+    if not upload_dir.exists():
+        return {}
+    return {path.name: path for path in upload_dir.glob("*.pdf") if path.is_file()}
+
+
+def plan_sync(db, upload_dir: Path) -> Dict[str, List]:
+    """Clasificar cada archivo según lo que hay que hacer con él
+
+    - new: sin registro en BD
+    - changed: el contenido (hash) cambió, o el registro no tiene hash con
+      qué comparar (se re-ingesta: el texto guardado puede ser de otra versión)
+    - touched: cambió tamaño/mtime pero no el contenido
+    - unchanged: tamaño y mtime coinciden
+    - removed: registro en BD sin archivo en disco
+    """
+    files = scan_upload_dir(upload_dir)
+    records = {
+        row.filename: row
+        for row in db.query(PDFDocument.filename, PDFDocument.file_size, PDFDocument.file_mtime,
+                            PDFDocument.content_hash, PDFDocument.canonical_id, PDFDocument.id)
+    }
+    stored_ids = {row.pdf_id for row in db.query(PDFPage.pdf_id).distinct()}
+    # Texto aún en las columnas antiguas (pendiente de migrar)
+    stored_ids.update(row.id for row in db.query(PDFDocument.id).filter(page_store.LEGACY_TEXT_FILTER))
+
+    plan: Dict[str, List] = {"new": [], "changed": [], "touched": [], "unchanged": [], "removed": []}
+
+    for filename, path in sorted(files.items()):
+        record = records.get(filename)
+        if record is None:
+            plan["new"].append((filename, path, file_content_hash(path)))
+            continue
+
+        stat = path.stat()
+        same_size = record.file_size == stat.st_size
+        if same_size and record.file_mtime is not None and abs(record.file_mtime - stat.st_mtime) <= 1e-6:
+            plan["unchanged"].append(filename)
+            continue
+
+        has_text = record.id in stored_ids or record.canonical_id is not None
+        content_hash = file_content_hash(path)
+        if content_hash == record.content_hash and has_text:
+            plan["touched"].append((filename, path, content_hash))
+        else:
+            plan["changed"].append((filename, path, content_hash))
+
+    plan["removed"] = sorted(set(records) - set(files))
+    return plan
+
+
+def sync_corpus(upload_dir: Optional[Path] = None, dry_run: bool = False,
+                wait: bool = True, timeout: Optional[float] = None) -> Dict:
+    """Sincronizar la carpeta de PDFs con la base de datos
+
+    Args:
+        upload_dir: carpeta de PDFs (UPLOAD_FOLDER por defecto)
+        dry_run: solo calcular el plan, sin cambios
+        wait: esperar a que terminen los jobs de ingesta
+    """
+    upload_dir = Path(upload_dir or UPLOAD_FOLDER)
+
+    if not _sync_lock.acquire(blocking=False):
+        return {"status": "busy", "message": "Ya hay una sincronización en curso"}
+
+    db = SessionLocal()
+    try:
+        if not dry_run:
+            page_store.migrate_legacy_text(db)
+        plan = plan_sync(db, upload_dir)
+        summary = {
+            "status": "dry_run" if dry_run else "completed",
+            "upload_dir": str(upload_dir),
+            "new": [item[0] for item in plan["new"]],
+            "changed": [item[0] for item in plan["changed"]],
+            "touched": [item[0] for item in plan["touched"]],
+            "removed": plan["removed"],
+            "unchanged": len(plan["unchanged"]),
+            "in_progress": [],
+            "jobs": []
+        }
+        if dry_run:
+            return summary
+
+        # Solo cambió la metadata del archivo: registrar hash y mtime
+        for filename, path, content_hash in plan["touched"]:
+            pdf = db_svc.get_pdf_by_filename(db, filename)
+            stat = path.stat()
+            pdf.content_hash = content_hash
+            db_svc.update_file_signature(db, pdf, stat.st_size, stat.st_mtime)
+
+        # Archivos eliminados: purgar BD, FTS y caché
+        for filename in plan["removed"]:
+            ingestion.purge_document(db, filename)
+
+        # Nuevos o modificados: re-ingestar en el pool de ingesta, salvo los que
+        # ya tienen un job en cola o en curso (sincronización anterior sin esperar)
+        active = ingestion.active_filenames()
+        summary["in_progress"] = [item[0] for item in plan["new"] + plan["changed"] if item[0] in active]
+        jobs = [
+            ingestion.submit_ingestion(filename, path, path.stat().st_size, content_hash,
+                                       delete_file_on_error=False)
+            for filename, path, content_hash in plan["new"] + plan["changed"]
+            if filename not in active
+        ]
+        if wait:
+            for job in jobs:
+                job.wait(timeout)
+        summary["jobs"] = [
+            {"job_id": job.id, "filename": job.filename, "status": job.status, "error": job.error}
+            for job in jobs
+        ]
+        return summary
+    finally:
+        db.close()
+        _sync_lock.release()
+
+
+def print_summary(summary: Dict):
+    """Mostrar el resultado de la sincronización"""
+    if summary["status"] == "busy":
+        print(f"⏳ {summary['message']}")
+        return
+
+    print(f"📁 Carpeta: {summary['upload_dir']}")
+    for label, key in [("➕ Nuevos", "new"), ("✏️  Modificados", "changed"),
+                       ("🕒 Solo metadata", "touched"), ("🗑️  Eliminados", "removed")]:
+        print(f"{label}: {len(summary[key])}")
+        for filename in summary[key]:
+            print(f"   - {filename}")
+    print(f"✅ Sin cambios: {summary['unchanged']}")
+    if summary.get("in_progress"):
+        print(f"⏳ Ya en ingesta (no se vuelven a encolar): {len(summary['in_progress'])}")
+
+    for job in summary["jobs"]:
+        icon = "✅" if job["status"] == "completed" else "❌"
+        print(f"   {icon} {job['filename']}: {job['status']}" + (f" ({job['error']})" if job["error"] else ""))
 
-def sync_database_with_files():
-    """Sincronizar base de datos con archivos físicos"""
-    print("🔄 Sincronizando base de datos con archivos físicos...")
-    
-    # Obtener archivos físicos
-    pdfs_dir = Path("../pdfs")  # Directorio donde están realmente los PDFs
-    physical_files = set()
-    
-    if pdfs_dir.exists():
-        for pdf_file in pdfs_dir.glob("*.pdf"):
-            physical_files.add(pdf_file.name)
-            print(f"📄 Archivo encontrado: {pdf_file.name}")
-    
-    print(f"\n📊 Total archivos físicos: {len(physical_files)}")
-    
-    # Obtener archivos en base de datos
-    db = next(get_db())
-    db_pdfs = db_svc.get_all_pdfs(db)
-    db_files = set(pdf.filename for pdf in db_pdfs)
-    
-    print(f"📊 Total archivos en BD: {len(db_files)}")
-    
-    # Encontrar archivos huérfanos (en BD pero no físicos)
-    orphaned = db_files - physical_files
-    if orphaned:
-        print(f"\n🗑️  Archivos huérfanos en BD (serán eliminados):")
-        for filename in orphaned:
-            print(f"   ❌ {filename}")
-            # Eliminar de base de datos
-            try:
-                db_svc.delete_pdf_by_filename(db, filename)
-                print(f"   ✅ Eliminado de BD: {filename}")
-            except Exception as e:
-                print(f"   ❌ Error eliminando: {e}")
-    
-    # Encontrar archivos nuevos (físicos pero no en BD)
-    new_files = physical_files - db_files
-    if new_files:
-        print(f"\n➕ Archivos nuevos (serán agregados a BD):")
-        for filename in new_files:
-            print(f"   ➕ {filename}")
-            file_path = pdfs_dir / filename
-            
-            try:
-                # Agregar a base de datos
-                file_size = file_path.stat().st_size
-                db_svc.create_pdf_record(
-                    db=db,
-                    filename=filename,
-                    original_filename=filename,
-                    file_path=str(file_path),
-                    file_size=file_size
-                )
-                print(f"   ✅ Agregado a BD: {filename}")
-            except Exception as e:
-                print(f"   ❌ Error agregando: {e}")
-    
-    db.commit()
-    db.close()
-    
-    print(f"\n🎉 Sincronización completada!")
-    print(f"📊 Archivos físicos: {len(physical_files)}")
-    print(f"📊 Archivos sincronizados: {len(physical_files & db_files) + len(new_files)}")
-    
-    return len(physical_files)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincronizar la carpeta de PDFs con la base de datos")
+    parser.add_argument("--dir", default=UPLOAD_FOLDER, help="Carpeta de PDFs")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar el plan sin aplicar cambios")
+    args = parser.parse_args()
+
+    print("🔄 Sincronizando base de datos con archivos físicos...")
     try:
-        count = sync_database_with_files()
-        print(f"\n✅ Proceso completado exitosamente")
-        print(f"🔗 Ahora la BD y los archivos están sincronizados")
+        result = sync_corpus(Path(args.dir), dry_run=args.dry_run)
+        print_summary(result)
+        print(f"\n🎉 Sincronización completada!")
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        ingestion.shutdown_ingestion()
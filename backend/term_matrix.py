@@ -0,0 +1,366 @@
+"""
+Matriz término × página de todo el corpus (en memoria, NumPy)
+Cada PDF canónico indexado aporta sus entradas (término, página,
+apariciones) como arrays COO. El vocabulario solo crece: un término
+conserva su columna aunque se quiten documentos. Cuando hay cambios, los
+bloques se concatenan en una matriz comprimida por término (indptr +
+filas, como una CSC), y cada consulta es una sola búsqueda vectorizada:
+qué páginas y qué documentos contienen las palabras clave y cuántas veces.
+
+Se llena al indexar (inverted_index.index_document) y se sincroniza con
+la BD comparando la firma de cada documento (hash de contenido, páginas):
+solo se cargan los documentos nuevos o cambiados y se quitan los
+eliminados (p. ej. si otro proceso ingestó o purgó PDFs). La
+sincronización se hace como mucho cada TERM_MATRIX_SYNC_SECONDS; los
+cambios de este proceso la fuerzan (put_document, invalidate).
+
+Los términos que contienen una clave se buscan en el vocabulario unido en
+un solo texto (búsqueda en C, no palabra por palabra) y se recuerdan por
+clave; al crecer el vocabulario solo se revisan las palabras nuevas.
+"""
+from sqlalchemy.orm import Session
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+import re
+import os
+import numpy as np
+
+from database import PDFDocument, PDFPage, SearchIndex
+import page_text
+
+# Claves con sus términos ya resueltos que se recuerdan
+KEY_CACHE_SIZE = 1024
+# Segundos entre comparaciones de las firmas de los documentos con la BD
+TERM_MATRIX_SYNC_SECONDS = float(os.getenv("TERM_MATRIX_SYNC_SECONDS", "300"))
+
+Signature = Tuple[Optional[str], Optional[int]]
+
+
+class _Block:
+    """Entradas de un documento: (término, página, apariciones) y longitud de cada página"""
+
+    def __init__(self, terms: np.ndarray, pages: np.ndarray, counts: np.ndarray,
+                 page_numbers: np.ndarray, page_lengths: np.ndarray):
+        self.terms = terms
+        self.pages = pages
+        self.counts = counts
+        self.page_numbers = page_numbers
+        self.page_lengths = page_lengths
+
+
+class _Matrix:
+    """Matriz compilada: filas = páginas de todo el corpus, columnas = términos"""
+
+    def __init__(self, blocks: Dict[int, _Block], vocabulary_size: int):
+        pdf_ids = sorted(blocks)
+        self.pdf_ids = np.array(pdf_ids, dtype=np.int64)
+        self.doc_rows = {pdf_id: row for row, pdf_id in enumerate(pdf_ids)}
+
+        # Las páginas de cada documento ocupan filas consecutivas
+        sizes = np.array([len(blocks[pdf_id].page_numbers) for pdf_id in pdf_ids], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self.doc_pages = sizes
+        self.page_doc = np.repeat(np.arange(len(pdf_ids)), sizes)
+        self.page_number = _concat([blocks[pdf_id].page_numbers for pdf_id in pdf_ids], np.int64)
+        self.page_length = _concat([blocks[pdf_id].page_lengths for pdf_id in pdf_ids], np.float64)
+        self.avgdl = float(self.page_length.mean()) if len(self.page_length) else 0.0
+
+        terms = _concat([blocks[pdf_id].terms for pdf_id in pdf_ids], np.int64)
+        rows = _concat([
+            offsets[i] + np.searchsorted(blocks[pdf_id].page_numbers, blocks[pdf_id].pages)
+            for i, pdf_id in enumerate(pdf_ids)
+        ], np.int64)
+        counts = _concat([blocks[pdf_id].counts for pdf_id in pdf_ids], np.float64)
+
+        order = np.argsort(terms, kind="stable")
+        self.rows = rows[order]
+        self.counts = counts[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=vocabulary_size))))
+
+
+class CorpusHits:
+    """Páginas del corpus que contienen alguna palabra clave, con sus frecuencias
+
+    Atributos (una fila por página con coincidencias, agrupadas por documento):
+        tf: matriz páginas × claves con las apariciones
+        lengths: palabras indexadas de cada página
+        stats: estadísticas BM25 ({"pages", "avgdl", "df"}, como ranking.corpus_statistics)
+        scores: puntaje de cada página (lo asigna ranking.score_corpus)
+        sources: {archivo: pdf_id del texto indexado} de los archivos cubiertos
+    """
+
+    def __init__(self, matrix: _Matrix, keywords: List[str], key_terms: List[np.ndarray]):
+        self.keywords = keywords
+        self._matrix = matrix
+
+        # Rangos de la matriz de cada término de cada clave, en una sola pasada
+        starts = np.concatenate([matrix.indptr[terms] for terms in key_terms])
+        ends = np.concatenate([matrix.indptr[terms + 1] for terms in key_terms])
+        key_of_range = np.repeat(np.arange(len(key_terms)), [len(terms) for terms in key_terms])
+        entries = _ranges(starts, ends)
+        key_of_entry = np.repeat(key_of_range, ends - starts)
+
+        rows, inverse = np.unique(matrix.rows[entries], return_inverse=True)
+        self.tf = np.zeros((len(rows), len(key_terms)))
+        np.add.at(self.tf, (inverse, key_of_entry), matrix.counts[entries])
+        self.docs = matrix.page_doc[rows]
+        self.page_numbers = matrix.page_number[rows]
+        self.lengths = matrix.page_length[rows]
+        self.stats = {
+            "pages": len(matrix.page_length),
+            "avgdl": matrix.avgdl,
+            "df": (self.tf > 0).sum(axis=0).astype(np.float64)
+        }
+        self.scores = np.zeros(len(rows))
+        self.sources: Dict[str, int] = {}
+
+    def _span(self, pdf_id: int) -> Tuple[int, int]:
+        row = self._matrix.doc_rows[pdf_id]
+        return int(np.searchsorted(self.docs, row, "left")), int(np.searchsorted(self.docs, row, "right"))
+
+    def document(self, filename: str) -> Optional[Dict]:
+        """Páginas con coincidencias de un archivo cubierto (None si no está en la matriz)
+
+        Returns:
+            {"pages": [páginas], "page_scores": {página: puntaje}, "total_pages"}
+        """
+        pdf_id = self.sources.get(filename)
+        if pdf_id is None:
+            return None
+        lo, hi = self._span(pdf_id)
+        pages = self.page_numbers[lo:hi].tolist()
+        return {
+            "pages": pages,
+            "page_scores": dict(zip(pages, self.scores[lo:hi].tolist())),
+            "total_pages": int(self._matrix.doc_pages[self._matrix.doc_rows[pdf_id]])
+        }
+
+    def keyword_totals(self, filenames: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """Apariciones, páginas y documentos de cada clave en los archivos indicados
+
+        Un PDF con varios nombres (duplicados) cuenta una vez por nombre.
+        """
+        doc_rows = [self._matrix.doc_rows[self.sources[name]] for name in filenames if name in self.sources]
+        weights = np.bincount(np.array(doc_rows, dtype=np.int64), minlength=len(self._matrix.pdf_ids))
+        page_weights = weights[self.docs].astype(np.float64)
+        present = self.tf > 0
+        occurrences = page_weights @ self.tf
+        pages = page_weights @ present
+        per_doc = np.zeros((len(self._matrix.pdf_ids), len(self.keywords)), dtype=bool)
+        np.logical_or.at(per_doc, self.docs, present)
+        documents = weights.astype(np.float64) @ per_doc
+        return {
+            keyword: {"occurrences": int(occurrences[k]), "pages": int(pages[k]), "documents": int(documents[k])}
+            for k, keyword in enumerate(self.keywords)
+        }
+
+
+def _concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenación de arange(start, end) para cada par, sin bucle"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    shift = starts - (np.cumsum(lengths) - lengths)
+    return np.repeat(shift, lengths) + np.arange(total)
+
+
+# ========== ESTADO ==========
+
+_lock = threading.RLock()
+_vocabulary: Dict[str, int] = {}
+_words: List[str] = []
+# Bloques por pdf_id (None: indexado sin conteos por página, no entra en la matriz)
+_blocks: Dict[int, Optional[_Block]] = {}
+_signatures: Dict[int, Signature] = {}
+_matrix: Optional[_Matrix] = None
+# Clave → (palabras del vocabulario ya revisadas, términos que la contienen)
+_key_terms: Dict[str, Tuple[int, np.ndarray]] = {}
+# Vocabulario unido por "\n" y posición de inicio de cada palabra (se extiende al crecer)
+_vocabulary_text = ""
+_word_starts = np.zeros(0, dtype=np.int64)
+# Momento de la última sincronización (None: sincronizar en la próxima consulta)
+_synced_at: Optional[float] = None
+# Cambia cada vez que cambian los documentos de la matriz
+_version = 0
+
+
+def _term_id(word: str) -> int:
+    term = _vocabulary.get(word)
+    if term is None:
+        term = len(_words)
+        _vocabulary[word] = term
+        _words.append(word)
+    return term
+
+
+def _make_block(postings: Iterable[Tuple[str, List[int], List[int]]],
+                page_lengths: Dict[int, Optional[int]]) -> _Block:
+    terms, pages, counts = [], [], []
+    for word, word_pages, word_counts in postings:
+        term = _term_id(word)
+        terms.extend([term] * len(word_pages))
+        pages.extend(word_pages)
+        counts.extend(word_counts)
+    pages_array = np.array(pages, dtype=np.int64)
+    counts_array = np.array(counts, dtype=np.float64)
+
+    # Páginas sin longitud guardada: la suma de sus apariciones
+    page_numbers = np.union1d(np.array(list(page_lengths), dtype=np.int64), pages_array)
+    fallback = np.bincount(np.searchsorted(page_numbers, pages_array), weights=counts_array,
+                           minlength=len(page_numbers))
+    lengths = np.array([
+        page_lengths.get(page) if page_lengths.get(page) is not None else fallback[i]
+        for i, page in enumerate(page_numbers.tolist())
+    ], dtype=np.float64)
+    return _Block(np.array(terms, dtype=np.int64), pages_array, counts_array, page_numbers, lengths)
+
+
+def _load_block(db: Session, pdf_id: int) -> Optional[_Block]:
+    rows = db.query(SearchIndex.word, SearchIndex.page_numbers, SearchIndex.page_counts)\
+        .filter(SearchIndex.pdf_id == pdf_id)\
+        .all()
+    if any(row.page_counts is None for row in rows):
+        return None
+    page_lengths = dict(db.query(PDFPage.page_number, PDFPage.term_count).filter(PDFPage.pdf_id == pdf_id))
+    return _make_block(((row.word, row.page_numbers or [], row.page_counts) for row in rows), page_lengths)
+
+
+def _changed():
+    global _matrix, _version
+    _matrix = None
+    _version += 1
+
+
+def put_document(pdf: PDFDocument, word_data: Dict[str, Dict], page_lengths: Dict[int, int]):
+    """Registrar el índice recién construido de un PDF canónico"""
+    postings = ((word, data["pages"], data["page_counts"]) for word, data in word_data.items())
+    with _lock:
+        _blocks[pdf.id] = _make_block(postings, page_lengths)
+        _signatures[pdf.id] = (pdf.content_hash, pdf.total_pages)
+        _changed()
+
+
+def invalidate():
+    """Sincronizar con la BD en la próxima consulta (PDF eliminado o con texto reasignado)"""
+    global _synced_at
+    with _lock:
+        _synced_at = None
+
+
+def sync(db: Session, force: bool = False):
+    """Cargar los documentos indexados nuevos o cambiados y quitar los que ya no están
+
+    Sin force, no hace nada si la última sincronización fue hace menos de
+    TERM_MATRIX_SYNC_SECONDS.
+    """
+    global _synced_at
+    now = time.monotonic()
+    with _lock:
+        if not force and _synced_at is not None and now - _synced_at < TERM_MATRIX_SYNC_SECONDS:
+            return
+    current = {
+        row.id: (row.content_hash, row.total_pages)
+        for row in db.query(PDFDocument.id, PDFDocument.content_hash, PDFDocument.total_pages)
+        .filter(PDFDocument.canonical_id.is_(None), PDFDocument.search_indexed.is_(True))
+    }
+    with _lock:
+        for pdf_id in [pdf_id for pdf_id in _signatures if pdf_id not in current]:
+            del _signatures[pdf_id]
+            del _blocks[pdf_id]
+            _changed()
+        for pdf_id, signature in current.items():
+            if _signatures.get(pdf_id) != signature:
+                _blocks[pdf_id] = _load_block(db, pdf_id)
+                _signatures[pdf_id] = signature
+                _changed()
+        _synced_at = now
+
+
+def corpus_version(db: Session) -> int:
+    """Versión de los documentos de la matriz (cambia al agregar, cambiar o quitar uno)"""
+    sync(db)
+    with _lock:
+        return _version
+
+
+def _compiled() -> _Matrix:
+    global _matrix
+    if _matrix is None:
+        _matrix = _Matrix({pdf_id: block for pdf_id, block in _blocks.items() if block is not None},
+                          len(_words))
+    return _matrix
+
+
+def _extend_vocabulary_text():
+    """Agregar al texto del vocabulario las palabras nuevas"""
+    global _vocabulary_text, _word_starts
+    if len(_word_starts) == len(_words):
+        return
+    new_words = _words[len(_word_starts):]
+    lengths = np.array([len(word) + 1 for word in new_words], dtype=np.int64)
+    starts = len(_vocabulary_text) + np.cumsum(lengths) - lengths
+    _word_starts = np.concatenate((_word_starts, starts))
+    _vocabulary_text += "\n".join(new_words) + "\n"
+
+
+def _terms_containing(key: str) -> np.ndarray:
+    """Términos del vocabulario que contienen la clave (búsqueda por subcadena)"""
+    scanned, terms = _key_terms.pop(key, (0, np.zeros(0, dtype=np.int64)))
+    if scanned < len(_words):
+        _extend_vocabulary_text()
+        # Las palabras no tienen "\n": una coincidencia nunca cruza dos palabras
+        pattern = re.compile(re.escape(key))
+        positions = [match.start() for match in pattern.finditer(_vocabulary_text, int(_word_starts[scanned]))]
+        new_terms = np.unique(np.searchsorted(_word_starts, positions, side="right") - 1)
+        terms = np.concatenate((terms, new_terms.astype(np.int64)))
+    if len(_key_terms) >= KEY_CACHE_SIZE:
+        _key_terms.pop(next(iter(_key_terms)))
+    _key_terms[key] = (len(_words), terms)
+    return terms
+
+
+def lookup(db: Session, keywords: List[str], upload_dir: Optional[Path] = None,
+           filenames: Iterable[str] = ()) -> CorpusHits:
+    """Páginas y documentos del corpus que contienen las palabras clave
+
+    Si se pasan archivos, hits.sources indica cuáles están en la matriz con
+    su texto al día (los demás hay que buscarlos por su cuenta).
+    """
+    sync(db)
+    keys = [keyword.lower() for keyword in keywords]
+    with _lock:
+        matrix = _compiled()
+        key_terms = [_terms_containing(key) for key in keys]
+    hits = CorpusHits(matrix, keys, key_terms)
+
+    if upload_dir is not None:
+        wanted = set(filenames)
+        metas = db.query(PDFDocument.filename, PDFDocument.id, PDFDocument.canonical_id,
+                         PDFDocument.file_size, PDFDocument.file_mtime)
+        for meta in metas:
+            text_id = meta.canonical_id or meta.id
+            if meta.filename not in wanted or text_id not in matrix.doc_rows:
+                continue
+            if not page_text.is_stale(meta.file_size, meta.file_mtime,
+                                      page_text.file_signature(upload_dir / meta.filename)):
+                hits.sources[meta.filename] = text_id
+    return hits
+
+
+def matrix_stats() -> Dict:
+    """Tamaño de la matriz en memoria (sin sincronizar con la BD)"""
+    with _lock:
+        matrix = _matrix
+        return {
+            "documents": sum(1 for block in _blocks.values() if block is not None),
+            "terms": len(_words),
+            "entries": int(sum(len(block.terms) for block in _blocks.values() if block is not None)),
+            "compiled": matrix is not None
+        }
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Pruebas de fts_keyword_matches sobre una base SQLite en memoria
+(no necesita el servidor ni la base de datos del proyecto)
+"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import fts_search as fts
+
+
+def make_session():
+    engine = create_engine("sqlite://")
+    db = sessionmaker(bind=engine)()
+    fts.init_fts_tables(db)
+    return db
+
+
+def test_keyword_in_filename_does_not_match_every_page():
+    db = make_session()
+    fts.index_pdf_for_fts(db, 1, "manual_gamma.pdf", {
+        1: "The manual describes the robots",
+        2: "unrelated page content only",
+    })
+
+    matches = fts.fts_keyword_matches(db, 1, ["manual", "robots"])
+
+    assert [(match["keyword"], match["page"]) for match in matches] == [("manual", 1), ("robots", 1)]
+
+
+def test_keyword_matches_are_not_truncated():
+    db = make_session()
+    fts.index_pdf_for_fts(db, 1, "large.pdf", {page: f"robots on page {page}" for page in range(1, 301)})
+
+    matches = fts.fts_keyword_matches(db, 1, ["robots"])
+
+    assert len(matches) == 300
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Pruebas de payload_codec: cabecera, formato anterior (JSON sin cabecera)
+y payloads truncados o corruptos (no necesita el servidor ni la base de datos)
+"""
+import json
+import zlib
+
+import pytest
+
+import payload_codec
+from payload_codec import HEADER, MAGIC, VERSION, decode_payload, encode_payload, payload_size
+
+RESULT = {
+    "answer": "Encontré 3 coincidencias de 'configuração' en manual.pdf",
+    "keywords": ["configuração", "robot"],
+    "results": [{"page": page, "context": "configuração do robot " * 5} for page in range(1, 6)],
+    "total_matches": 3,
+    "cached": False
+}
+
+
+def available_codecs():
+    return [codec for codec in payload_codec.CODECS if payload_codec.resolve_codec(codec) == codec]
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_header_round_trip(codec):
+    data = encode_payload(RESULT, codec)
+
+    magic, version, code, size = HEADER.unpack_from(data)
+    assert (magic, version, code) == (MAGIC, VERSION, payload_codec.CODECS[codec])
+    assert size == len(payload_codec.dumps(RESULT))
+    assert payload_size(data) == size
+    assert decode_payload(data) == RESULT
+
+
+def test_small_results_are_not_compressed():
+    data = encode_payload({"answer": "ok"}, "zlib")
+    assert HEADER.unpack_from(data)[2] == payload_codec.CODECS["raw"]
+    assert decode_payload(data) == {"answer": "ok"}
+
+
+def test_non_string_keys_decode_like_json():
+    value = {1: "a", "b": {2: [1, 2]}}
+    assert decode_payload(encode_payload(value)) == json.loads(json.dumps(value))
+
+
+def test_legacy_json_payloads():
+    text = json.dumps(RESULT)
+    assert decode_payload(text) == RESULT
+    assert decode_payload(text.encode("utf-8")) == RESULT
+    assert payload_size(text) == len(text)
+    assert decode_payload(None) is None
+    assert payload_size(None) == 0
+
+
+def test_zstd_falls_back_to_zlib_when_not_installed(monkeypatch):
+    monkeypatch.setattr(payload_codec, "zstd", None)
+    assert payload_codec.resolve_codec("zstd") == "zlib"
+    assert payload_codec.resolve_codec("unknown") == "zlib"
+
+    data = HEADER.pack(MAGIC, VERSION, payload_codec.CODECS["zstd"], 10) + b"\x00" * 10
+    with pytest.raises(RuntimeError):
+        decode_payload(data)
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_truncated_payloads(codec):
+    data = encode_payload(RESULT, codec)
+    for size in (3, HEADER.size - 1, HEADER.size, len(data) // 2, len(data) - 1):
+        with pytest.raises(ValueError):
+            decode_payload(data[:size])
+
+
+def test_corrupt_payloads():
+    data = bytearray(encode_payload(RESULT, "zlib"))
+
+    unknown_version = bytes(data[:2]) + bytes([VERSION + 1]) + bytes(data[3:])
+    unknown_codec = bytes(data[:3]) + bytes([9]) + bytes(data[4:])
+    wrong_size = HEADER.pack(MAGIC, VERSION, payload_codec.CODECS["zlib"], 1) + bytes(data[HEADER.size:])
+    flipped = bytearray(data)
+    flipped[HEADER.size + 5] ^= 0xFF
+    not_json = HEADER.pack(MAGIC, VERSION, payload_codec.CODECS["raw"], 5) + b"{nope"
+    not_zlib = HEADER.pack(MAGIC, VERSION, payload_codec.CODECS["zlib"], 5) + zlib.compress(b"12345")[:-4]
+
+    for payload in (unknown_version, unknown_codec, wrong_size, bytes(flipped), not_json, not_zlib):
+        with pytest.raises(ValueError):
+            decode_payload(payload)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la clave canónica del caché: dos preguntas con la misma clave
+deben dar el mismo resultado (no necesita el servidor ni la base de datos)
+"""
+import query_analysis
+import text_matcher
+
+PAGES = {
+    1: "The robots move along the line",
+    2: "Configure the robots before starting the line",
+    3: "unrelated page",
+}
+
+
+def search(question):
+    keywords = query_analysis.analyze_question(question)["keywords"]
+    return keywords, text_matcher.get_matcher(keywords).search_pages(PAGES)
+
+
+def assert_same_key_same_result(first, second):
+    assert query_analysis.cache_key(first, ["a.pdf"], mode="canonical") == \
+        query_analysis.cache_key(second, ["a.pdf"], mode="canonical")
+    assert search(first) == search(second)
+
+
+def test_repeated_keyword_is_searched_once():
+    assert query_analysis.analyze_question("robots robots")["keywords"] == ["robots"]
+    assert_same_key_same_result("robots robots", "robots")
+    assert len(search("robots robots")[1]) == 2
+
+
+def test_case_and_punctuation_share_key_and_result():
+    assert_same_key_same_result("Robots line?", "robots LINE")
+
+
+def test_keyword_order_is_part_of_the_key():
+    assert query_analysis.cache_key("robots line", mode="canonical") != \
+        query_analysis.cache_key("line robots", mode="canonical")
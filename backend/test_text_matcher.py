@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Paridad de text_matcher con la búsqueda original (una regex por palabra
+clave y por línea, como search_in_pages antes del matcher de una pasada)
+sobre casos aleatorios: claves solapadas, plegado de mayúsculas que cambia
+la longitud del texto ("İ") y el heap acotado de summarize_pages
+(no necesita el servidor ni la base de datos)
+"""
+import random
+import re
+
+import text_matcher
+
+CASES = 2000
+# Letras repetidas para provocar solapes ("aba" / "bab"), ñ/Ñ e İ (lower() cambia la longitud)
+ALPHABET = "aabbcñÑAB İ\n"
+KEY_ALPHABET = "abcñ"
+
+
+def reference_search_in_pages(pages_text, keywords):
+    """Búsqueda original: cada palabra clave en cada línea con re.IGNORECASE"""
+    results = []
+    for page_num, page_text in pages_text.items():
+        lines = page_text.split('\n')
+        for keyword in keywords:
+            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+            for i, line in enumerate(lines):
+                if pattern.search(line):
+                    context_start = max(0, i - 1)
+                    context_end = min(len(lines), i + 2)
+                    context = ' '.join(lines[context_start:context_end])
+                    results.append({
+                        "keyword": keyword,
+                        "page": page_num,
+                        "line_in_page": i + 1,
+                        "context": context.strip()[:300]
+                    })
+    return results
+
+
+def random_case(rng):
+    keywords = ["".join(rng.choice(KEY_ALPHABET) for _ in range(rng.randint(1, 3)))
+                for _ in range(rng.randint(1, 4))]
+    pages = {page: "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+             for page in rng.sample(range(1, 30), rng.randint(1, 6))}
+    return keywords, pages
+
+
+def without_offsets(results):
+    return [{key: value for key, value in result.items() if key not in ("start", "end")} for result in results]
+
+
+def test_search_pages_matches_reference():
+    rng = random.Random(9)
+    for _ in range(CASES):
+        keywords, pages = random_case(rng)
+        results = text_matcher.KeywordMatcher(keywords).search_pages(pages)
+        assert without_offsets(results) == reference_search_in_pages(pages, keywords), (keywords, pages)
+
+
+def test_offsets_point_at_the_first_match_in_the_line():
+    rng = random.Random(10)
+    for _ in range(CASES):
+        keywords, pages = random_case(rng)
+        for result in text_matcher.KeywordMatcher(keywords).search_pages(pages):
+            text = pages[result["page"]]
+            line_start = sum(len(line) + 1 for line in text.split("\n")[:result["line_in_page"] - 1])
+            line = text.split("\n")[result["line_in_page"] - 1]
+            first = re.search(re.escape(result["keyword"]), line, re.IGNORECASE).start()
+            assert result["start"] == line_start + first, (keywords, pages, result)
+            assert text[result["start"]:result["end"]].lower() == result["keyword"].lower()
+
+
+def test_overlapping_keys():
+    pages = {1: "configuración de la figura\nFIGURA"}
+    keywords = ["config", "figura", "fig"]
+    results = text_matcher.KeywordMatcher(keywords).search_pages(pages)
+    assert without_offsets(results) == reference_search_in_pages(pages, keywords)
+    assert [(r["keyword"], r["line_in_page"]) for r in results] == \
+        [("config", 1), ("figura", 1), ("figura", 2), ("fig", 1), ("fig", 2)]
+
+
+def test_case_folding_fallback():
+    # "İ".lower() tiene dos caracteres: los offsets se calculan sobre el texto original
+    pages = {1: "İstanbul AÑO\naño İİ robot", 2: "ROBOT"}
+    keywords = ["año", "robot"]
+    results = text_matcher.KeywordMatcher(keywords).search_pages(pages)
+    assert without_offsets(results) == reference_search_in_pages(pages, keywords)
+    for result in results:
+        assert pages[result["page"]][result["start"]:result["end"]].lower() == result["keyword"]
+
+
+def test_summarize_pages_keeps_the_best_pages():
+    rng = random.Random(11)
+    for _ in range(CASES):
+        keywords, pages = random_case(rng)
+        detail_pages = rng.randint(0, 4)
+        page_scores = rng.choice([None, {page: rng.choice([0.0, 0.5, 1.0, 2.0]) for page in pages}])
+        matcher = text_matcher.KeywordMatcher(keywords)
+
+        summary = matcher.summarize_pages(pages, detail_pages, page_scores=page_scores)
+        expected = text_matcher.summarize_results(matcher.search_pages(pages), detail_pages,
+                                                  page_scores=page_scores)
+        assert summary == expected, (keywords, pages, detail_pages, page_scores)
+        assert summary["matches"] == len(reference_search_in_pages(pages, keywords))
+        assert len(summary["locations"]) == min(detail_pages, len(summary["pages_found"]))
+
+
+def test_summarize_pages_without_detail():
+    pages = {1: "robot", 2: "robot robot\nrobot"}
+    summary = text_matcher.KeywordMatcher(["robot"]).summarize_pages(pages, wants_detail=lambda matches: False)
+    assert summary == {"matches": 3, "pages_found": [1, 2], "locations": []}
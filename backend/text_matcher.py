@@ -0,0 +1,241 @@
+"""
+Búsqueda de varias palabras clave en una sola pasada
+Todas las palabras clave se combinan en una única expresión regular
+(alternancia dentro de un lookahead, de la más larga a la más corta), que
+recorre el texto de cada página una sola vez en lugar de una vez por
+palabra clave y por línea. La regex se aplica sobre el texto en
+minúsculas, sin re.IGNORECASE, que es bastante más lento. Cada coincidencia se traduce a (palabra, línea,
+offsets) buscando la línea por bisección sobre los inicios de línea de la
+página (line_index.PageText), y cada contexto es un slice de la página.
+"""
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import re
+
+from line_index import PageText, as_page
+
+# Longitud máxima del contexto en resultados por página
+CONTEXT_MAX_CHARS = 300
+# Longitud de la vista previa de cada ubicación en búsquedas múltiples
+PREVIEW_CHARS = 150
+
+# (índice de línea, inicio en la página, fin en la página)
+Hit = Tuple[int, int, int]
+
+
+class KeywordMatcher:
+    """Buscador de un conjunto fijo de palabras clave (sin distinguir mayúsculas)"""
+
+    def __init__(self, keywords: List[str]):
+        self.keywords = list(keywords)
+
+        # Claves únicas en minúsculas; las vacías no se buscan
+        unique = list(dict.fromkeys(keyword.lower() for keyword in self.keywords if keyword))
+        self._unique = unique
+
+        # Cada coincidencia reporta solo la alternativa más larga; las claves
+        # contenidas en ella se recuperan con este cierre.
+        self._contained = {key: [other for other in unique if other in key] for key in unique}
+
+        # Sin solapes parciales entre claves basta con coincidencias consecutivas
+        # (mucho más rápido); si no, el lookahead prueba en cada posición.
+        alternation = "|".join(re.escape(key) for key in sorted(unique, key=len, reverse=True))
+        regex = f"(?=({alternation}))" if _has_partial_overlap(unique) else f"({alternation})"
+        self._pattern = re.compile(regex) if unique else None
+        # Para textos cuyo lower() cambia de longitud (offsets no alineados)
+        self._pattern_ignorecase = re.compile(regex, re.IGNORECASE) if unique else None
+
+    def scan(self, text: str) -> Dict[str, List[Hit]]:
+        """Primera aparición de cada clave en cada línea, en orden de línea
+
+        Returns:
+            {clave en minúsculas: [(línea desde 0, inicio, fin), ...]}
+        """
+        return self._scan(text)[0]
+
+    def _scan(self, text: str) -> Tuple[Dict[str, List[Hit]], Optional[PageText]]:
+        """scan() y, si hubo coincidencias, el texto como PageText (para los contextos)"""
+        hits: Dict[str, Dict[int, Tuple[int, int]]] = {}
+        if self._pattern is None or not text:
+            return {}, None
+
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            matches = self._pattern.finditer(lowered)
+        else:
+            matches = self._pattern_ignorecase.finditer(text)
+
+        page = None
+        for match in matches:
+            start = match.start()
+            found_lower = match.group(1).lower()
+            contained = self._contained.get(found_lower)
+            if contained is None:
+                # Plegado de mayúsculas que no coincide con lower(): comprobar una a una
+                contained = [key for key in self._unique if key in found_lower]
+
+            if page is None:
+                page = as_page(text)
+            line = page.line_of(start)
+
+            for key in contained:
+                key_start = start + found_lower.find(key)
+                lines = hits.setdefault(key, {})
+                previous = lines.get(line)
+                if previous is None or key_start < previous[0]:
+                    lines[line] = (key_start, key_start + len(key))
+
+        return {
+            key: [(line, span[0], span[1]) for line, span in sorted(lines.items())]
+            for key, lines in hits.items()
+        }, page
+
+    def search_text(self, text: str) -> List[Dict]:
+        """Resultados por palabra clave y línea (mismo formato que search_in_text)"""
+        hits, page = self._scan(text)
+        if not hits:
+            return []
+
+        results = []
+        for keyword in self.keywords:
+            for line, start, end in hits.get(keyword.lower(), []):
+                results.append({
+                    "keyword": keyword,
+                    "line_number": line + 1,
+                    "context": page.context(line),
+                    "start": start,
+                    "end": end
+                })
+        return results
+
+    def search_pages(self, pages_text: Dict[int, str]) -> List[Dict]:
+        """Resultados por página, palabra clave y línea (mismo formato que search_in_pages)"""
+        results = []
+        for page_num, page_text in pages_text.items():
+            hits, page = self._scan(page_text)
+            if not hits:
+                continue
+
+            for keyword in self.keywords:
+                for line, start, end in hits.get(keyword.lower(), []):
+                    results.append({
+                        "keyword": keyword,
+                        "page": page_num,
+                        "line_in_page": line + 1,
+                        "context": page.context(line, CONTEXT_MAX_CHARS),
+                        "start": start,
+                        "end": end
+                    })
+        return results
+
+    def summarize_pages(self, pages_text: Dict[int, str], detail_pages: int = 3,
+                        wants_detail: Optional[Callable[[int], bool]] = None,
+                        page_scores: Optional[Dict[int, float]] = None) -> Dict:
+        """Conteo exacto de coincidencias con detalle solo de las mejores páginas
+
+        Equivale a agrupar search_pages por página, pero los contextos solo se
+        construyen para las `detail_pages` páginas con mayor puntaje (o de
+        menor número, sin puntajes) usando un heap acotado, y ninguno si
+        wants_detail(total) es False.
+
+        Returns:
+            {"matches", "pages_found" (por relevancia),
+             "locations": [{"page", "keywords", "preview"[, "score"]}]}
+        """
+        matches = 0
+        pages_found = []
+        # Heap de mínimos por (puntaje, -página): (clave, palabras clave, página, línea)
+        best_pages: List[Tuple[Tuple[float, int], List[str], PageText, int]] = []
+
+        for page_num, page_text in pages_text.items():
+            hits, page = self._scan(page_text)
+            if not hits:
+                continue
+
+            page_keywords = []
+            first_line = None
+            for keyword in self.keywords:
+                for line, _, _ in hits.get(keyword.lower(), []):
+                    page_keywords.append(keyword)
+                    if first_line is None:
+                        first_line = line
+            if not page_keywords:
+                continue
+
+            matches += len(page_keywords)
+            pages_found.append(page_num)
+            entry = (_page_key(page_num, page_scores), page_keywords, page, first_line)
+            if len(best_pages) < detail_pages:
+                heapq.heappush(best_pages, entry)
+            elif detail_pages and entry[0] > best_pages[0][0]:
+                heapq.heapreplace(best_pages, entry)
+
+        locations = []
+        if matches and (wants_detail is None or wants_detail(matches)):
+            for (_, neg_page), page_keywords, page, first_line in sorted(best_pages, reverse=True):
+                context = page.context(first_line, CONTEXT_MAX_CHARS)
+                locations.append(_location(-neg_page, page_keywords, context, page_scores))
+
+        return {"matches": matches, "pages_found": _by_relevance(pages_found, page_scores),
+                "locations": locations}
+
+
+def summarize_results(results: List[Dict], detail_pages: int = 3,
+                      wants_detail: Optional[Callable[[int], bool]] = None,
+                      page_scores: Optional[Dict[int, float]] = None) -> Dict:
+    """Mismo resumen que KeywordMatcher.summarize_pages a partir de resultados ya construidos"""
+    by_page: Dict[int, List[Dict]] = {}
+    for result in results:
+        by_page.setdefault(result["page"], []).append(result)
+
+    locations = []
+    if results and (wants_detail is None or wants_detail(len(results))):
+        best = heapq.nlargest(detail_pages, by_page, key=lambda page: _page_key(page, page_scores))
+        for page in best:
+            page_results = by_page[page]
+            locations.append(_location(page, [r["keyword"] for r in page_results],
+                                       page_results[0]["context"], page_scores))
+
+    return {"matches": len(results), "pages_found": _by_relevance(list(by_page), page_scores),
+            "locations": locations}
+
+
+def _page_key(page: int, page_scores: Optional[Dict[int, float]]) -> Tuple[float, int]:
+    """Orden de relevancia de una página: mayor puntaje y, en empate, menor número"""
+    return ((page_scores or {}).get(page, 0.0), -page)
+
+
+def _by_relevance(pages: List[int], page_scores: Optional[Dict[int, float]]) -> List[int]:
+    if page_scores is None:
+        return pages
+    return sorted(pages, key=lambda page: _page_key(page, page_scores), reverse=True)
+
+
+def _location(page: int, keywords: List[str], context: str,
+              page_scores: Optional[Dict[int, float]]) -> Dict:
+    location = {"page": page, "keywords": keywords, "preview": context[:PREVIEW_CHARS] + "..."}
+    if page_scores is not None:
+        location["score"] = round(page_scores.get(page, 0.0), 4)
+    return location
+
+
+def _has_partial_overlap(keys: List[str]) -> bool:
+    """Alguna clave empieza dentro de otra y termina después ("config" / "figura")"""
+    for key in keys:
+        for other in keys:
+            if other in key:
+                continue
+            if any(key.endswith(other[:size]) for size in range(1, min(len(key), len(other)))):
+                return True
+    return False
+
+
+@lru_cache(maxsize=256)
+def _cached_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(list(keywords))
+
+
+def get_matcher(keywords: List[str]) -> KeywordMatcher:
+    """Matcher compilado para una lista de palabras clave (reutilizado entre consultas)"""
+    return _cached_matcher(tuple(keywords))
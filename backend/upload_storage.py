@@ -0,0 +1,70 @@
+"""
+Guardado de archivos subidos por bloques
+El archivo se escribe a un temporal en el mismo directorio mientras se
+valida el tamaño y se calcula su SHA-256; al terminar se renombra de forma
+atómica al nombre final. La memoria por upload es de un solo bloque.
+Si el nombre ya existe y se pide keep_existing, el temporal se conserva
+(staging) y el archivo anterior sigue en su lugar hasta que la ingesta
+del nuevo contenido termine.
+"""
+from fastapi import UploadFile
+from pathlib import Path
+from typing import Tuple
+import tempfile
+import hashlib
+import os
+
+# Tamaño de bloque de lectura (KB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "1024")) * 1024
+
+
+class FileTooLargeError(Exception):
+    """El archivo supera el tamaño máximo permitido"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"El archivo supera el tamaño máximo de {max_size} bytes")
+
+
+async def save_upload_streaming(upload: UploadFile, dest_dir: Path, filename: str,
+                                max_size: int, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                                keep_existing: bool = False) -> Tuple[Path, int, str]:
+    """Guardar un upload por bloques en dest_dir/filename
+
+    keep_existing: si dest_dir/filename ya existe no se reemplaza; el upload
+    queda en el temporal y se retorna su ruta.
+
+    Returns:
+        (ruta final o del temporal, tamaño en bytes, SHA-256 hexadecimal)
+
+    Raises:
+        FileTooLargeError: si se supera max_size (no queda ningún archivo)
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    tmp_path = Path(tmp_name)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                out.write(chunk)
+
+        final_path = dest_dir / filename
+        if keep_existing and final_path.exists():
+            final_path = tmp_path
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+    return final_path, size, digest.hexdigest()